@@ -0,0 +1,187 @@
+import os
+import time
+import asyncio
+import logging
+from array import array
+from collections import Counter
+from typing import Any, Awaitable, Callable, Iterable
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import TelegramObject, Update
+
+from metrics import Registry
+
+# Har bir foydalanuvchi uchun alohida byudjet: (tezlik - so'rov/s, bir martalik zaxira)
+FLOOD_MESSAGE_RATE = float(os.getenv("FLOOD_MESSAGE_RATE", 1))
+FLOOD_MESSAGE_BURST = float(os.getenv("FLOOD_MESSAGE_BURST", 20))
+FLOOD_CALLBACK_RATE = float(os.getenv("FLOOD_CALLBACK_RATE", 2))
+FLOOD_CALLBACK_BURST = float(os.getenv("FLOOD_CALLBACK_BURST", 20))
+# Chek rasmlari: daqiqada bitta, ketma-ket 3 tagacha
+FLOOD_RECEIPT_RATE = float(os.getenv("FLOOD_RECEIPT_RATE", 1 / 60))
+FLOOD_RECEIPT_BURST = float(os.getenv("FLOOD_RECEIPT_BURST", 3))
+# Byudjetdan shuncha soniyagacha oshgan update kutib turadi, undan ko'pi tashlanadi
+FLOOD_MAX_DELAY = float(os.getenv("FLOOD_MAX_DELAY", 1))
+# Ogohlantirish bitta foydalanuvchiga shuncha soniyada bir marta
+FLOOD_WARN_INTERVAL = float(os.getenv("FLOOD_WARN_INTERVAL", 30))
+# Xotirada saqlanadigan foydalanuvchilar soni (~210 bayt/foydalanuvchi)
+FLOOD_MAX_USERS = int(os.getenv("FLOOD_MAX_USERS", 200_000))
+
+FLOOD_WARNING = "⏳ Juda ko'p so'rov yubordingiz. Biroz kutib, qayta urinib ko'ring."
+# Bo'sh o'rin qidirishda ko'riladigan o'rinlar soni
+_EVICT_SCAN = 64
+
+
+# Foydalanuvchi bo'yicha token bucket'lar (GCRA): har bir bucket bitta float - keyingi
+# so'rovning "nazariy vaqti". Holat array('d') da ketma-ket, user_id -> o'rin lug'ati orqali.
+# To'lganda CLOCK bo'yicha o'rin bo'shatiladi: avval bucket'lari to'liq tiklangan (ya'ni
+# hech narsani unutmaydigan) foydalanuvchi, topilmasa - soat strelkasi turgan o'rin.
+class FloodLimiter:
+    def __init__(self, limits: dict[str, tuple[float, float]], max_users: int = FLOOD_MAX_USERS,
+                 warn_interval: float = FLOOD_WARN_INTERVAL):
+        self.kinds = {kind: i for i, kind in enumerate(limits)}
+        self._interval = [1 / rate for rate, _ in limits.values()]
+        self._tolerance = [(burst - 1) / rate for rate, burst in limits.values()]
+        # Oxirgi ustun - ogohlantirish qachongacha yuborilmasligi
+        self._width = len(limits) + 1
+        self._zeros = array("d", bytes(8 * self._width))
+        self.max_users = max_users
+        self.warn_interval = warn_interval
+        self._slots: dict[int, int] = {}
+        self._owners = array("q")
+        self._state = array("d")
+        self._hand = 0
+        # Bucket'i hali tiklanmagan holda chiqarib yuborilganlar (max_users kichik)
+        self.evicted_active = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def memory_bytes(self) -> int:
+        # Lug'at jadvali + kalit/qiymat int obyektlari (~60 bayt) + massivlar
+        return (self._slots.__sizeof__() + len(self._slots) * 60
+                + len(self._owners) * self._owners.itemsize + len(self._state) * self._state.itemsize)
+
+    def _slot(self, user_id: int, now: float) -> int:
+        slot = self._slots.get(user_id)
+        if slot is not None:
+            return slot
+        if len(self._owners) < self.max_users:
+            slot = len(self._owners)
+            self._owners.append(user_id)
+            self._state.extend(self._zeros)
+        else:
+            slot = self._victim(now)
+            del self._slots[self._owners[slot]]
+            self._owners[slot] = user_id
+            base = slot * self._width
+            self._state[base:base + self._width] = self._zeros
+        self._slots[user_id] = slot
+        return slot
+
+    def _victim(self, now: float) -> int:
+        width, state, size = self._width, self._state, len(self._owners)
+        for _ in range(min(_EVICT_SCAN, size)):
+            slot = self._hand
+            self._hand = (slot + 1) % size
+            base = slot * width
+            if max(state[base:base + width]) <= now:
+                return slot
+        self.evicted_active += 1
+        return slot
+
+    def acquire(self, user_id: int, kind: str, max_delay: float = 0.0,
+                now: float | None = None) -> float | None:
+        # Qaytaradi: None - byudjet tugagan, aks holda shuncha soniya kutib ishlash mumkin
+        now = time.monotonic() if now is None else now
+        k = self.kinds[kind]
+        i = self._slot(user_id, now) * self._width + k
+        tat = max(self._state[i], now)
+        wait = tat - self._tolerance[k] - now
+        if wait > max_delay:
+            return None
+        self._state[i] = tat + self._interval[k]
+        return wait if wait > 0 else 0.0
+
+    def should_warn(self, user_id: int, now: float | None = None) -> bool:
+        now = time.monotonic() if now is None else now
+        i = self._slot(user_id, now) * self._width + self._width - 1
+        if self._state[i] > now:
+            return False
+        self._state[i] = now + self.warn_interval
+        return True
+
+
+def default_limiter() -> FloodLimiter:
+    return FloodLimiter({
+        "message": (FLOOD_MESSAGE_RATE, FLOOD_MESSAGE_BURST),
+        "callback": (FLOOD_CALLBACK_RATE, FLOOD_CALLBACK_BURST),
+        "receipt": (FLOOD_RECEIPT_RATE, FLOOD_RECEIPT_BURST),
+    })
+
+
+# Byudjetdan oshgan update handler'lar va DB gacha yetmaydi. FSM holati (cheklar uchun kerak)
+# aiogram'ning FSM middleware'ida o'qiladi - u PgStorage keshidan, shuning uchun flood DB ga tushmaydi.
+class AntiFloodMiddleware(BaseMiddleware):
+    def __init__(self, limiter: FloodLimiter | None = None, receipt_states: Iterable[str] = (),
+                 exempt: Callable[[int], bool] | None = None, max_delay: float = FLOOD_MAX_DELAY):
+        self.limiter = limiter or default_limiter()
+        self.receipt_states = frozenset(receipt_states)
+        self.exempt = exempt
+        self.max_delay = max_delay
+        self.dropped = Counter()
+        self.delayed = Counter()
+
+    def kind(self, update: Update, raw_state: str | None) -> str | None:
+        if update.callback_query is not None:
+            return "callback"
+        message = update.message or update.edited_message
+        if message is None:
+            return None
+        if message.photo and raw_state in self.receipt_states:
+            return "receipt"
+        return "message"
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or (self.exempt is not None and self.exempt(user.id)):
+            return await handler(event, data)
+        kind = self.kind(event, data.get("raw_state"))
+        if kind is None:
+            return await handler(event, data)
+
+        wait = self.limiter.acquire(user.id, kind, self.max_delay)
+        if wait is None:
+            self.dropped[kind] += 1
+            if self.limiter.should_warn(user.id):
+                await self._warn(event, data)
+            return UNHANDLED
+        if wait:
+            self.delayed[kind] += 1
+            await asyncio.sleep(wait)
+        return await handler(event, data)
+
+    async def _warn(self, update: Update, data: dict[str, Any]):
+        bot = data["bot"]
+        try:
+            if update.callback_query is not None:
+                await bot.answer_callback_query(update.callback_query.id, FLOOD_WARNING)
+            else:
+                message = update.message or update.edited_message
+                await bot.send_message(message.chat.id, FLOOD_WARNING)
+        except Exception as e:
+            logging.warning(f"Flood ogohlantirishi yuborilmadi: {e}")
+
+    def register_metrics(self, metrics: Registry):
+        metrics.gauge("bot_flood_dropped_total", "Flood sababli tashlangan update'lar",
+                      lambda: dict(self.dropped), "kind", kind="counter")
+        metrics.gauge("bot_flood_delayed_total", "Flood sababli kechiktirilgan update'lar",
+                      lambda: dict(self.delayed), "kind", kind="counter")
+        metrics.gauge("bot_flood_users", "Flood limiteridagi foydalanuvchilar", lambda: len(self.limiter))
+        metrics.gauge("bot_flood_evicted_active", "Bucket'i tiklanmasdan chiqarilganlar",
+                      lambda: self.limiter.evicted_active)
@@ -0,0 +1,119 @@
+"""Near-duplicate index benchmark: detection quality on synthetic resubmissions,
+then memory and lookup latency with a million indexed ads.
+
+    python -m benchmarks.dedup                   # 1M ads in the index
+    python -m benchmarks.dedup --size 100000
+"""
+import sys
+import time
+import random
+import argparse
+
+from dedup import SKETCH_SIZE, SimilarityIndex, signature
+from utils import EMPLOYER_ROLE
+
+WORKER_ROLE = "👷‍♂️ Ish qidiryapman"
+REGIONS = ["Toshkent", "Samarqand", "Buxoro", "Andijon", "Namangan", "Farg'ona", "Xorazm", "Navoiy"]
+WORDS = ("sotuvchi oshpaz haydovchi qorovul farrosh hisobchi dasturchi payvandchi tikuvchi "
+         "ofitsiant kassir omborchi usta elektrik santexnik enaga tarbiyachi muhandis").split()
+TRAITS = ("tajribali mas'uliyatli tez o'rganadi xushmuomala halol intizomli kompyuterni biladi "
+          "rus tilini biladi haydovchilik guvohnomasi bor").split()
+
+
+def random_ad(rng: random.Random) -> dict:
+    role = rng.choice((WORKER_ROLE, EMPLOYER_ROLE))
+    data = {
+        "role": role,
+        "hudud": rng.choice(REGIONS),
+        "jinsi": rng.choice(("Erkak", "Ayol")),
+        "yoshi": str(rng.randint(18, 55)),
+        "mahorat": " ".join(rng.sample(WORDS, 2)),
+        "vaqt": f"{rng.randint(7, 10):02d}:00-{rng.randint(16, 20):02d}:00",
+        "qosimcha": " ".join(rng.sample(TRAITS, 4)),
+        "maosh": f"{rng.randint(2, 15)} mln",
+        "tel": f"+99890{rng.randint(1000000, 9999999)}",
+    }
+    if role == WORKER_ROLE:
+        data["fish"] = f"{rng.choice(('Ali', 'Vali', 'Dilnoza', 'Madina', 'Sardor'))} {rng.choice(WORDS).title()}ov"
+    return data
+
+
+def resubmit(data: dict, rng: random.Random) -> dict:
+    # Odatiy qayta yuborish: katta-kichik harf, tinish belgilar, bitta maydon biroz o'zgargan
+    copy = dict(data)
+    copy["qosimcha"] = copy["qosimcha"].upper() + "!!"
+    copy["tel"] = copy["tel"][:4] + " " + copy["tel"][4:6] + "-" + copy["tel"][6:]
+    field = rng.choice(("maosh", "yoshi", "vaqt"))
+    copy[field] = copy[field] + " kelishiladi"
+    return copy
+
+
+def quality(args) -> dict:
+    rng = random.Random(1)
+    index = SimilarityIndex()
+    originals = [random_ad(rng) for _ in range(args.quality_ads)]
+    start = time.perf_counter()
+    for i, data in enumerate(originals):
+        index.add(f"E-{i:05d}", signature(data))
+    sig_ms = (time.perf_counter() - start) / len(originals) * 1000
+
+    probes = rng.sample(range(len(originals)), args.probes)
+    found = sum(f"E-{i:05d}" in [c for c, _ in index.query(signature(resubmit(originals[i], rng)))]
+                for i in probes)
+    flagged = sum(bool(index.query(signature(random_ad(rng)))) for _ in range(args.probes))
+    return {
+        "signature_ms": sig_ms,
+        "resubmit_recall": found / len(probes),
+        "unrelated_flagged": flagged / args.probes,
+    }
+
+
+def scale(args) -> dict:
+    rng = random.Random(2)
+    sketches = [rng.randbytes(SKETCH_SIZE) for _ in range(args.size)]
+    index = SimilarityIndex()
+    start = time.perf_counter()
+    for i, sketch in enumerate(sketches):
+        index.add(f"E-{i:05d}", sketch)
+    build = time.perf_counter() - start
+    del sketches
+    memory = index.memory_bytes()
+
+    start = time.perf_counter()
+    for i in range(1000):
+        index.add(f"E-{args.size + i:05d}", rng.randbytes(SKETCH_SIZE))
+    add_us = (time.perf_counter() - start) / 1000 * 1e6
+    queries = [rng.randbytes(SKETCH_SIZE) for _ in range(args.probes)]
+    latencies = []
+    for sketch in queries:
+        t = time.perf_counter()
+        index.query(sketch)
+        latencies.append(time.perf_counter() - t)
+    latencies.sort()
+    return {
+        "indexed": len(index),
+        "build_s": build,
+        "mib": memory / 2 ** 20,
+        "bytes_per_ad": memory / args.size,
+        "add_us": add_us,
+        "query_p50_us": latencies[len(latencies) // 2] * 1e6,
+        "query_p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--quality-ads", type=int, default=5000)
+    parser.add_argument("--probes", type=int, default=1000)
+    args = parser.parse_args()
+
+    for name, result in (("quality", quality(args)), ("scale", scale(args))):
+        print(name)
+        for key, value in result.items():
+            print(f"  {key:<20} {value:.3f}" if isinstance(value, float) else f"  {key:<20} {value}")
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""Local stand-in for the Telegram Bot API (aiohttp) for end-to-end load tests.
+
+Serves getUpdates (long polling from an in-process update queue), the send/edit
+methods the bot uses, getChat and exportChatInviteLink, with lognormal latency
+and Telegram-like flood limits: 30 msg/s overall, ~1 msg/s per private chat,
+20 msg/min per group/channel; over the limit a 429 with retry_after is returned.
+
+    python -m benchmarks.fake_api --port 8081
+    TELEGRAM_API_URL=http://127.0.0.1:8081 python main.py
+"""
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import itertools
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Bot", "username": "fake_bot"}
+# Flood limitlari hisoblanadigan (chatga xabar chiqaradigan) metodlar
+SEND_METHODS = {
+    "sendMessage", "sendPhoto", "sendVideo", "sendDocument", "copyMessage",
+    "editMessageText", "editMessageCaption", "editMessageReplyMarkup",
+}
+GET_UPDATES_LIMIT = 100
+
+
+# Token bucket: rate so'rov/s, burst - bir martalik zaxira
+class _Bucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate, self.burst = rate, burst
+        self.tokens, self.updated = burst, time.monotonic()
+
+    def wait(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.04, latency_sigma: float = 0.5, global_rate: float = 30,
+                 chat_rate: float = 1, chat_burst: float = 3, group_rate: float = 20 / 60,
+                 group_burst: float = 3):
+        # Median kechikish va lognormal tarqalish (og'ir "dum")
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.chat_limits = (chat_rate, chat_burst)
+        self.group_limits = (group_rate, group_burst)
+        self._global = _Bucket(global_rate, global_rate)
+        self._chats: dict[int, _Bucket] = {}
+
+        self.calls = Counter()
+        self.flood = Counter()
+        # chat_id -> botdan kelgan xabarlar (method, text, reply_markup, message_id, at)
+        self.sent: dict[int, list[dict]] = defaultdict(list)
+        self._waiters: dict[int, list[asyncio.Future]] = defaultdict(list)
+        # callback_query_id -> user_id (answerCallbackQuery foydalanuvchi chatiga yoziladi)
+        self._callbacks: dict[str, int] = {}
+        self._updates: list[dict] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1_000_000)
+        self._new_updates = asyncio.Event()
+        # Bot birinchi marta getUpdates chaqirganda belgilanadi
+        self.polling = asyncio.Event()
+        self._runner = None
+
+    # --- DRIVER TOMONI ---
+    def push(self, update: dict):
+        update["update_id"] = next(self._update_ids)
+        callback = update.get("callback_query")
+        if callback is not None:
+            self._callbacks[callback["id"]] = callback["from"]["id"]
+        self._updates.append(update)
+        self._new_updates.set()
+
+    async def wait_message(self, chat_id: int, after: int, predicate=None, timeout: float = 30) -> dict | None:
+        # sent[chat_id][after:] ichidan predicate ga mos birinchi xabar; timeout bo'lsa None
+        deadline = time.monotonic() + timeout
+        messages = self.sent[chat_id]
+        while True:
+            for message in messages[after:]:
+                if predicate is None or predicate(message):
+                    return message
+            after = len(messages)
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return None
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters[chat_id].append(waiter)
+            try:
+                await asyncio.wait_for(waiter, left)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if waiter in self._waiters[chat_id]:
+                    self._waiters[chat_id].remove(waiter)
+
+    def _record(self, chat_id: int, message: dict):
+        self.sent[chat_id].append(message)
+        for waiter in self._waiters.pop(chat_id, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+
+    # --- FLOOD LIMITLARI ---
+    def _retry_after(self, chat_id: int) -> int:
+        now = time.monotonic()
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            limits = self.chat_limits if chat_id > 0 else self.group_limits
+            bucket = self._chats[chat_id] = _Bucket(*limits)
+        wait = max(bucket.wait(now), self._global.wait(now))
+        if wait:
+            return max(1, math.ceil(wait))
+        bucket.tokens -= 1
+        self._global.tokens -= 1
+        return 0
+
+    # --- METODLAR ---
+    def _message(self, chat_id: int, params: dict) -> dict:
+        message = {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "channel"},
+            "from": BOT_USER,
+        }
+        if "caption" in params:
+            message["caption"] = params["caption"]
+        elif "text" in params:
+            message["text"] = params["text"]
+        for name in ("photo", "video"):
+            if name in params:
+                # Yuklangan fayl uchun yangi file_id
+                file_id = params[name]
+                if file_id.startswith("attach://"):
+                    file_id = f"FAKE-{name}-{message['message_id']}"
+                if name == "photo":
+                    message["photo"] = [{"file_id": file_id, "file_unique_id": file_id,
+                                         "width": 90, "height": 90}]
+                else:
+                    message["video"] = {"file_id": file_id, "file_unique_id": file_id, "width": 90,
+                                        "height": 90, "duration": 1}
+        if "reply_markup" in params:
+            markup = json.loads(params["reply_markup"])
+            if "inline_keyboard" in markup:
+                message["reply_markup"] = markup
+        return message
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return BOT_USER
+        if method == "getChat":
+            chat_id = _int(params["chat_id"])
+            return {
+                "id": chat_id, "type": "channel", "title": f"Kanal {chat_id}",
+                "username": f"kanal{abs(chat_id)}", "accent_color_id": 0, "max_reaction_count": 0,
+                "accepted_gift_types": {
+                    "unlimited_gifts": False, "limited_gifts": False, "unique_gifts": False,
+                    "premium_subscription": False, "gifts_from_channels": False,
+                },
+            }
+        if method == "exportChatInviteLink":
+            return f"https://t.me/+fake{abs(_int(params['chat_id']))}"
+        if method == "answerCallbackQuery":
+            user_id = self._callbacks.pop(params["callback_query_id"], None)
+            if user_id is not None:
+                self._record(user_id, {"method": method, "text": params.get("text", ""),
+                                       "at": time.perf_counter()})
+            return True
+        if method in SEND_METHODS:
+            chat_id = _int(params["chat_id"])
+            message = self._message(chat_id, params)
+            self._record(chat_id, {"method": method, "text": message.get("text") or message.get("caption", ""),
+                                   "reply_markup": message.get("reply_markup"),
+                                   "message_id": message["message_id"], "at": time.perf_counter()})
+            if method == "copyMessage":
+                return {"message_id": message["message_id"]}
+            return message
+        # deleteWebhook, deleteMessage, setMyCommands va h.k.
+        return True
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        self.polling.set()
+        offset = int(params.get("offset") or 0)
+        if offset:
+            # offset dan oldingilar tasdiqlangan - o'chiriladi
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:int(params.get("limit") or GET_UPDATES_LIMIT)]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = {key: value for key, value in (await request.post()).items() if isinstance(value, str)}
+        self.calls[method] += 1
+        await asyncio.sleep(random.lognormvariate(math.log(self.latency), self.latency_sigma))
+
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+        if method in SEND_METHODS:
+            retry_after = self._retry_after(_int(params.get("chat_id") or 0))
+            if retry_after:
+                self.flood[method] += 1
+                return web.json_response({
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                }, status=429)
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    # --- SERVER ---
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application(client_max_size=50 * 2 ** 20)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def _int(value) -> int:
+    # chat_id "@username" bo'lishi ham mumkin
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+async def serve(args):
+    api = FakeBotAPI(latency=args.latency, global_rate=args.global_rate, chat_rate=args.chat_rate)
+    url = await api.start(args.host, args.port)
+    print(f"TELEGRAM_API_URL={url}")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"  calls {sum(api.calls.values())}  flood_429 {sum(api.flood.values())}")
+    finally:
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.04, help="median kechikish, s")
+    parser.add_argument("--global-rate", type=float, default=30, help="umumiy xabar/s")
+    parser.add_argument("--chat-rate", type=float, default=1, help="bitta chatga xabar/s")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
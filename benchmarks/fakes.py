@@ -0,0 +1,474 @@
+import os
+import json
+import time
+import asyncio
+import itertools
+from collections import Counter
+from datetime import datetime
+
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Update
+
+# main.py import paytida shu qiymatlarni talab qiladi
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+os.environ.setdefault("ADMIN_ID", "1")
+
+MESSAGE_METHODS = {"sendMessage", "sendPhoto", "sendVideo", "editMessageCaption", "editMessageText"}
+
+
+# Telegramga chiqmaydigan, barcha chaqiruvlarni yozib boradigan sessiya
+class FakeSession(BaseSession):
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = Counter()
+        # Botni bloklagan chatlar: ularga yuborish 403 qaytaradi
+        self.blocked: set[int] = set()
+        # Kuzatilgan chatlarga oxirgi yuborilgan xabar (admin tugmalarini "bosish" uchun)
+        self.watched: set[int] = set()
+        self.last_sent: dict[int, object] = {}
+        self._message_ids = itertools.count(1)
+
+    def _result(self, api_method: str, params: dict):
+        if api_method in MESSAGE_METHODS:
+            message = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": params.get("chat_id") or 0, "type": "private"},
+                "text": params.get("text") or params.get("caption") or "",
+            }
+            if api_method == "sendPhoto":
+                photo = params["photo"]
+                # Yuklangan fayl uchun Telegram yangi file_id beradi
+                file_id = photo if isinstance(photo, str) else f"UPLOADED-{message['message_id']}"
+                message["photo"] = [{"file_id": file_id, "file_unique_id": file_id,
+                                     "width": 90, "height": 90}]
+            return message
+        if api_method == "getChat":
+            return {
+                "id": params["chat_id"], "type": "channel", "title": "Kanal",
+                "username": "elon_kanal", "accent_color_id": 0, "max_reaction_count": 0,
+                "accepted_gift_types": {
+                    "unlimited_gifts": False, "limited_gifts": False, "unique_gifts": False,
+                    "premium_subscription": False, "gifts_from_channels": False,
+                },
+            }
+        if api_method == "exportChatInviteLink":
+            return "https://t.me/+fake"
+        if api_method == "copyMessage":
+            return {"message_id": next(self._message_ids)}
+        return True
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[method.__api_method__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = method.model_dump(exclude_none=True)
+        if params.get("chat_id") in self.watched:
+            self.last_sent[params["chat_id"]] = method
+        if params.get("chat_id") in self.blocked:
+            status_code = 403
+            content = json.dumps({"ok": False, "error_code": 403,
+                                  "description": "Forbidden: bot was blocked by the user"})
+        else:
+            status_code = 200
+            content = json.dumps({"ok": True, "result": self._result(method.__api_method__, params)},
+                                 default=str)
+        response = self.check_response(bot=bot, method=method, status_code=status_code, content=content)
+        return response.result
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536,
+                             raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+# Database o'rniga ishlatiladigan xotiradagi ombor; har bir chaqiruv sanaladi
+class MemoryDatabase:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.round_trips = Counter()
+        self.admins: set[int] = set()
+        self.channels: dict[str, int] = {}
+        self.settings: dict[str, str] = {}
+        self.ads: dict[str, dict] = {}
+        self.pending: dict[str, dict] = {}
+        self.fsm: dict[str, tuple] = {}
+        self.outbox: dict[int, dict] = {}
+        self.users: dict[int, dict] = {}
+        # (hudud, jinsi, role) -> [approved, rejected, revenue]
+        self.stats: dict[tuple, list[int]] = {}
+        self.signatures: list[dict] = []
+        self.publish_errors: dict[str, str] = {}
+        self._seq = itertools.count(1)
+        self._job_ids = itertools.count(1)
+
+    async def _trip(self, name: str):
+        self.round_trips[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def add_admin(self, user_id: int):
+        await self._trip("add_admin")
+        self.admins.add(user_id)
+
+    async def remove_admin(self, user_id: int):
+        await self._trip("remove_admin")
+        self.admins.discard(user_id)
+
+    async def get_admins(self):
+        await self._trip("get_admins")
+        return list(self.admins)
+
+    async def set_channel(self, channel_type: str, channel_id: int):
+        await self._trip("set_channel")
+        self.channels[channel_type] = channel_id
+
+    async def get_channels(self):
+        await self._trip("get_channels")
+        return dict(self.channels)
+
+    async def get_channel(self, channel_type: str):
+        await self._trip("get_channel")
+        return self.channels.get(channel_type)
+
+    async def set_setting(self, key: str, value: str):
+        await self._trip("set_setting")
+        self.settings[key] = value
+
+    async def get_settings(self):
+        await self._trip("get_settings")
+        return dict(self.settings)
+
+    async def get_setting(self, key: str):
+        await self._trip("get_setting")
+        return self.settings.get(key)
+
+    async def bootstrap_config(self, admin_id: int, channels: dict[str, int], defaults: dict[str, str]):
+        await self._trip("bootstrap_config")
+        self.admins.add(admin_id)
+        for key, value in channels.items():
+            self.channels.setdefault(key, value)
+        for key, value in defaults.items():
+            self.settings.setdefault(key, value)
+        return list(self.admins), dict(self.channels), dict(self.settings)
+
+    async def listen_config(self, callback):
+        pass
+
+    async def save_ad(self, code: str, data: dict):
+        await self._trip("save_ad")
+        self.ads[code] = json.loads(json.dumps(data, ensure_ascii=False))
+
+    async def reserve_codes(self, count: int):
+        await self._trip("reserve_codes")
+        return [next(self._seq) for _ in range(count)]
+
+    async def get_signatures_after(self, last_id: int, limit: int) -> list[dict]:
+        await self._trip("get_signatures_after")
+        return self.signatures[last_id:last_id + limit]
+
+    async def get_ads_without_signature(self, after: str, limit: int) -> list[tuple[str, dict]]:
+        await self._trip("get_ads_without_signature")
+        signed = {row["code"] for row in self.signatures}
+        return sorted((c, d) for c, d in self.ads.items() if c > after and c not in signed)[:limit]
+
+    async def save_signatures(self, signatures: list[tuple[str, bytes]]):
+        await self._trip("save_signatures")
+        for code, sketch in signatures:
+            self.signatures.append({"id": len(self.signatures) + 1, "code": code, "sketch": sketch})
+
+    async def get_ad(self, code: str):
+        await self._trip("get_ad")
+        return self.ads.get(code)
+
+    def _claimable(self, elon: dict, now: float, admin_id: int | None = None) -> bool:
+        return elon["status"] == "pending" and (
+            elon["claimed_until"] < now or (admin_id is not None and elon["claimed_by"] == admin_id))
+
+    async def add_pending(self, temp_id: str, elon: dict, ttl: int = 0) -> int:
+        await self._trip("add_pending")
+        now = time.time()
+        waiting = sum(self._claimable(e, now) for e in self.pending.values())
+        self.pending[temp_id] = {"admin_text": None, "admin_photo": None, **elon, "status": "pending",
+                                 "created_at": now, "claimed_by": None, "claimed_until": 0.0}
+        return waiting
+
+    async def claim_pending(self, admin_id: int, lease: int, ttl: int = 0, skip: str | None = None):
+        await self._trip("claim_pending")
+        now = time.time()
+        if skip in self.pending and self.pending[skip]["claimed_by"] == admin_id:
+            self.pending[skip].update(claimed_by=None, claimed_until=0.0)
+        candidates = [(not (e["claimed_by"] == admin_id and e["claimed_until"] >= now), e["created_at"], t)
+                      for t, e in self.pending.items() if t != skip and self._claimable(e, now, admin_id)]
+        if not candidates:
+            return None, None, 0
+        temp_id = min(candidates)[2]
+        elon = self.pending[temp_id]
+        elon.update(claimed_by=admin_id, claimed_until=now + lease)
+        left = sum(self._claimable(e, now) for e in self.pending.values())
+        return temp_id, dict(elon), left
+
+    async def pending_queue_depth(self, ttl: int = 0):
+        await self._trip("pending_queue_depth")
+        now = time.time()
+        pending = [e for e in self.pending.values() if e["status"] == "pending"]
+        free = sum(e["claimed_until"] < now for e in pending)
+        return free, len(pending) - free
+
+    def _decidable(self, elon: dict | None, by: int | None) -> bool:
+        if not elon or elon["status"] != "pending":
+            return False
+        return by is None or elon["claimed_by"] in (None, by) or elon["claimed_until"] < time.time()
+
+    async def update_pending(self, temp_id: str, field: str, value: str) -> bool:
+        await self._trip("update_pending")
+        elon = self.pending.get(temp_id)
+        if not elon or elon["status"] != "pending":
+            return False
+        elon[field] = value
+        return True
+
+    async def get_pending(self, temp_id: str, ttl: int = 0):
+        await self._trip("get_pending")
+        elon = self.pending.get(temp_id)
+        return dict(elon) if elon and elon["status"] == "pending" else None
+
+    async def get_pending_all(self, ttl: int = 0):
+        await self._trip("get_pending_all")
+        return {t: dict(e) for t, e in self.pending.items() if e["status"] == "pending"}
+
+    async def finish_pending(self, temp_id: str, status: str, by: int | None = None):
+        await self._trip("finish_pending")
+        elon = self.pending.get(temp_id)
+        if not self._decidable(elon, by):
+            return None
+        elon["status"] = status
+        if status == "rejected":
+            self._rollup(elon["data"], 0, 1, 0)
+        return dict(elon)
+
+    def _rollup(self, data: dict, approved: int, rejected: int, revenue: int):
+        key = (data.get("hudud", ""), data.get("jinsi", ""), data.get("role", ""))
+        row = self.stats.setdefault(key, [0, 0, 0])
+        row[0] += approved
+        row[1] += rejected
+        row[2] += revenue
+
+    async def get_stats_dashboard(self):
+        await self._trip("get_stats_dashboard")
+        rows = [{"hudud": h, "jinsi": j, "role": r, "approved": a, "rejected": rj, "revenue": rv}
+                for (h, j, r), (a, rj, rv) in self.stats.items()]
+        return {period: rows for period in ("today", "week", "month", "all")}
+
+    async def approve_pending(self, temp_id: str, code: str, data: dict, jobs: list,
+                              approved_by: int | None = None, revenue: int = 0,
+                              signature: bytes | None = None) -> bool:
+        await self._trip("approve_pending")
+        elon = self.pending.get(temp_id)
+        if not self._decidable(elon, approved_by):
+            return False
+        elon["status"] = "approved"
+        self._rollup(data, 1, 0, revenue)
+        self.ads[code] = json.loads(json.dumps(data, ensure_ascii=False))
+        if signature is not None:
+            self.signatures.append({"id": len(self.signatures) + 1, "code": code, "sketch": signature})
+        for kind, _, payload in jobs:
+            job_id = next(self._job_ids)
+            self.outbox[job_id] = {"id": job_id, "kind": kind, "payload": payload, "progress": {},
+                                   "attempts": 0, "status": "pending", "run_at": 0.0}
+        return True
+
+    async def claim_jobs(self, limit: int, lease: float) -> list[dict]:
+        await self._trip("claim_jobs")
+        now = time.monotonic()
+        claimed = []
+        for job in self.outbox.values():
+            if len(claimed) >= limit:
+                break
+            if job["status"] == "pending" and job["run_at"] <= now:
+                job["attempts"] += 1
+                job["run_at"] = now + lease
+                claimed.append({k: job[k] for k in ("id", "kind", "payload", "progress", "attempts")})
+        return claimed
+
+    async def enqueue_job(self, kind: str, dedup_key: str | None, payload: dict) -> bool:
+        await self._trip("enqueue_job")
+        job_id = next(self._job_ids)
+        self.outbox[job_id] = {"id": job_id, "kind": kind, "payload": payload, "progress": {},
+                               "attempts": 0, "status": "pending", "run_at": 0.0}
+        return True
+
+    async def recent_jobs(self, kind: str, limit: int = 5) -> list[dict]:
+        await self._trip("recent_jobs")
+        jobs = [j for j in self.outbox.values() if j["kind"] == kind]
+        return jobs[-limit:][::-1]
+
+    async def save_job_progress(self, job_id: int, progress: dict):
+        await self._trip("save_job_progress")
+        self.outbox[job_id]["progress"].update(progress)
+
+    async def finish_job(self, job_id: int, status: str, error: str | None = None,
+                         delay: float = 0, refund: bool = False):
+        await self._trip("finish_job")
+        # Bajarilgan ishlar Postgresda qoladi, jarayon xotirasida emas
+        if status == "done":
+            del self.outbox[job_id]
+            return
+        job = self.outbox[job_id]
+        job.update(status=status, run_at=time.monotonic() + delay, attempts=job["attempts"] - refund)
+
+    async def purge_jobs(self, older_than: int) -> int:
+        await self._trip("purge_jobs")
+        return 0
+
+    async def set_publish_error(self, code: str, error: str | None):
+        await self._trip("set_publish_error")
+        self.publish_errors[code] = error
+
+    async def retry_publish(self, code: str) -> bool:
+        await self._trip("retry_publish")
+        for job in self.outbox.values():
+            if job["kind"] == "publish_ad" and job["payload"]["code"] == code and job["status"] == "failed":
+                job.update(status="pending", attempts=0, run_at=0.0)
+                self.publish_errors.pop(code, None)
+                return True
+        return False
+
+    async def upsert_users(self, records: list[tuple]):
+        await self._trip("upsert_users")
+        for user_id, username, first_name, role, last_seen in records:
+            user = self.users.setdefault(user_id, {"role": None})
+            user.update(username=username, first_name=first_name, last_seen=last_seen,
+                        role=role or user["role"], is_active=True)
+
+    async def count_users(self) -> int:
+        await self._trip("count_users")
+        return sum(u["is_active"] for u in self.users.values())
+
+    async def get_user_ids_after(self, cursor: int, limit: int) -> list[int]:
+        await self._trip("get_user_ids_after")
+        return sorted(uid for uid, u in self.users.items() if u["is_active"] and uid > cursor)[:limit]
+
+    async def broadcast_checkpoint(self, job_id: int, progress: dict, dead: list[int], lease: float):
+        await self._trip("broadcast_checkpoint")
+        for uid in dead:
+            self.users[uid]["is_active"] = False
+        job = self.outbox[job_id]
+        job["progress"].update(progress)
+        job["run_at"] = time.monotonic() + lease
+
+    async def expire_pending(self, ttl: int = 0) -> int:
+        await self._trip("expire_pending")
+        return 0
+
+    async def get_fsm(self, key: str):
+        await self._trip("get_fsm")
+        row = self.fsm.get(key)
+        return (row[0], json.loads(row[1])) if row else None
+
+    async def save_fsm(self, records):
+        await self._trip("save_fsm")
+        for key, state, data in records:
+            self.fsm[key] = (state, json.dumps(data, ensure_ascii=False))
+
+
+# Sintetik update'lar yasovchi
+class UpdateFactory:
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+
+    def _message(self, user_id: int, **fields) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": datetime.now(),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            **fields,
+        }
+
+    def text(self, user_id: int, text: str) -> Update:
+        return Update.model_validate({"update_id": next(self._update_ids),
+                                      "message": self._message(user_id, text=text)})
+
+    def photo(self, user_id: int, file_id: str = "CHECK_PHOTO") -> Update:
+        photo = [{"file_id": file_id, "file_unique_id": file_id, "width": 90, "height": 90}]
+        return Update.model_validate({"update_id": next(self._update_ids),
+                                      "message": self._message(user_id, photo=photo)})
+
+    def callback(self, user_id: int, data: str, caption: str = "") -> Update:
+        message = self._message(user_id, caption=caption) if caption else self._message(user_id, text="-")
+        return Update.model_validate({
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._callback_ids)),
+                "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+                "chat_instance": "1",
+                "data": data,
+                "message": message,
+            },
+        })
+
+
+WORKER_ROLE = "👷‍♂️ Ish qidiryapman"
+EMPLOYER_ROLE = "🏢 Ish beruvchiman"
+
+
+def form_updates(factory: UpdateFactory, user_id: int, role: str) -> list[Update]:
+    # /start dan chek rasmigacha bo'lgan to'liq Form oqimi
+    updates = [
+        factory.text(user_id, "/start"),
+        factory.text(user_id, role),
+        factory.text(user_id, "📝 E’lon berish"),
+        factory.text(user_id, "Toshkent"),
+        factory.callback(user_id, "gender_male"),
+    ]
+    if role == WORKER_ROLE:
+        answers = ["Ali Valiyev", "25", "Payvandchi", "Mas'uliyatli", "09:00-18:00",
+                   "Shanba", "Tajribam bor", "5 mln", "+998901234567", "➡️ Videoni o'tkazib yuborish"]
+    else:
+        answers = ["20-30 yosh", "Sotuvchi kerak", "09:00-18:00", "Chilonzor", "4 mln",
+                   "+998901234567"]
+    updates += [factory.text(user_id, a) for a in answers]
+    updates.append(factory.photo(user_id))
+    return updates
+
+
+def load_main(database: MemoryDatabase | None, session: FakeSession | None):
+    # main.py ni yuklab, tashqi resurslarni soxtalariga almashtiramiz.
+    # database=None bo'lsa main.py ning haqiqiy Postgres ulanishi ishlatiladi,
+    # session=None bo'lsa - haqiqiy aiohttp sessiyasi (TELEGRAM_API_URL) va Telegram limitlari.
+    import main
+    from fanout import FanOut
+    from storage import PgStorage
+
+    if database is not None:
+        main.db = database
+        main.pending_ads.db = database
+        main.code_allocator.reserve = database.reserve_codes
+        main.outbox.db = database
+        main.media.db = database
+        main.user_tracker.db = database
+        main.broadcaster.db = database
+        main.similar_ads.db = database
+        # Bo'sh indeks - yuklashni kutish shart emas
+        main.similar_ads.ready = True
+        main.dp.fsm.storage = PgStorage(database)
+    if session is None:
+        return main
+    main.bot.session = session
+    session.middleware(main.api_metrics)
+    session.middleware(main.api_tracing)
+    # Soxta sessiyada Telegram limitlari yo'q
+    main.fanout = main.broadcaster.fanout = FanOut(global_rate=1e9, chat_rate=1e9)
+    return main
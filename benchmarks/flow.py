@@ -0,0 +1,193 @@
+"""End-to-end benchmark of the ad submission and approval flow.
+
+Drives ``dp.feed_update`` with synthetic updates through the whole ``Form``
+flow (worker and employer branches), the receipt photo and the admin's
+approve callback, against a fake Bot session and an in-memory Database.
+
+    python -m benchmarks.flow                 # run and compare with baseline
+    python -m benchmarks.flow --save          # run and store a new baseline
+    python -m benchmarks.flow --postgres      # use DATABASE_URL instead of MemoryDatabase
+"""
+import os
+import gc
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tracemalloc
+
+from benchmarks.fakes import (
+    EMPLOYER_ROLE, WORKER_ROLE, FakeSession, MemoryDatabase, UpdateFactory, form_updates, load_main
+)
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+ADMIN_ID = int(os.environ["ADMIN_ID"])
+# Shu foizdan ko'p yomonlashsa regressiya deb hisoblanadi
+TOLERANCE = 0.20
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class FlowBenchmark:
+    def __init__(self, database, session: FakeSession):
+        self.main = load_main(database, session)
+        self.session = session
+        self.factory = UpdateFactory()
+        self.latencies: list[float] = []
+        self.approve_latencies: list[float] = []
+        self.updates = 0
+        self.main.bot_config["admins"] = [ADMIN_ID]
+        self.main.bot_config["channels"] = {"erkak": -1001, "ayol": -1002, "yashirin": -1003}
+
+    async def feed(self, update):
+        start = time.perf_counter()
+        await self.main.dp.feed_update(self.main.bot, update)
+        self.latencies.append(time.perf_counter() - start)
+        self.updates += 1
+
+    def _pending_for(self, user_id: int) -> str | None:
+        for temp_id, elon in self.main.pending_ads._cache.items():
+            if elon["user_id"] == user_id:
+                return temp_id
+        return None
+
+    async def one_ad(self, user_id: int, role: str, worker: int = 0):
+        for update in form_updates(self.factory, user_id, role):
+            await self.feed(update)
+        if self._pending_for(user_id) is None:
+            raise RuntimeError(f"{user_id}: e'lon navbatga tushmadi")
+        # Har bir worker alohida admin: navbatdan e'lon oladi va kelgan xabardagi tugmani bosadi
+        admin_id = ADMIN_ID + worker
+        await self.feed(self.factory.text(admin_id, "📥 Navbat"))
+        approve = self.session.last_sent[admin_id].reply_markup.inline_keyboard[0][0].callback_data
+        await self.feed(self.factory.callback(admin_id, approve, caption="🆕"))
+        self.approve_latencies.append(self.latencies[-1])
+
+    async def run(self, ads: int, concurrency: int, first_user: int = 10_000):
+        queue = asyncio.Queue()
+        for i in range(ads):
+            queue.put_nowait((first_user + i, WORKER_ROLE if i % 2 == 0 else EMPLOYER_ROLE))
+
+        self.main.bot_config["admins"] = [ADMIN_ID + i for i in range(concurrency)]
+        self.session.watched.update(self.main.bot_config["admins"])
+
+        async def worker(index: int):
+            while not queue.empty():
+                await self.one_ad(*queue.get_nowait(), worker=index)
+
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        # Kanalga joylash outbox orqali - hammasi bajarilguncha kutamiz
+        await self.main.outbox.drain()
+        await self.main.user_tracker.flush()
+
+
+async def measure(args) -> dict:
+    database = None if args.postgres else MemoryDatabase(latency=args.db_latency)
+    session = FakeSession(latency=args.api_latency)
+    bench = FlowBenchmark(database, session)
+    if args.postgres:
+        await bench.main.db.connect()
+
+    # Isitish: importlar, keshlar, birinchi kod bloki
+    await bench.run(ads=4, concurrency=1, first_user=1)
+    bench.latencies.clear()
+    bench.approve_latencies.clear()
+    bench.updates = 0
+    calls_before = session.calls.copy()
+
+    start = time.perf_counter()
+    await bench.run(args.ads, args.concurrency)
+    elapsed = time.perf_counter() - start
+    calls = session.calls - calls_before
+
+    # Xotira alohida o'lchanadi, chunki tracemalloc vaqtni buzadi
+    # Tugagan task'lardagi sikllar GC ga qarab qoladi - o'lchovdan chiqaramiz
+    gc.collect()
+    tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    mem_before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    await bench.run(args.mem_ads, 1, first_user=1_000_000)
+    gc.collect()
+    mem_after, mem_peak = tracemalloc.get_traced_memory()
+    blocks_after = sys.getallocatedblocks()
+    tracemalloc.stop()
+
+    if args.postgres:
+        await bench.main.db.close()
+
+    return {
+        "ads": args.ads,
+        "approved": calls["editMessageCaption"],
+        "updates": bench.updates,
+        "updates_per_sec": bench.updates / elapsed,
+        "ads_per_sec": args.ads / elapsed,
+        "p50_ms": percentile(bench.latencies, 0.50) * 1000,
+        "p99_ms": percentile(bench.latencies, 0.99) * 1000,
+        "approve_p50_ms": percentile(bench.approve_latencies, 0.50) * 1000,
+        "retained_kib_per_ad": (mem_after - mem_before) / 1024 / args.mem_ads,
+        "peak_kib": (mem_peak - mem_before) / 1024,
+        "blocks_per_ad": (blocks_after - blocks_before) / args.mem_ads,
+        "api_calls_per_ad": sum(calls.values()) / args.ads,
+    }
+
+
+# Kattaroq qiymat yaxshi (True) yoki yomon (False)
+HIGHER_IS_BETTER = {
+    "updates_per_sec": True, "ads_per_sec": True, "p50_ms": False, "p99_ms": False,
+    "approve_p50_ms": False, "retained_kib_per_ad": False, "blocks_per_ad": False, "api_calls_per_ad": False,
+}
+
+
+def compare(result: dict, baseline: dict) -> list[str]:
+    regressions = []
+    for key, higher_better in HIGHER_IS_BETTER.items():
+        old, new = baseline.get(key), result.get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / abs(old)
+        worse = change < -TOLERANCE if higher_better else change > TOLERANCE
+        mark = "  <-- REGRESSIYA" if worse else ""
+        print(f"  {key:<22} {old:>12.2f} -> {new:>12.2f} ({change:+.0%}){mark}")
+        if worse:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ads", type=int, default=500)
+    parser.add_argument("--mem-ads", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="soxta Bot API kechikishi, s")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="soxta DB kechikishi, s")
+    parser.add_argument("--postgres", action="store_true")
+    parser.add_argument("--save", action="store_true", help="natijani baseline sifatida saqlash")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    result = asyncio.run(measure(args))
+    print(json.dumps(result, indent=2))
+
+    if args.save:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline saqlandi: {BASELINE_PATH}")
+        return
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+        print("Baseline bilan taqqoslash:")
+        if compare(result, baseline):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""FSM storage round trips per completed form: PgStorage vs naive storage.
+
+    python -m benchmarks.fsm_roundtrips
+"""
+import json
+import asyncio
+import logging
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+
+from benchmarks.fakes import (
+    EMPLOYER_ROLE, WORKER_ROLE, FakeSession, MemoryDatabase, UpdateFactory, form_updates, load_main
+)
+from storage import PgStorage
+
+
+# Har bir chaqiruv to'g'ridan-to'g'ri DB ga boradigan storage (taqqoslash uchun)
+class NaiveStorage(BaseStorage):
+    def __init__(self, database):
+        self.db = database
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    async def _load(self, key):
+        return await self.db.get_fsm(self.key_builder.build(key)) or (None, {})
+
+    async def _upsert(self, key, **fields):
+        # INSERT ... ON CONFLICT DO UPDATE SET <field> - bitta round trip
+        await self.db._trip("save_fsm")
+        k = self.key_builder.build(key)
+        state, data = self.db.fsm.get(k, (None, "{}"))
+        self.db.fsm[k] = (fields.get("state", state), fields.get("data", data))
+
+    async def set_state(self, key, state=None):
+        await self._upsert(key, state=state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key):
+        return (await self._load(key))[0]
+
+    async def set_data(self, key, data):
+        await self._upsert(key, data=json.dumps(dict(data)))
+
+    async def get_data(self, key):
+        return (await self._load(key))[1]
+
+    async def close(self):
+        pass
+
+
+async def run(storage_cls, role: str, forms: int = 20) -> float:
+    database = MemoryDatabase()
+    main = load_main(database, FakeSession())
+    main.dp.fsm.storage = storage_cls(database)
+    factory = UpdateFactory()
+    for user_id in range(1000, 1000 + forms):
+        for update in form_updates(factory, user_id, role):
+            await main.dp.feed_update(main.bot, update)
+    trips = database.round_trips["get_fsm"] + database.round_trips["save_fsm"]
+    return trips / forms
+
+
+async def main():
+    logging.disable(logging.INFO)
+    print(f"{'storage':<12} {'role':<20} {'round trips / form':>20}")
+    for role in (WORKER_ROLE, EMPLOYER_ROLE):
+        for cls in (NaiveStorage, PgStorage):
+            print(f"{cls.__name__:<12} {role:<20} {await run(cls, role):>20.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,156 @@
+"""JSONB benchmark: encode/decode cost of ad data, outbox payloads and FSM data
+through the pool's type codecs versus the old json.dumps/loads-as-text path, and
+(with --postgres) filtered ad lookups on promoted columns versus data->>'...'.
+
+    python -m benchmarks.jsonb                         # serialization only
+    python -m benchmarks.jsonb --postgres --ads 50000  # + lookups, DATABASE_URL (test database!)
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+
+from benchmarks.fakes import EMPLOYER_ROLE, WORKER_ROLE
+import db as db_module
+
+BENCH_PREFIX = "BENCH-"
+REGIONS = ["Toshkent", "Samarqand", "Buxoro", "Andijon", "Farg'ona", "Namangan", "Xorazm", "Qashqadaryo"]
+
+
+def ad_data(i: int) -> dict:
+    return {
+        "role": WORKER_ROLE if i % 2 == 0 else EMPLOYER_ROLE,
+        "hudud": REGIONS[i % len(REGIONS)],
+        "jinsi": "Erkak" if i % 3 else "Ayol",
+        "fish": "Ali Valiyev",
+        "yoshi": str(20 + i % 30),
+        "mahorat": "Payvandchi, elektr va gaz payvandlash bo'yicha 5 yillik tajriba 🔥",
+        "qosimcha": "Mas'uliyatli, o'z vaqtida ishga keladi. Ish joyi yaqin bo'lsa yaxshi.",
+        "vaqt": "09:00-18:00",
+        "dam": "Shanba, Yakshanba",
+        "maosh": "5 mln so'm",
+        "tel": f"+99890{i % 10_000_000:07d}",
+        "code": f"E-{i}",
+    }
+
+
+def payload(i: int) -> dict:
+    text = "\n".join(f"{k}: {v}" for k, v in ad_data(i).items())
+    return {
+        "code": f"E-{i}", "user_id": 10_000 + i, "target_type": "erkak", "target_channel_id": -1001,
+        "hidden_channel_id": -1003, "photo": None, "admin_photo": None, "text_public": text,
+        "text_hidden": f"🔐 #ARXIV\n\n{text}", "admin_chat_id": 1, "admin_message_id": 42,
+        "trace_id": f"{random.getrandbits(64):016x}",
+    }
+
+
+def _timed(fn, values, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for value in values:
+            fn(value)
+    return (time.perf_counter() - start) / (repeat * len(values)) * 1e6
+
+
+def serialization(args) -> dict:
+    # Oldingi yo'l: json.dumps -> str -> asyncpg text kodeki UTF-8 ga; o'qishda UTF-8 -> str -> json.loads
+    def old_encode(value):
+        return json.dumps(value, ensure_ascii=False).encode()
+
+    def old_decode(data):
+        return json.loads(data.decode())
+
+    encode, decode = db_module.JSON_CODECS["jsonb"]
+    if db_module.JSON_CODEC_FORMAT == "text":
+        # stdlib zaxira: asyncpg str <-> UTF-8 ni o'zi bajaradi
+        new_encode, new_decode = (lambda v: encode(v).encode()), (lambda d: decode(d.decode()))
+    else:
+        new_encode, new_decode = encode, decode
+
+    result = {"codec": "orjson" if db_module.orjson else "json (stdlib)"}
+    samples = {
+        "ad": [ad_data(i) for i in range(100)],
+        "payload": [payload(i) for i in range(100)],
+        "fsm": [{k: v for k, v in list(ad_data(i).items())[:6]} for i in range(100)],
+    }
+    for name, values in samples.items():
+        old_wire = [old_encode(v) for v in values]
+        new_wire = [new_encode(v) for v in values]
+        assert [new_decode(w) for w in new_wire] == values
+        result[f"{name}_bytes"] = len(new_wire[0])
+        result[f"{name}_encode_old_us"] = _timed(old_encode, values, args.repeat)
+        result[f"{name}_encode_new_us"] = _timed(new_encode, values, args.repeat)
+        result[f"{name}_decode_old_us"] = _timed(old_decode, old_wire, args.repeat)
+        result[f"{name}_decode_new_us"] = _timed(new_decode, new_wire, args.repeat)
+    return result
+
+
+async def lookup(args) -> dict:
+    database = db_module.Database()
+    await database.connect()
+    try:
+        await database._execute("bench_cleanup", "DELETE FROM ads WHERE code LIKE $1", BENCH_PREFIX + "%")
+        start = time.perf_counter()
+        async with database._connection() as conn:
+            await conn.executemany("INSERT INTO ads (code, data) VALUES ($1, $2)",
+                                   [(f"{BENCH_PREFIX}{i}", ad_data(i)) for i in range(args.ads)])
+            # Oldingi holat: ifoda indekslari (migratsiya ularni o'chiradi)
+            await conn.execute("""
+                CREATE INDEX IF NOT EXISTS bench_ads_jinsi_expr_idx ON ads ((data->>'jinsi'));
+                CREATE INDEX IF NOT EXISTS bench_ads_role_expr_idx ON ads ((data->>'role'));
+                ANALYZE ads;
+            """)
+        result = {"ads": args.ads, "insert_s": time.perf_counter() - start}
+
+        queries = {
+            "jinsi_role": ("SELECT code, data FROM ads WHERE {jinsi} = $1 AND {role} = $2 "
+                           "ORDER BY code DESC LIMIT 5", lambda i: ("Ayol", EMPLOYER_ROLE)),
+            "hudud": ("SELECT code, data FROM ads WHERE {hudud} = $1 ORDER BY code DESC LIMIT 5",
+                      lambda i: (REGIONS[i % len(REGIONS)],)),
+            "tel": ("SELECT code, data FROM ads WHERE {tel} = $1",
+                    lambda i: (ad_data(random.randrange(args.ads))["tel"],)),
+        }
+        variants = {
+            "old": {field: f"data->>'{field}'" for field in ("jinsi", "role", "hudud", "tel")},
+            "new": {field: field for field in ("jinsi", "role", "hudud", "tel")},
+        }
+        for name, (sql, params) in queries.items():
+            for variant, columns in variants.items():
+                statement = sql.format(**columns)
+                await database._fetch(f"bench_{name}", statement, *params(0))
+                start = time.perf_counter()
+                for i in range(args.lookups):
+                    await database._fetch(f"bench_{name}", statement, *params(i))
+                result[f"{name}_{variant}_ms"] = (time.perf_counter() - start) / args.lookups * 1000
+        start = time.perf_counter()
+        for i in range(args.lookups):
+            await database.get_ad(f"{BENCH_PREFIX}{random.randrange(args.ads)}")
+        result["get_ad_ms"] = (time.perf_counter() - start) / args.lookups * 1000
+        return result
+    finally:
+        async with database._connection() as conn:
+            await conn.execute("DROP INDEX IF EXISTS bench_ads_jinsi_expr_idx, bench_ads_role_expr_idx")
+            await conn.execute("DELETE FROM ads WHERE code LIKE $1", BENCH_PREFIX + "%")
+        await database.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--postgres", action="store_true")
+    parser.add_argument("--ads", type=int, default=50_000)
+    parser.add_argument("--lookups", type=int, default=500)
+    args = parser.parse_args()
+
+    results = [("serialization", serialization(args))]
+    if args.postgres:
+        results.append(("lookup", asyncio.run(lookup(args))))
+    for name, result in results:
+        print(name)
+        for key, value in result.items():
+            print(f"  {key:<24} {value:.3f}" if isinstance(value, float) else f"  {key:<24} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""End-to-end load test: thousands of simulated users fill the ``Form`` flow through
+the fake Bot API (benchmarks/fake_api.py) while the real main.py polling loop, in a
+separate process, answers them; admins take ads from the moderation queue and approve.
+
+Step latency is from pushing an update into getUpdates until the bot's reply reaches
+the fake API. A reply lost to a 429 shows up as a timeout: the user gives up.
+
+    python -m benchmarks.load                          # 1000 users, MemoryDatabase bot
+    python -m benchmarks.load --users 3000 --ramp 120 --global-rate 1e9
+    python -m benchmarks.load --postgres               # bot = python main.py (DATABASE_URL)
+"""
+import os
+import sys
+import time
+import random
+import signal
+import asyncio
+import logging
+import argparse
+from collections import Counter
+
+from antiflood import FLOOD_WARNING
+from benchmarks.fake_api import FakeBotAPI
+from benchmarks.fakes import EMPLOYER_ROLE, WORKER_ROLE, UpdateFactory, form_updates
+
+ADMIN_ID = int(os.environ["ADMIN_ID"])
+CHANNELS = {"ERKAK_KANAL_ID": "-1001", "AYOL_KANAL_ID": "-1002", "YASHIRIN_KANAL": "-1003"}
+FIRST_USER = 10_000
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _dump(update) -> dict:
+    return update.model_dump(mode="json", exclude_none=True, by_alias=True)
+
+
+class LoadDriver:
+    def __init__(self, api: FakeBotAPI, args):
+        self.api = api
+        self.args = args
+        self.factory = UpdateFactory()
+        self.latencies: list[float] = []
+        self.approve_latencies: list[float] = []
+        self.results = Counter()
+        self.users_done = asyncio.Event()
+
+    async def step(self, chat_id: int, update: dict, predicate=None) -> dict | None:
+        after = len(self.api.sent[chat_id])
+        start = time.perf_counter()
+        self.api.push(update)
+        self.results["updates"] += 1
+        reply = await self.api.wait_message(chat_id, after, predicate, self.args.step_timeout)
+        if reply is None:
+            self.results["timeouts"] += 1
+            return None
+        self.latencies.append(reply["at"] - start)
+        return reply
+
+    async def user(self, user_id: int, role: str, delay: float):
+        await asyncio.sleep(delay)
+        for update in form_updates(self.factory, user_id, role):
+            # Foydalanuvchi javobni o'qib, keyingisini yozadi
+            await asyncio.sleep(self.args.think * random.uniform(0.5, 1.5))
+            # answerCallbackQuery keyingi qadamning javobi hisoblanmaydi
+            reply = await self.step(user_id, _dump(update), lambda m: m["method"] != "answerCallbackQuery")
+            if reply is None:
+                self.results["abandoned"] += 1
+                return
+        self.results["forms_completed"] += 1
+
+    async def admin(self, admin_id: int):
+        # Navbatdan e'lon oladi va tasdiqlaydi; foydalanuvchilar tugab navbat bo'shaguncha
+        while True:
+            reply = await self.step(admin_id, _dump(self.factory.text(admin_id, "📥 Navbat")),
+                                    lambda m: m["text"].startswith(("🆕", "📭")))
+            if reply is None or reply["text"].startswith("📭"):
+                if self.users_done.is_set():
+                    return
+                await asyncio.sleep(self.args.think)
+                continue
+            buttons = [b["callback_data"] for row in reply["reply_markup"]["inline_keyboard"] for b in row]
+            approve = next(data for data in buttons if data.startswith("approve_"))
+            update = _dump(self.factory.callback(admin_id, approve, caption="🆕"))
+            update["callback_query"]["message"]["message_id"] = reply["message_id"]
+            start = time.perf_counter()
+            answer = await self.step(admin_id, update, lambda m: m["method"] == "answerCallbackQuery")
+            if answer is not None and answer["text"].startswith("✅"):
+                self.results["approved"] += 1
+                self.approve_latencies.append(answer["at"] - start)
+
+    async def run(self) -> float:
+        args = self.args
+        users = [
+            asyncio.create_task(self.user(FIRST_USER + i, WORKER_ROLE if i % 2 == 0 else EMPLOYER_ROLE,
+                                          args.ramp * i / args.users))
+            for i in range(args.users)
+        ]
+        admins = [asyncio.create_task(self.admin(ADMIN_ID + i)) for i in range(args.admins)]
+        start = time.perf_counter()
+        await asyncio.gather(*users)
+        elapsed = time.perf_counter() - start
+        self.users_done.set()
+        await asyncio.gather(*admins)
+        return elapsed
+
+
+async def start_bot(url: str, args) -> asyncio.subprocess.Process:
+    env = {**os.environ, "TELEGRAM_API_URL": url, "ADMIN_ID": str(ADMIN_ID)}
+    for key, value in CHANNELS.items():
+        env.setdefault(key, value)
+    if args.postgres:
+        command = [sys.executable, "main.py"]
+    else:
+        command = [sys.executable, "-m", "benchmarks.load", "--serve-bot", "--admins", str(args.admins),
+                   "--db-latency", str(args.db_latency)]
+    log = open(args.bot_log, "ab")
+    try:
+        return await asyncio.create_subprocess_exec(*command, env=env, stdout=log, stderr=log,
+                                                    cwd=os.path.dirname(os.path.dirname(__file__)) or ".")
+    finally:
+        log.close()
+
+
+async def stop_bot(process: asyncio.subprocess.Process):
+    if process.returncode is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(process.wait(), 15)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+
+
+async def measure(args) -> dict:
+    api = FakeBotAPI(latency=args.api_latency, global_rate=args.global_rate, chat_rate=args.chat_rate)
+    url = await api.start()
+    bot = await start_bot(url, args)
+    try:
+        ready = asyncio.create_task(api.polling.wait())
+        await asyncio.wait([ready, asyncio.create_task(bot.wait())], timeout=args.startup_timeout,
+                           return_when=asyncio.FIRST_COMPLETED)
+        if not ready.done():
+            raise RuntimeError(f"Bot getUpdates ga yetib kelmadi, log: {args.bot_log}")
+        calls_before, flood_before = api.calls.copy(), api.flood.copy()
+
+        driver = LoadDriver(api, args)
+        elapsed = await driver.run()
+        # Kanalga joylash outbox orqali fonda - biroz kutamiz
+        await asyncio.sleep(args.drain)
+        calls, flood = api.calls - calls_before, api.flood - flood_before
+    finally:
+        await stop_bot(bot)
+        await api.stop()
+
+    results = driver.results
+    channel_ids = {int(os.environ.get(key, value)) for key, value in CHANNELS.items()}
+    return {
+        "users": args.users,
+        "forms_completed": results["forms_completed"],
+        "abandoned": results["abandoned"],
+        "step_timeouts": results["timeouts"],
+        "updates": results["updates"],
+        "elapsed_s": elapsed,
+        "updates_per_sec": results["updates"] / elapsed,
+        "forms_per_min": results["forms_completed"] / elapsed * 60,
+        "step_p50_ms": percentile(driver.latencies, 0.50) * 1000,
+        "step_p90_ms": percentile(driver.latencies, 0.90) * 1000,
+        "step_p99_ms": percentile(driver.latencies, 0.99) * 1000,
+        "step_max_ms": max(driver.latencies, default=0.0) * 1000,
+        "approved": results["approved"],
+        "approve_p50_ms": percentile(driver.approve_latencies, 0.50) * 1000,
+        "channel_posts": sum(len(api.sent[chat_id]) for chat_id in channel_ids),
+        "api_calls": sum(calls.values()) - calls["getUpdates"],
+        "get_updates_calls": calls["getUpdates"],
+        "flood_429": sum(flood.values()),
+        "flood_429_by_method": dict(flood),
+        "antiflood_warnings": sum(m["text"] == FLOOD_WARNING for chat in api.sent.values() for m in chat),
+    }
+
+
+async def serve_bot(args):
+    # Bola jarayon: main.py MemoryDatabase bilan, Bot API - TELEGRAM_API_URL dagi soxta server
+    from benchmarks.fakes import MemoryDatabase, load_main
+
+    database = MemoryDatabase(latency=args.db_latency)
+    database.admins.update(ADMIN_ID + i for i in range(args.admins))
+    main = load_main(database, None)
+    await main.on_startup(0)
+    await main.bot.delete_webhook()
+    await main.dp.start_polling(main.bot)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--ramp", type=float, default=60, help="foydalanuvchilar shu vaqt ichida qo'shiladi, s")
+    parser.add_argument("--think", type=float, default=2.0, help="qadamlar orasidagi o'rtacha pauza, s")
+    parser.add_argument("--admins", type=int, default=2)
+    parser.add_argument("--step-timeout", type=float, default=30, help="javob kelmasa foydalanuvchi ketadi, s")
+    parser.add_argument("--drain", type=float, default=5, help="oxirida outbox uchun kutish, s")
+    parser.add_argument("--api-latency", type=float, default=0.04, help="Bot API median kechikishi, s")
+    parser.add_argument("--global-rate", type=float, default=30, help="umumiy xabar/s limiti")
+    parser.add_argument("--chat-rate", type=float, default=1, help="bitta chatga xabar/s limiti")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="soxta DB round trip, s")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--bot-log", default=os.devnull, help="bot jarayonining stdout/stderr fayli")
+    parser.add_argument("--postgres", action="store_true")
+    parser.add_argument("--serve-bot", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.postgres:
+        # main.py faqat ADMIN_ID ni admin qiladi
+        args.admins = 1
+
+    if args.serve_bot:
+        asyncio.run(serve_bot(args))
+        return
+    logging.disable(logging.WARNING)
+    for key, value in asyncio.run(measure(args)).items():
+        print(f"  {key:<24} {value:.3f}" if isinstance(value, float) else f"  {key:<24} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Micro-benchmark of ad rendering: legacy string concatenation vs compiled templates.
+
+    python -m benchmarks.render
+"""
+import timeit
+
+from utils import create_ad_text, render_ad, render_body
+
+WORKER = {
+    "role": "👷‍♂️ Ish qidiryapman", "hudud": "Toshkent, Chilonzor", "jinsi": "Erkak",
+    "fish": "Ali Valiyev", "yoshi": "25", "mahorat": "Payvandchi <5 yil tajriba>",
+    "masuliyat": "Mas'uliyatli", "vaqt": "09:00-18:00", "bosh_vaqt": "Shanba",
+    "qosimcha": "Tajribam bor & asboblarim bor", "maosh": "5 mln", "tel": "+998901234567",
+    "code": "E-00042",
+}
+EMPLOYER = {
+    "role": "🏢 Ish beruvchiman", "hudud": "Samarqand", "jinsi": "Ayol", "yoshi": "20-30",
+    "mahorat": "Sotuvchi", "vaqt": "09:00-18:00", "qosimcha": "Markazda", "maosh": "4 mln",
+    "tel": "+998901234567", "code": "E-00043",
+}
+
+
+# Oldingi (o'zgarishdan avvalgi) create_ad_text - taqqoslash uchun
+def legacy_create_ad_text(data: dict, include_code: bool = False, with_phone: bool = False) -> str:
+    role = data.get("role", "Noma’lum")
+    if role == "🏢 Ish beruvchiman":
+        text = f"<b>🏢 XODIM KERAK ({data.get('hudud', 'N/A')})</b>\n\n"
+        text += f"<b>🏢 Idora:</b> Ish beruvchi\n"
+        text += f"<b>📍 Hudud:</b> {data.get('hudud', 'N/A')}\n"
+        text += f"<b>👷‍♂️ Kim kerak:</b> {data.get('jinsi', 'N/A')}\n"
+        text += f"<b>🔞 Yosh chegarasi:</b> {data.get('yoshi', 'N/A')}\n"
+        text += f"<b>📓 Talablar:</b> {data.get('mahorat', 'N/A')}\n"
+        text += f"<b>⏰ Ish vaqti:</b> {data.get('vaqt', 'N/A')}\n"
+        text += f"<b>ℹ️ Qo'shimcha:</b> {data.get('qosimcha', 'N/A')}\n"
+        text += f"<b>💰 Maosh:</b> {data.get('maosh', 'N/A')}\n"
+    else:
+        text = f"<b>👷‍♂️ ISH KERAK ({data.get('hudud', 'N/A')})</b>\n\n"
+        text += f"<b>👤 Ism:</b> {data.get('fish', 'N/A')}\n"
+        text += f"<b>📍 Hudud:</b> {data.get('hudud', 'N/A')}\n"
+        text += f"<b>🚻 Jinsi:</b> {data.get('jinsi', 'N/A')}\n"
+        text += f"<b>🆔 Yoshi:</b> {data.get('yoshi', 'N/A')}\n"
+        text += f"<b>🛠 Mutaxassisligi:</b> {data.get('mahorat', 'N/A')}\n"
+        if data.get('masuliyat'):
+            text += f"<b>📌 Mas’uliyati:</b> {data.get('masuliyat')}\n"
+        text += f"<b>⏰ Ish vaqti:</b> {data.get('vaqt', 'N/A')}\n"
+        if data.get('bosh_vaqt'):
+            text += f"<b>🕒 Bo‘sh vaqt:</b> {data.get('bosh_vaqt')}\n"
+        if data.get('qosimcha'):
+            text += f"<b>🧰 Qo‘shimcha:</b> {data.get('qosimcha')}\n"
+        text += f"<b>💰 Maosh:</b> {data.get('maosh', 'N/A')}\n"
+    if with_phone:
+        text += f"\n<b>📞 Aloqa:</b> {data.get('tel', 'N/A')}\n"
+    if include_code:
+        text += f"\n🔎 <b>E’lon kodi:</b> {data.get('code', 'N/A')}"
+    return text
+
+
+def legacy_lifecycle(data):
+    # handle_check, click_edit_text, approve (ommaviy + yashirin)
+    legacy_create_ad_text(data, with_phone=True)
+    legacy_create_ad_text(data, with_phone=True)
+    legacy_create_ad_text(data, include_code=True)
+    legacy_create_ad_text(data, include_code=True, with_phone=True)
+
+
+def compiled_lifecycle(data):
+    body = render_body(data)
+    preview = create_ad_text(data, with_phone=True, body=body)
+    renders = {"body": body, "preview": preview}
+    renders["preview"]  # click_edit_text keshdan oladi
+    render_ad(data, renders["body"])
+
+
+def bench(label: str, fn, number: int = 20000):
+    best = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f"  {label:<42} {best * 1e6:8.2f} µs")
+    return best
+
+
+def main():
+    for name, data in (("ishchi", WORKER), ("ish beruvchi", EMPLOYER)):
+        print(f"{name}:")
+        bench("legacy create_ad_text (1 ta render)", lambda: legacy_create_ad_text(data, True, True))
+        bench("render_body (1 ta render)", lambda: render_body(data))
+        bench("render_ad (ommaviy+yashirin, bitta o'tish)", lambda: render_ad(data))
+        old = bench("legacy: e'lonning butun hayoti (4 render)", lambda: legacy_lifecycle(data))
+        new = bench("shablon + kesh: butun hayoti", lambda: compiled_lifecycle(data))
+        print(f"  {'tezlanish':<42} {old / new:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
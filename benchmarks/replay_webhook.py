@@ -0,0 +1,79 @@
+"""POST recorded updates to a locally running webhook server.
+
+    WEBHOOK_SECRET=test BOT_MODE=webhook python main.py &
+    WEBHOOK_SECRET=test python -m benchmarks.replay_webhook updates.jsonl --url http://127.0.0.1:8080/webhook
+
+Each line of the input file is one Telegram Update as JSON (the ``result``
+items of getUpdates). Without a file, a synthetic Form flow is generated.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+from aiohttp import ClientSession
+
+from benchmarks.fakes import WORKER_ROLE, UpdateFactory, form_updates
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def load_updates(path: str | None, users: int) -> list[dict]:
+    if path:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    factory = UpdateFactory()
+    updates = []
+    for user_id in range(20_000, 20_000 + users):
+        updates += [u.model_dump(mode="json", by_alias=True, exclude_none=True)
+                    for u in form_updates(factory, user_id, WORKER_ROLE)]
+    return updates
+
+
+async def replay(url: str, secret: str | None, updates: list[dict], concurrency: int):
+    headers = {SECRET_HEADER: secret} if secret else {}
+    statuses = {}
+    latencies = []
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+
+    async with ClientSession(headers=headers) as session:
+        async def worker():
+            while not queue.empty():
+                update = queue.get_nowait()
+                start = time.perf_counter()
+                async with session.post(url, json=update) as response:
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{len(updates)} ta update {elapsed:.2f} s da yuborildi ({len(updates) / elapsed:.0f}/s)")
+    print(f"HTTP javoblari: {statuses}")
+    print(f"Javob vaqti: p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("file", nargs="?")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"))
+    parser.add_argument("--users", type=int, default=50, help="fayl berilmasa nechta foydalanuvchi")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="1 dan katta bo'lsa bitta foydalanuvchi update'lari tartibi buziladi")
+    args = parser.parse_args()
+    updates = load_updates(args.file, args.users)
+    if not updates:
+        sys.exit("Update topilmadi")
+    asyncio.run(replay(args.url, args.secret, updates, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
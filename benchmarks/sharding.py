@@ -0,0 +1,77 @@
+"""Throughput of the sharded supervisor with 1..N worker processes.
+
+Each worker runs the real dispatcher against a fake Bot session and its own
+MemoryDatabase. Users are routed by consistent hash, so every Form flow
+completes inside one worker.
+
+    python -m benchmarks.sharding --workers 1 2 4 --users 400
+"""
+import os
+import time
+import logging
+import argparse
+import multiprocessing as mp
+
+from benchmarks.fakes import (
+    EMPLOYER_ROLE, WORKER_ROLE, FakeSession, MemoryDatabase, UpdateFactory, form_updates, load_main
+)
+from shard import Supervisor
+
+
+async def fake_setup(index: int):
+    logging.disable(logging.WARNING)
+    latency = float(os.getenv("BENCH_API_LATENCY", 0))
+    main = load_main(MemoryDatabase(), FakeSession(latency=latency))
+    return main.dp, main.bot
+
+
+def make_updates(users: int) -> list[dict]:
+    factory = UpdateFactory()
+    updates = []
+    for i, user_id in enumerate(range(30_000, 30_000 + users)):
+        role = WORKER_ROLE if i % 2 == 0 else EMPLOYER_ROLE
+        updates += [u.model_dump(mode="json", by_alias=True, exclude_none=True)
+                    for u in form_updates(factory, user_id, role)]
+    return updates
+
+
+def run(workers: int, updates: list[dict]) -> float:
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    supervisor = Supervisor(workers, setup=fake_setup, results=results)
+    supervisor.start()
+    for _ in range(workers):
+        results.get()
+
+    start = time.perf_counter()
+    for raw in updates:
+        supervisor.route(raw, block=True)
+    supervisor.stop(timeout=600)
+    processed = 0
+    for _ in range(workers):
+        _, _, count, _ = results.get()
+        processed += count
+    elapsed = time.perf_counter() - start
+    assert processed == len(updates), f"{processed} != {len(updates)}"
+    return processed / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=400)
+    parser.add_argument("--api-latency", type=float, default=0.0)
+    args = parser.parse_args()
+    os.environ["BENCH_API_LATENCY"] = str(args.api_latency)
+
+    updates = make_updates(args.users)
+    print(f"{len(updates)} ta update, CPU yadrolari: {os.cpu_count()}")
+    base = None
+    for workers in args.workers:
+        rate = run(workers, updates)
+        base = base or rate
+        print(f"  {workers} worker: {rate:8.0f} update/s  (x{rate / base:.2f})")
+
+
+if __name__ == "__main__":
+    main()
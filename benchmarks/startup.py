@@ -0,0 +1,93 @@
+"""Cold start benchmark: importing main, on_startup (schema check, config bootstrap,
+pending cache) and the time until the first polled update is answered.
+
+    python -m benchmarks.startup                       # MemoryDatabase, 2 ms per DB round trip
+    python -m benchmarks.startup --postgres            # real DATABASE_URL (migrations included)
+"""
+import time
+
+START = time.perf_counter()
+
+import json
+import asyncio
+import logging
+import argparse
+
+from benchmarks.fakes import FakeSession, MemoryDatabase, UpdateFactory
+
+USER_ID = 4242
+
+
+# getUpdates bitta /start qaytaradi, keyin bo'sh long-poll; javob kelganda voqea belgilanadi
+class PollingSession(FakeSession):
+    def __init__(self, update, latency: float = 0.0):
+        super().__init__(latency)
+        self.update = update
+        self.answered = asyncio.Event()
+        self.watched.add(USER_ID)
+
+    def _result(self, api_method: str, params: dict):
+        if api_method == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "Bot", "username": "bot"}
+        if api_method == "getUpdates":
+            update, self.update = self.update, None
+            return [json.loads(update.model_dump_json(exclude_none=True))] if update else []
+        return super()._result(api_method, params)
+
+    async def make_request(self, bot, method, timeout=None):
+        if method.__api_method__ == "getUpdates" and self.update is None:
+            await asyncio.sleep(0.05)
+        result = await super().make_request(bot, method, timeout)
+        if USER_ID in self.last_sent:
+            self.answered.set()
+        return result
+
+
+async def measure(args) -> dict:
+    from benchmarks.fakes import load_main
+
+    database = None if args.postgres else MemoryDatabase(latency=args.db_latency)
+    session = PollingSession(UpdateFactory().text(USER_ID, "/start"), latency=args.api_latency)
+    main = load_main(database, session)
+    imported = time.perf_counter()
+
+    await main.on_startup(0)
+    started = time.perf_counter()
+    trips = dict(database.round_trips) if database is not None else {}
+
+    await main.bot.delete_webhook()
+    polling = asyncio.create_task(main.dp.start_polling(main.bot, handle_signals=False,
+                                                        close_bot_session=False))
+    await session.answered.wait()
+    answered = time.perf_counter()
+    await main.dp.stop_polling()
+    await polling
+    for task in main.background_tasks:
+        task.cancel()
+
+    result = {
+        "import_main_s": imported - START,
+        "on_startup_s": started - imported,
+        "first_update_s": answered - started,
+        "cold_start_s": answered - START,
+    }
+    if database is not None:
+        result["startup_db_round_trips"] = sum(trips.values())
+        result["round_trips"] = trips
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db-latency", type=float, default=0.002, help="soxta DB round trip, s")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="soxta Bot API kechikishi, s")
+    parser.add_argument("--postgres", action="store_true")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    for key, value in asyncio.run(measure(args)).items():
+        print(f"  {key:<24} {value:.3f}" if isinstance(value, float) else f"  {key:<24} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -39,16 +39,38 @@ def get_gender_menu():
 # ===== ADMIN MENYU (YANGILANDI) =====
 def get_admin_menu():
     builder = ReplyKeyboardBuilder()
+    builder.button(text="📥 Navbat")
     builder.button(text="🔎 Kod orqali qidirish")
+    builder.button(text="🔍 Matn bo'yicha qidirish")
     builder.button(text="⚙️ Kanal sozlamalari")
     builder.button(text="💳 To'lov sozlamalari") # <--- YANGI
     builder.button(text="➕ Admin qo'shish")
     builder.button(text="➖ Admin o'chirish")
     builder.button(text="📋 Adminlar ro'yxati")
+    builder.button(text="📣 Xabar yuborish")
+    builder.button(text="📊 Statistika")
     builder.button(text="👤 Foydalanuvchi rejimi")
-    builder.adjust(2, 2, 2, 1)
+    builder.adjust(1, 2, 2, 2, 2, 2)
     return builder.as_markup(resize_keyboard=True)
 
+# ===== QIDIRUV SAHIFALARI =====
+def get_search_pager(jinsi=None, role=None, has_prev=False, has_next=False):
+    builder = InlineKeyboardBuilder()
+    mark = lambda active: "✅ " if active else ""
+    builder.button(text=f"{mark(jinsi == 'Erkak')}🚹 Erkak", callback_data="srch_jinsi_Erkak")
+    builder.button(text=f"{mark(jinsi == 'Ayol')}👩 Ayol", callback_data="srch_jinsi_Ayol")
+    builder.button(text=f"{mark(role == 'worker')}👷‍♂️ Ishchi", callback_data="srch_role_worker")
+    builder.button(text=f"{mark(role == 'employer')}🏢 Ish beruvchi", callback_data="srch_role_employer")
+    nav = 0
+    if has_prev:
+        builder.button(text="⬅️ Oldingi", callback_data="srch_prev")
+        nav += 1
+    if has_next:
+        builder.button(text="Keyingi ➡️", callback_data="srch_next")
+        nav += 1
+    builder.adjust(2, 2, *([nav] if nav else []))
+    return builder.as_markup()
+
 # ===== KANAL SOZLAMALARI =====
 def get_channels_settings_menu():
     builder = InlineKeyboardBuilder()
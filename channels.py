@@ -0,0 +1,40 @@
+import asyncio
+import logging
+
+from aiogram import Bot
+
+
+# Kanal havolalari keshi: channel_type -> (channel_id, username yoki invite link)
+class ChannelLinks:
+    def __init__(self):
+        self._links: dict[str, tuple[int, str | None]] = {}
+
+    async def _resolve(self, bot: Bot, channel_id: int) -> str | None:
+        chat_info = await bot.get_chat(channel_id)
+        if chat_info.username:
+            return f"https://t.me/{chat_info.username}"
+        if chat_info.invite_link:
+            return chat_info.invite_link
+        # Asosiy invite link yo'q bo'lsa bir marta yaratamiz, keyin get_chat uni qaytaradi
+        return await bot.export_chat_invite_link(channel_id)
+
+    async def get(self, bot: Bot, channel_type: str, channel_id: int) -> str | None:
+        cached = self._links.get(channel_type)
+        if cached and cached[0] == channel_id:
+            return cached[1]
+        try:
+            link = await self._resolve(bot, channel_id)
+        except Exception as e:
+            logging.warning(f"{channel_type} kanali havolasini olib bo'lmadi: {e}")
+            return None
+        self._links[channel_type] = (channel_id, link)
+        return link
+
+    async def warm(self, bot: Bot, channels: dict[str, int]):
+        await asyncio.gather(*(self.get(bot, ctype, cid) for ctype, cid in channels.items() if cid))
+
+    def invalidate(self, channel_type: str):
+        self._links.pop(channel_type, None)
+
+
+channel_links = ChannelLinks()
@@ -1,109 +1,1315 @@
 import os
+import re
 import json
+import time
+import asyncio
+import logging
 import asyncpg
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from metrics import Histogram, Registry
+from stats import STATS_OTHER_REGION, STATS_TIMEZONE, STATS_TOP_REGIONS, parse_price
+from tracing import tracer
+
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Pool sozlamalari
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 2))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", 10))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", 200))
+# Sozlamalar o'zgarganda NOTIFY yuboriladigan kanal
+CONFIG_CHANNEL = "config_changed"
+# Moderatsiyani kutayotgan e'lon qancha vaqt saqlanadi
+PENDING_TTL = int(os.getenv("PENDING_TTL_HOURS", 72)) * 3600
+# Admin navbatdan olgan e'lon shuncha vaqt faqat unga tegishli
+MODERATION_LEASE = int(os.getenv("MODERATION_LEASE", 600))
+# ads jadvali oylar bo'yicha bo'lingan: oldindan yaratiladigan bo'limlar soni
+ADS_PARTITIONS_AHEAD = int(os.getenv("ADS_PARTITIONS_AHEAD", 3))
+# Shundan eski bo'limlar ads dan ajratiladi (DETACH); 0 - hech qachon
+ADS_RETENTION_MONTHS = int(os.getenv("ADS_RETENTION_MONTHS", 0))
+# get_ad avval shuncha oxirgi oy ichidan qidiradi
+ADS_RECENT_MONTHS = int(os.getenv("ADS_RECENT_MONTHS", 2))
+# ads ga yangi ustun qo'shadigan migratsiyalar eski qatorlarni shuncha-shuncha to'ldiradi
+MIGRATION_BATCH = int(os.getenv("MIGRATION_BATCH", 5000))
+# Bo'limlarga o'tishdan oldingi e'lonlarning sanasi noma'lum
+LEGACY_CREATED_AT = "2000-01-01 00:00:00+00"
+
+
+# E'lon holati o'zgargan so'rovning o'zida rollup jadvallarini yangilaydigan CTE qismi.
+# "delta" CTE (hudud, jinsi, role, approved, rejected, revenue) qatorlarini beradi.
+_STATS_ROLLUP = """
+    day_stats AS (
+        INSERT INTO ad_stats_daily AS s (day, hudud, jinsi, role, approved, rejected, revenue)
+        SELECT (now() AT TIME ZONE {tz})::date, hudud, jinsi, role, approved, rejected, revenue FROM delta
+        ON CONFLICT (day, hudud, jinsi, role) DO UPDATE SET
+            approved = s.approved + EXCLUDED.approved,
+            rejected = s.rejected + EXCLUDED.rejected,
+            revenue = s.revenue + EXCLUDED.revenue
+    ), total_stats AS (
+        INSERT INTO ad_stats_total AS s (hudud, jinsi, role, approved, rejected, revenue)
+        SELECT hudud, jinsi, role, approved, rejected, revenue FROM delta
+        ON CONFLICT (hudud, jinsi, role) DO UPDATE SET
+            approved = s.approved + EXCLUDED.approved,
+            rejected = s.rejected + EXCLUDED.rejected,
+            revenue = s.revenue + EXCLUDED.revenue
+    )
+"""
+
+
+def _add_months(month: datetime, n: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + n
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def _month_start(dt: datetime) -> datetime:
+    return dt.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+# --- JSON KODEKLARI ---
+# json/jsonb ustunlari va parametrlari Python obyektlari sifatida o'tadi: chaqiruvchi json.dumps/loads
+# qilmaydi. orjson bo'lsa binary format - UTF-8 baytlar oraliq str siz to'g'ridan-to'g'ri
+# kodlanadi/o'qiladi (jsonb binary ko'rinishi = 1-versiya bayti + matn).
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def _json_encode(value) -> bytes:
+        return orjson.dumps(value, option=_ORJSON_OPTIONS)
+
+    def _jsonb_encode(value) -> bytes:
+        return b"\x01" + orjson.dumps(value, option=_ORJSON_OPTIONS)
+
+    def _jsonb_decode(data: bytes):
+        return orjson.loads(memoryview(data)[1:])
+
+    JSON_CODEC_FORMAT = "binary"
+    JSON_CODECS = {"json": (_json_encode, orjson.loads), "jsonb": (_jsonb_encode, _jsonb_decode)}
+else:
+    def _json_encode(value) -> str:
+        return json.dumps(value, ensure_ascii=False)
+
+    JSON_CODEC_FORMAT = "text"
+    JSON_CODECS = {"json": (_json_encode, json.loads), "jsonb": (_json_encode, json.loads)}
+
 
 class Database:
     def __init__(self):
         self.pool = None
+        # Har bir ulanish (server pid) uchun tayyorlangan statementlar: sql -> PreparedStatement,
+        # LRU, DB_STATEMENT_CACHE_SIZE tagacha
+        self._statements: dict[int, dict] = {}
+        self.query_latency: dict[str, Histogram] = {}
+        self.acquire_wait = Histogram()
+        self.statement_hits = 0
+        self.statement_misses = 0
+        self.query_errors = Counter()
+        # LISTEN uchun alohida ulanish (pooldan tashqarida)
+        self._listener = None
+        self._config_callback = None
+        self._listener_tasks: set[asyncio.Task] = set()
+        self._closing = False
 
     async def connect(self):
         if not self.pool:
-            self.pool = await asyncpg.create_pool(dsn=DATABASE_URL)
+            self.pool = await asyncpg.create_pool(
+                dsn=DATABASE_URL,
+                min_size=DB_POOL_MIN,
+                max_size=DB_POOL_MAX,
+                statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                init=self._init_connection,
+            )
             await self.create_tables()
 
+    async def _init_connection(self, conn):
+        for typename, (encoder, decoder) in JSON_CODECS.items():
+            await conn.set_type_codec(typename, encoder=encoder, decoder=decoder,
+                                      schema="pg_catalog", format=JSON_CODEC_FORMAT)
+        pid = conn.get_server_pid()
+        self._statements[pid] = OrderedDict()
+        conn.add_termination_listener(lambda _: self._statements.pop(pid, None))
+
+    # --- SO'ROVLARNI BAJARISH QATLAMI ---
+    @asynccontextmanager
+    async def _connection(self):
+        start = time.perf_counter()
+        async with self.pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+            self.acquire_wait.observe(time.perf_counter() - start)
+            yield conn
+
+    async def _prepare(self, conn, sql: str):
+        statements = self._statements.setdefault(conn.get_server_pid(), OrderedDict())
+        stmt = statements.get(sql)
+        if stmt is None:
+            self.statement_misses += 1
+            stmt = statements[sql] = await conn.prepare(sql)
+            # Chiqarilgan statement GC bilan serverda ham yopiladi
+            if len(statements) > DB_STATEMENT_CACHE_SIZE:
+                statements.popitem(last=False)
+        else:
+            self.statement_hits += 1
+            statements.move_to_end(sql)
+        return stmt
+
+    async def _call(self, conn, kind: str, sql: str, *args):
+        stmt = await self._prepare(conn, sql)
+        if kind == "execute":
+            await stmt.fetch(*args)
+            return stmt.get_statusmsg()
+        return await getattr(stmt, kind)(*args)
+
+    async def _run(self, conn, kind: str, name: str, sql: str, *args):
+        start = time.perf_counter()
+        try:
+            try:
+                result = await self._call(conn, kind, sql, *args)
+            except (asyncpg.InvalidCachedStatementError, asyncpg.OutdatedSchemaCacheError):
+                # Migratsiya jadval shaklini o'zgartirgan (masalan SELECT * ga ustun qo'shildi): eski
+                # statement tashlanadi va bir marta qayta tayyorlanadi. Tranzaksiya ichida bo'lsa u
+                # allaqachon bekor - chaqiruvchi butunini qaytaradi.
+                self._statements.get(conn.get_server_pid(), {}).pop(sql, None)
+                if conn.is_in_transaction():
+                    raise
+                result = await self._call(conn, kind, sql, *args)
+        except Exception as e:
+            self.query_errors[name] += 1
+            tracer.record("db", name, start, e)
+            raise
+        tracer.record("db", name, start)
+        elapsed = time.perf_counter() - start
+        histogram = self.query_latency.get(name)
+        if histogram is None:
+            histogram = self.query_latency[name] = Histogram()
+        histogram.observe(elapsed)
+        if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+            logging.warning(f"Sekin so'rov: {name} {elapsed * 1000:.1f} ms")
+        return result
+
+    async def _execute(self, name: str, sql: str, *args) -> str:
+        async with self._connection() as conn:
+            return await self._run(conn, "execute", name, sql, *args)
+
+    async def _fetch(self, name: str, sql: str, *args):
+        async with self._connection() as conn:
+            return await self._run(conn, "fetch", name, sql, *args)
+
+    async def _fetchrow(self, name: str, sql: str, *args):
+        async with self._connection() as conn:
+            return await self._run(conn, "fetchrow", name, sql, *args)
+
+    async def _fetchval(self, name: str, sql: str, *args):
+        async with self._connection() as conn:
+            return await self._run(conn, "fetchval", name, sql, *args)
+
+    def stats(self) -> dict:
+        pool = {}
+        if self.pool:
+            pool = {"size": self.pool.get_size(), "idle": self.pool.get_idle_size(),
+                    "min": self.pool.get_min_size(), "max": self.pool.get_max_size()}
+            pool["in_use"] = pool["size"] - pool["idle"]
+        return {
+            "pool": pool,
+            "acquire_wait": self.acquire_wait.summary(),
+            "statements": {"hits": self.statement_hits, "misses": self.statement_misses},
+            "queries": {name: h.summary() for name, h in self.query_latency.items()},
+        }
+
+    def register_metrics(self, metrics: Registry):
+        # Mavjud histogrammalar to'g'ridan-to'g'ri ulanadi, so'rov yo'liga qo'shimcha ish yo'q
+        metrics.histogram("db_query_seconds", "SQL so'rov vaqti", "query", children=self.query_latency)
+        metrics.histogram("db_acquire_seconds", "Pooldan ulanish olishni kutish",
+                          children={None: self.acquire_wait})
+        metrics.gauge("db_query_errors_total", "Xato bilan tugagan SQL so'rovlar",
+                      lambda: dict(self.query_errors), "query", kind="counter")
+        metrics.gauge("db_statement_cache_total", "Prepared statement keshi",
+                      lambda: {"hit": self.statement_hits, "miss": self.statement_misses},
+                      "result", kind="counter")
+        metrics.gauge("db_pool_connections", "Pooldagi ulanishlar",
+                      lambda: self.stats()["pool"], "kind")
+
+    def slow_queries(self, limit: int = 10) -> list[tuple[str, dict]]:
+        # p99 bo'yicha eng sekin so'rovlar
+        summaries = [(name, h.summary()) for name, h in self.query_latency.items()]
+        return sorted(summaries, key=lambda item: item[1]["p99"], reverse=True)[:limit]
+
+    # --- SXEMA MIGRATSIYALARI ---
+    # Sxema versiyasi schema_version jadvalida: ishga tushishda bitta so'rov bilan tekshiriladi,
+    # joriy bo'lsa hech qanday DDL bajarilmaydi. Migratsiyalar SCHEMA_MIGRATIONS da.
     async def create_tables(self):
-        async with self.pool.acquire() as connection:
-            # 1. Adminlar
-            await connection.execute("""
-                CREATE TABLE IF NOT EXISTS admins (
-                    user_id BIGINT PRIMARY KEY
-                );
-            """)
-            # 2. Kanallar
-            await connection.execute("""
-                CREATE TABLE IF NOT EXISTS channels (
-                    channel_type VARCHAR(50) PRIMARY KEY,
-                    channel_id BIGINT
-                );
+        async with self._connection() as conn:
+            if await self._schema_version(conn) < SCHEMA_VERSION:
+                await self._migrate(conn)
+            # Kelgusi oylar bo'limlari sxema versiyasiga bog'liq emas - har safar tekshiriladi
+            await self._ensure_partitions(conn)
+
+    async def _schema_version(self, conn) -> int:
+        try:
+            return await conn.fetchval("SELECT coalesce(max(version), 0) FROM schema_version")
+        except asyncpg.UndefinedTableError:
+            return 0
+
+    async def _migrate(self, conn):
+        # Bir nechta jarayon birdan ishga tushsa migratsiyani bittasi bajaradi. Qulf bloklanadigan
+        # so'rov bilan kutilmaydi: kutayotgan so'rovning snapshot'i CREATE INDEX CONCURRENTLY ni to'xtatadi.
+        while not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext('schema_migrations'))"):
+            await asyncio.sleep(0.5)
+        try:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
             """)
-            # 3. E'lonlar
-            await connection.execute("""
-                CREATE TABLE IF NOT EXISTS ads (
-                    code VARCHAR(50) PRIMARY KEY,
-                    data JSONB
-                );
+            current = await self._schema_version(conn)
+            record = "INSERT INTO schema_version (version, name) VALUES ($1, $2)"
+            for version, name, apply, transactional in SCHEMA_MIGRATIONS:
+                if version <= current:
+                    continue
+                start = time.perf_counter()
+                if transactional:
+                    async with conn.transaction():
+                        await apply(self, conn)
+                        await conn.execute(record, version, name)
+                else:
+                    # O'z qisqa tranzaksiyalari bor va qayta bajarilsa xavfsiz
+                    await apply(self, conn)
+                    await conn.execute(record, version, name)
+                logging.info(f"Migratsiya {version} ({name}) qo'llandi: {time.perf_counter() - start:.2f}s")
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(hashtext('schema_migrations'))")
+
+    # Versiya 1 gacha sxema IF NOT EXISTS bilan har ishga tushishda yaratilar edi, shuning uchun
+    # birinchi migratsiyalar ham qayta bajarilsa xavfsiz - eski bazalar shular orqali o'tadi.
+    async def _schema_base(self, conn):
+        # 1. Adminlar
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS admins (
+                user_id BIGINT PRIMARY KEY
+            );
+        """)
+        # 2. Kanallar
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS channels (
+                channel_type VARCHAR(50) PRIMARY KEY,
+                channel_id BIGINT
+            );
+        """)
+        # 3. E'lonlar (created_at bo'yicha oylik bo'limlar)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS ads (
+                code VARCHAR(50) NOT NULL,
+                data JSONB,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                approved_by BIGINT,
+                PRIMARY KEY (code, created_at)
+            ) PARTITION BY RANGE (created_at);
+        """)
+        # 4. SOZLAMALAR (Yangi: To'lov ma'lumotlari uchun)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS settings (
+                key VARCHAR(50) PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        # 5. Moderatsiyani kutayotgan e'lonlar
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS pending_ads (
+                temp_id VARCHAR(50) PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                data JSONB NOT NULL,
+                check_id TEXT,
+                video_id TEXT,
+                admin_text TEXT,
+                admin_photo TEXT,
+                status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            CREATE INDEX IF NOT EXISTS pending_ads_status_idx ON pending_ads (status, created_at);
+            CREATE INDEX IF NOT EXISTS pending_ads_created_idx ON pending_ads (created_at);
+            -- Moderatsiya navbati: e'lonni olgan admin va lease muddati
+            ALTER TABLE pending_ads ADD COLUMN IF NOT EXISTS claimed_by BIGINT;
+            ALTER TABLE pending_ads ADD COLUMN IF NOT EXISTS claimed_until TIMESTAMPTZ;
+        """)
+        # 6. E'lon kodlari ketma-ketligi (eski tasodifiy kodlardan keyin boshlanadi)
+        await conn.execute("""
+            CREATE SEQUENCE IF NOT EXISTS ad_code_seq;
+            SELECT setval('ad_code_seq', COALESCE(
+                (SELECT MAX(substring(code FROM '^E-([0-9]+)$')::bigint) FROM ads), 0) + 1, false)
+            WHERE NOT (SELECT is_called FROM ad_code_seq);
+        """)
+        # 7. FSM holatlari
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS fsm_states (
+                key VARCHAR(255) PRIMARY KEY,
+                state VARCHAR(255),
+                data JSONB NOT NULL DEFAULT '{}',
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """)
+        # 8. Outbox: tasdiqlashdan keyingi Telegram ishlari (kanalga joylash, xabar berish).
+        # run_at - ish qachon olinishi mumkin; olingan ish lease muddatiga suriladi.
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id BIGSERIAL PRIMARY KEY,
+                kind VARCHAR(50) NOT NULL,
+                dedup_key VARCHAR(255) UNIQUE,
+                payload JSONB NOT NULL,
+                progress JSONB NOT NULL DEFAULT '{}',
+                status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                attempts INT NOT NULL DEFAULT 0,
+                last_error TEXT,
+                run_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            CREATE INDEX IF NOT EXISTS outbox_due_idx ON outbox (run_at) WHERE status = 'pending';
+        """)
+        # 9. Botdan foydalanganlar (broadcast uchun)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id BIGINT PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                role TEXT,
+                is_active BOOLEAN NOT NULL DEFAULT true,
+                first_seen TIMESTAMPTZ NOT NULL DEFAULT now(),
+                last_seen TIMESTAMPTZ NOT NULL DEFAULT now(),
+                blocked_at TIMESTAMPTZ
+            );
+            CREATE INDEX IF NOT EXISTS users_active_idx ON users (user_id) WHERE is_active;
+        """)
+
+    async def _schema_ads_search(self, conn):
+        # E'lonlar bo'yicha to'liq matnli qidiruv va facet indekslari. Generated STORED ustun har bir
+        # bo'limni qulf ostida qayta yozardi, shuning uchun: nullable ustun (faqat katalog o'zgaradi),
+        # yangi qatorlarni trigger to'ldiradi, eskilari partiyalab, indekslar bo'limma-bo'lim CONCURRENTLY.
+        # Versiyalashdan oldingi bazalarda search_tsv generated ustun bo'lishi mumkin - u allaqachon to'la.
+        generated = await conn.fetchval("""
+            SELECT attgenerated <> '' FROM pg_attribute
+            WHERE attrelid = 'ads'::regclass AND attname = 'search_tsv' AND NOT attisdropped
+        """)
+        if not generated:
+            async with conn.transaction():
+                await conn.execute("""
+                    ALTER TABLE ads ADD COLUMN IF NOT EXISTS search_tsv tsvector;
+                    CREATE OR REPLACE FUNCTION ads_search_document(data jsonb) RETURNS tsvector
+                    LANGUAGE sql IMMUTABLE AS $$
+                        SELECT setweight(to_tsvector('simple', coalesce(data->>'mahorat', '')), 'A') ||
+                               setweight(to_tsvector('simple', coalesce(data->>'hudud', '')), 'B') ||
+                               setweight(to_tsvector('simple', coalesce(data->>'qosimcha', '')), 'C') ||
+                               setweight(to_tsvector('simple', coalesce(data->>'fish', '')), 'D')
+                    $$;
+                    CREATE OR REPLACE FUNCTION ads_search_tsv() RETURNS trigger LANGUAGE plpgsql AS $$
+                    BEGIN
+                        NEW.search_tsv := ads_search_document(NEW.data);
+                        RETURN NEW;
+                    END $$;
+                    CREATE OR REPLACE TRIGGER ads_search_tsv BEFORE INSERT OR UPDATE OF data ON ads
+                        FOR EACH ROW EXECUTE FUNCTION ads_search_tsv();
+                """)
+            await self._backfill_ads(conn, {"search_tsv": "ads_search_document(data)"}, "search_tsv IS NULL")
+        await self._create_ads_index(conn, "ads_search_idx", "USING GIN (search_tsv)")
+        await self._create_ads_index(conn, "ads_jinsi_idx", "((data->>'jinsi'))")
+        await self._create_ads_index(conn, "ads_role_idx", "((data->>'role'))")
+
+    async def _backfill_ads(self, conn, columns: dict[str, str], missing: str, batch: int = MIGRATION_BATCH):
+        # columns: ustun -> data dan hisoblash ifodasi. (code, created_at) bo'yicha keyset bilan
+        # partiyalab yangilanadi, har partiya o'z qisqa tranzaksiyasida - yozishlar faqat shu qatorlarda
+        # kutadi. missing - hali to'ldirilmagan qator sharti: qayta ishga tushsa bajarilgani o'tkaziladi.
+        targets, values = ", ".join(columns), ", ".join(columns.values())
+        sql = f"""
+            WITH batch AS (
+                SELECT code, created_at FROM ads
+                WHERE (code, created_at) > ($1, $2)
+                ORDER BY code, created_at LIMIT $3
+            ), updated AS (
+                UPDATE ads a SET ({targets}) = ROW({values})
+                FROM batch b
+                WHERE a.code = b.code AND a.created_at = b.created_at AND {missing}
+                RETURNING 1
+            )
+            SELECT code, created_at, (SELECT count(*) FROM updated) AS updated
+            FROM batch ORDER BY code DESC, created_at DESC LIMIT 1
+        """
+        last, total = ("", datetime.min.replace(tzinfo=timezone.utc)), 0
+        while (row := await conn.fetchrow(sql, *last, batch)) is not None:
+            last = (row['code'], row['created_at'])
+            total += row['updated']
+        logging.info(f"ads.{targets}: {total} ta qator to'ldirildi")
+
+    async def _create_ads_index(self, conn, name: str, definition: str):
+        # Bo'lingan jadvalga CREATE INDEX CONCURRENTLY yo'q. Ota indeks ON ONLY bilan bo'sh (yaroqsiz)
+        # yaratiladi, har bir bo'limniki CONCURRENTLY qurilib unga ulanadi; oxirgisi ulanganda ota
+        # indeks yaroqli bo'ladi, keyin yaratiladigan bo'limlar uni o'zi oladi.
+        await conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY ads {definition}")
+        partitions = await conn.fetch("""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'ads'::regclass AND NOT EXISTS (
+                SELECT 1 FROM pg_inherits x JOIN pg_index ix ON ix.indexrelid = x.inhrelid
+                WHERE x.inhparent = $1::regclass AND ix.indrelid = c.oid
+            )
+        """, name)
+        suffix = name.removeprefix("ads_")
+        for row in partitions:
+            index = f"{row['relname']}_{suffix}"
+            # Uzilib qolgan CONCURRENTLY yaroqsiz indeks qoldiradi - IF NOT EXISTS uni o'tkazib yuborardi
+            if await conn.fetchval("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1)",
+                                   index):
+                await conn.execute(f"DROP INDEX CONCURRENTLY {index}")
+            await conn.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {row['relname']} {definition}")
+            await conn.execute(f"ALTER INDEX {name} ATTACH PARTITION {index}")
+
+    async def _schema_ad_stats(self, conn):
+        # Statistika: kun x hudud x jinsi x turi bo'yicha rollup va umumiy jami.
+        # approve/reject so'rovining o'zida yangilanadi, ads skanerlanmaydi.
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS ad_stats_daily (
+                day DATE NOT NULL,
+                hudud TEXT NOT NULL,
+                jinsi TEXT NOT NULL,
+                role TEXT NOT NULL,
+                approved INTEGER NOT NULL DEFAULT 0,
+                rejected INTEGER NOT NULL DEFAULT 0,
+                revenue BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, hudud, jinsi, role)
+            );
+            CREATE TABLE IF NOT EXISTS ad_stats_total (
+                hudud TEXT NOT NULL,
+                jinsi TEXT NOT NULL,
+                role TEXT NOT NULL,
+                approved INTEGER NOT NULL DEFAULT 0,
+                rejected INTEGER NOT NULL DEFAULT 0,
+                revenue BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (hudud, jinsi, role)
+            );
+        """)
+        await self._backfill_stats(conn)
+
+    async def _schema_ad_signatures(self, conn):
+        # O'xshash e'lonlar indeksi uchun MinHash/LSH signaturalari (dedup.py).
+        # id bo'yicha ketma-ket o'qiladi: jarayonlar faqat yangi qatorlarni oladi.
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS ad_signatures (
+                id BIGSERIAL PRIMARY KEY,
+                code VARCHAR(50) NOT NULL UNIQUE,
+                sketch BYTEA NOT NULL
+            );
+        """)
+
+    async def _schema_ads_columns(self, conn):
+        # Filtrlanadigan maydonlar data dan alohida ustunlarga chiqariladi; ifoda indekslari
+        # (data->>'jinsi', data->>'role') o'rniga ustun indekslari. Migratsiya 3 dagi kabi onlayn:
+        # nullable ustunlar, yangi qatorlarni trigger to'ldiradi (yozuvchilar o'zgarmaydi),
+        # eskilari partiyalab, indekslar bo'limma-bo'lim CONCURRENTLY.
+        async with conn.transaction():
+            await conn.execute("""
+                ALTER TABLE ads
+                    ADD COLUMN IF NOT EXISTS jinsi TEXT,
+                    ADD COLUMN IF NOT EXISTS role TEXT,
+                    ADD COLUMN IF NOT EXISTS hudud TEXT,
+                    ADD COLUMN IF NOT EXISTS tel TEXT;
+                CREATE OR REPLACE FUNCTION ads_columns() RETURNS trigger LANGUAGE plpgsql AS $$
+                BEGIN
+                    NEW.jinsi := NEW.data->>'jinsi';
+                    NEW.role := NEW.data->>'role';
+                    NEW.hudud := NEW.data->>'hudud';
+                    NEW.tel := NEW.data->>'tel';
+                    RETURN NEW;
+                END $$;
+                CREATE OR REPLACE TRIGGER ads_columns BEFORE INSERT OR UPDATE OF data ON ads
+                    FOR EACH ROW EXECUTE FUNCTION ads_columns();
             """)
-            # 4. SOZLAMALAR (Yangi: To'lov ma'lumotlari uchun)
-            await connection.execute("""
-                CREATE TABLE IF NOT EXISTS settings (
-                    key VARCHAR(50) PRIMARY KEY,
-                    value TEXT
-                );
+        columns = {name: f"data->>'{name}'" for name in ("jinsi", "role", "hudud", "tel")}
+        await self._backfill_ads(conn, columns, "jinsi IS NULL AND role IS NULL AND hudud IS NULL AND tel IS NULL")
+        await self._create_ads_index(conn, "ads_jinsi_role_idx", "(jinsi, role)")
+        await self._create_ads_index(conn, "ads_hudud_idx", "(hudud)")
+        await self._create_ads_index(conn, "ads_tel_idx", "(tel)")
+        # Bo'lingan indeksni CONCURRENTLY o'chirib bo'lmaydi; DROP faqat katalogni o'zgartiradi
+        await conn.execute("""
+            DROP INDEX IF EXISTS ads_jinsi_idx, ads_role_idx;
+            DROP INDEX IF EXISTS ads_legacy_jinsi_idx, ads_legacy_role_idx;
+        """)
+
+    async def _schema_ads_publish_error(self, conn):
+        # Tasdiqlangan, lekin kanalga joylanmagan e'lon (outbox ishi "failed"). Nullable ustun -
+        # bo'limlar qayta yozilmaydi.
+        await conn.execute("ALTER TABLE ads ADD COLUMN IF NOT EXISTS publish_error TEXT")
+
+    async def _backfill_stats(self, conn):
+        # Statistika jadvallari paydo bo'lishidan oldingi e'lonlar bir marta hisoblanadi.
+        # Daromad o'sha paytdagi narx noma'lum bo'lgani uchun joriy narx bo'yicha olinadi.
+        # Belgi (stats_backfilled) schema_version dan oldin to'ldirilgan bazalar uchun.
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('ad_stats_backfill'))")
+            if await conn.fetchval("SELECT 1 FROM settings WHERE key = 'stats_backfilled'"):
+                return
+            price = parse_price(await conn.fetchval("SELECT value FROM settings WHERE key = 'price'"))
+            await conn.execute(f"""
+                WITH delta AS (
+                    SELECT day, coalesce(data->>'hudud', '') AS hudud, coalesce(data->>'jinsi', '') AS jinsi,
+                           coalesce(data->>'role', '') AS role, approved, rejected, approved * $2::bigint AS revenue
+                    FROM (
+                        SELECT (created_at AT TIME ZONE $1)::date AS day, data, 1 AS approved, 0 AS rejected
+                        FROM ads
+                        UNION ALL
+                        SELECT (created_at AT TIME ZONE $1)::date, data, 0, 1
+                        FROM pending_ads WHERE status = 'rejected'
+                    ) src
+                ), daily AS (
+                    SELECT day, hudud, jinsi, role, sum(approved)::int AS approved,
+                           sum(rejected)::int AS rejected, sum(revenue)::bigint AS revenue
+                    FROM delta GROUP BY 1, 2, 3, 4
+                ), day_stats AS (
+                    INSERT INTO ad_stats_daily SELECT * FROM daily
+                    ON CONFLICT DO NOTHING
+                )
+                INSERT INTO ad_stats_total
+                SELECT hudud, jinsi, role, sum(approved), sum(rejected), sum(revenue)
+                FROM daily GROUP BY 1, 2, 3
+                ON CONFLICT DO NOTHING
+            """, STATS_TIMEZONE, price)
+            await conn.execute("INSERT INTO settings (key, value) VALUES ('stats_backfilled', '1')")
+
+    async def _migrate_ads(self, conn):
+        # Eski jadval butunligicha "ads_legacy" bo'limi bo'lib qoladi - ma'lumot ko'chirilmaydi.
+        # Uzoq ishlar (indeks, CHECK tekshiruvi) yozishlarni to'xtatmaydigan qulflar bilan,
+        # jadvallarni almashtirish esa bitta qisqa tranzaksiyada bajariladi.
+        # Boshqa jarayonlardan _migrate dagi qulf himoya qiladi.
+        if await conn.fetchval("SELECT relkind::text FROM pg_class WHERE oid = 'ads'::regclass") != "r":
+            return
+        boundary = _month_start(datetime.now(timezone.utc)).isoformat()
+        logging.info("ads jadvali oylik bo'limlarga o'tkazilmoqda...")
+        # Doimiy DEFAULT li ustun qo'shish jadvalni qayta yozmaydi
+        await conn.execute(f"""
+            ALTER TABLE ads ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL
+                DEFAULT '{LEGACY_CREATED_AT}';
+            ALTER TABLE ads ADD COLUMN IF NOT EXISTS approved_by BIGINT;
+        """)
+        await conn.execute("""
+            CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ads_code_created_idx ON ads (code, created_at)
+        """)
+        await conn.execute(f"""
+            ALTER TABLE ads DROP CONSTRAINT IF EXISTS ads_legacy_range;
+            ALTER TABLE ads ADD CONSTRAINT ads_legacy_range CHECK (created_at < '{boundary}') NOT VALID;
+        """)
+        await conn.execute("ALTER TABLE ads VALIDATE CONSTRAINT ads_legacy_range")
+        # CHECK va (code, created_at) indeksi tayyor - ATTACH jadvalni skanerlamaydi va
+        # indeks qurmaydi (ota jadvaldagi PRIMARY KEY ga bo'limda ham PRIMARY KEY mos keladi)
+        async with conn.transaction():
+            await conn.execute(f"""
+                ALTER TABLE ads RENAME TO ads_legacy;
+                ALTER TABLE ads_legacy DROP CONSTRAINT IF EXISTS ads_pkey;
+                ALTER TABLE ads_legacy ADD CONSTRAINT ads_legacy_pkey
+                    PRIMARY KEY USING INDEX ads_code_created_idx;
+                ALTER INDEX IF EXISTS ads_search_idx RENAME TO ads_legacy_search_idx;
+                ALTER INDEX IF EXISTS ads_jinsi_idx RENAME TO ads_legacy_jinsi_idx;
+                ALTER INDEX IF EXISTS ads_role_idx RENAME TO ads_legacy_role_idx;
+                CREATE TABLE ads (LIKE ads_legacy INCLUDING DEFAULTS INCLUDING GENERATED)
+                    PARTITION BY RANGE (created_at);
+                ALTER TABLE ads ALTER COLUMN created_at SET DEFAULT now();
+                ALTER TABLE ads ADD PRIMARY KEY (code, created_at);
+                ALTER TABLE ads ATTACH PARTITION ads_legacy FOR VALUES FROM (MINVALUE) TO ('{boundary}');
             """)
+        logging.info("ads jadvali bo'limlarga o'tkazildi.")
+
+    async def _ensure_partitions(self, conn, ahead: int = ADS_PARTITIONS_AHEAD) -> list[str]:
+        month = _month_start(datetime.now(timezone.utc))
+        bounds = {}
+        for i in range(ahead + 1):
+            start = _add_months(month, i)
+            bounds[f"ads_{start:%Y_%m}"] = (start, _add_months(month, i + 1))
+        # Hammasi bor bo'lsa (odatda shunday) - bitta so'rov
+        missing = await conn.fetchval(
+            "SELECT array(SELECT n FROM unnest($1::text[]) n WHERE to_regclass(n) IS NULL)", list(bounds)
+        )
+        created = []
+        for name in missing:
+            start, end = bounds[name]
+            try:
+                await conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {name} PARTITION OF ads
+                    FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')
+                """)
+                created.append(name)
+            except asyncpg.PostgresError as e:
+                # Boshqa jarayon ayni paytda yaratgan yoki ads_legacy bilan kesishadi
+                logging.warning(f"{name} bo'limi yaratilmadi: {e}")
+        return created
+
+    async def _detach_old_partitions(self, conn, retention: int = ADS_RETENTION_MONTHS) -> list[str]:
+        if retention <= 0:
+            return []
+        cutoff = _add_months(_month_start(datetime.now(timezone.utc)), -retention)
+        rows = await conn.fetch("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) AS bound
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'ads'::regclass
+        """)
+        detached = []
+        for row in rows:
+            match = re.search(r"TO \('(\d{4}-\d{2}-\d{2})", row['bound'])
+            if not match:
+                continue
+            upper = datetime.fromisoformat(match.group(1)).replace(tzinfo=timezone.utc)
+            if upper <= cutoff:
+                # Jadval alohida saqlanib qoladi (zaxiralash yoki o'chirish - qo'lda)
+                await conn.execute(f"ALTER TABLE ads DETACH PARTITION {row['relname']} CONCURRENTLY")
+                detached.append(row['relname'])
+        return detached
+
+    async def maintain_partitions(self):
+        async with self._connection() as conn:
+            created = await self._ensure_partitions(conn)
+            detached = await self._detach_old_partitions(conn)
+        if created or detached:
+            logging.info(f"ads bo'limlari: yaratildi {created}, ajratildi {detached}")
+
+    async def maintenance_loop(self, interval: int = 6 * 3600):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.maintain_partitions()
+            except Exception as e:
+                logging.error(f"Bo'limlarga xizmat ko'rsatishda xatolik: {e}")
 
     async def close(self):
+        self._closing = True
+        if self._listener:
+            await self._listener.close()
         if self.pool:
             await self.pool.close()
 
+    # --- SOZLAMALAR O'ZGARISHINI TINGLASH (LISTEN/NOTIFY) ---
+    async def listen_config(self, callback):
+        # callback(key) - o'zgargan kalit ('admins', 'channels:erkak', 'settings:card')
+        # yoki None (ulanish uzilib qolgan, hammasini qayta yuklash kerak)
+        self._config_callback = callback
+        await self._connect_listener()
+
+    async def _connect_listener(self):
+        conn = await asyncpg.connect(dsn=DATABASE_URL)
+        await conn.add_listener(CONFIG_CHANNEL, self._on_notify)
+        conn.add_termination_listener(self._on_listener_lost)
+        self._listener = conn
+
+    def _spawn_listener_task(self, coro):
+        task = asyncio.create_task(coro)
+        self._listener_tasks.add(task)
+        task.add_done_callback(self._listener_tasks.discard)
+
+    def _on_notify(self, conn, pid, channel, payload):
+        self._spawn_listener_task(self._config_callback(payload))
+
+    def _on_listener_lost(self, conn):
+        if not self._closing:
+            logging.warning("LISTEN ulanishi uzildi, qayta ulanilmoqda...")
+            self._spawn_listener_task(self._reconnect_listener())
+
+    async def _reconnect_listener(self):
+        delay = 1
+        while not self._closing:
+            try:
+                await self._connect_listener()
+                # Uzilish paytidagi xabarlar yo'qolgan bo'lishi mumkin
+                await self._config_callback(None)
+                return
+            except Exception as e:
+                logging.error(f"LISTEN qayta ulanmadi: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
     # --- ADMINLAR ---
     async def add_admin(self, user_id: int):
-        async with self.pool.acquire() as conn:
-            await conn.execute("INSERT INTO admins (user_id) VALUES ($1) ON CONFLICT DO NOTHING", user_id)
+        await self._execute("add_admin", f"""
+            WITH changed AS (
+                INSERT INTO admins (user_id) VALUES ($1) ON CONFLICT DO NOTHING RETURNING 1
+            )
+            SELECT pg_notify('{CONFIG_CHANNEL}', 'admins') FROM changed
+        """, user_id)
 
     async def remove_admin(self, user_id: int):
-        async with self.pool.acquire() as conn:
-            await conn.execute("DELETE FROM admins WHERE user_id = $1", user_id)
+        await self._execute("remove_admin", f"""
+            WITH changed AS (DELETE FROM admins WHERE user_id = $1 RETURNING 1)
+            SELECT pg_notify('{CONFIG_CHANNEL}', 'admins') FROM changed
+        """, user_id)
 
     async def get_admins(self):
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch("SELECT user_id FROM admins")
-            return [row['user_id'] for row in rows]
+        rows = await self._fetch("get_admins", "SELECT user_id FROM admins")
+        return [row['user_id'] for row in rows]
 
     # --- KANALLAR ---
     async def set_channel(self, channel_type: str, channel_id: int):
-        async with self.pool.acquire() as conn:
-            await conn.execute("""
+        await self._execute("set_channel", f"""
+            WITH changed AS (
                 INSERT INTO channels (channel_type, channel_id) 
                 VALUES ($1, $2) 
                 ON CONFLICT (channel_type) 
                 DO UPDATE SET channel_id = $2
-            """, channel_type, channel_id)
+                RETURNING channel_type
+            )
+            SELECT pg_notify('{CONFIG_CHANNEL}', 'channels:' || channel_type) FROM changed
+        """, channel_type, channel_id)
+
+    async def get_channel(self, channel_type: str):
+        return await self._fetchval(
+            "get_channel", "SELECT channel_id FROM channels WHERE channel_type = $1", channel_type
+        )
 
     async def get_channels(self):
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch("SELECT channel_type, channel_id FROM channels")
-            return {row['channel_type']: row['channel_id'] for row in rows}
+        rows = await self._fetch("get_channels", "SELECT channel_type, channel_id FROM channels")
+        return {row['channel_type']: row['channel_id'] for row in rows}
 
     # --- SOZLAMALAR (PAYMENT) ---
     async def set_setting(self, key: str, value: str):
-        async with self.pool.acquire() as conn:
-            await conn.execute("""
+        await self._execute("set_setting", f"""
+            WITH changed AS (
                 INSERT INTO settings (key, value) 
                 VALUES ($1, $2) 
                 ON CONFLICT (key) 
                 DO UPDATE SET value = $2
-            """, key, value)
+                RETURNING key
+            )
+            SELECT pg_notify('{CONFIG_CHANNEL}', 'settings:' || key) FROM changed
+        """, key, value)
+
+    async def get_setting(self, key: str):
+        return await self._fetchval("get_setting", "SELECT value FROM settings WHERE key = $1", key)
 
     async def get_settings(self):
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch("SELECT key, value FROM settings")
-            return {row['key']: row['value'] for row in rows}
+        rows = await self._fetch("get_settings", "SELECT key, value FROM settings")
+        return {row['key']: row['value'] for row in rows}
+
+    async def bootstrap_config(self, admin_id: int, channels: dict[str, int],
+                               defaults: dict[str, str]) -> tuple[list[int], dict[str, int], dict[str, str]]:
+        # Ishga tushishda: bazada yo'q admin, kanal va sozlamalar env qiymatlari bilan yoziladi,
+        # hammasi bitta so'rovda qaytariladi. CTE dagi INSERT lar shu so'rovning o'qishlariga
+        # ko'rinmaydi, shuning uchun yangi qatorlar RETURNING orqali qo'shiladi.
+        row = await self._fetchrow("bootstrap_config", """
+            WITH new_admin AS (
+                INSERT INTO admins (user_id) VALUES ($1) ON CONFLICT DO NOTHING RETURNING user_id
+            ), new_channels AS (
+                INSERT INTO channels (channel_type, channel_id)
+                SELECT * FROM unnest($2::text[], $3::bigint[])
+                ON CONFLICT DO NOTHING RETURNING channel_type, channel_id
+            ), new_settings AS (
+                INSERT INTO settings (key, value)
+                SELECT * FROM unnest($4::text[], $5::text[])
+                ON CONFLICT DO NOTHING RETURNING key, value
+            )
+            SELECT
+                array(SELECT user_id FROM admins UNION SELECT user_id FROM new_admin) AS admins,
+                (SELECT coalesce(jsonb_object_agg(channel_type, channel_id), '{}')
+                 FROM (SELECT channel_type, channel_id FROM channels
+                       UNION ALL SELECT * FROM new_channels) c) AS channels,
+                (SELECT coalesce(jsonb_object_agg(key, value), '{}')
+                 FROM (SELECT key, value FROM settings UNION ALL SELECT * FROM new_settings) s) AS settings
+        """, admin_id, list(channels), list(channels.values()), list(defaults), list(defaults.values()))
+        return list(row['admins']), row['channels'], row['settings']
+
+    # --- FSM ---
+    async def get_fsm(self, key: str):
+        row = await self._fetchrow("get_fsm", "SELECT state, data FROM fsm_states WHERE key = $1", key)
+        if row:
+            return row['state'], row['data']
+        return None
+
+    async def save_fsm(self, records: list[tuple[str, str | None, dict]]):
+        # records: (key, state, data) - hammasi bitta UPSERT bilan
+        keys, states, datas = zip(*records)
+        await self._execute("save_fsm", """
+            INSERT INTO fsm_states (key, state, data, updated_at)
+            SELECT k, s, d, now()
+            FROM unnest($1::text[], $2::text[], $3::jsonb[]) AS t(k, s, d)
+            ON CONFLICT (key)
+            DO UPDATE SET state = EXCLUDED.state, data = EXCLUDED.data, updated_at = now()
+        """, list(keys), list(states), list(datas))
 
     # --- E'LONLAR ---
     async def save_ad(self, code: str, data: dict):
-        data_json = json.dumps(data, ensure_ascii=False)
-        async with self.pool.acquire() as conn:
-            await conn.execute("INSERT INTO ads (code, data) VALUES ($1, $2)", code, data_json)
+        await self._execute("save_ad", "INSERT INTO ads (code, data) VALUES ($1, $2)", code, data)
+
+    async def reserve_codes(self, count: int) -> list[int]:
+        # Bitta so'rovda bir nechta kod raqamini band qilamiz
+        rows = await self._fetch(
+            "reserve_codes", "SELECT nextval('ad_code_seq') AS n FROM generate_series(1, $1)", count
+        )
+        return [row['n'] for row in rows]
 
     async def get_ad(self, code: str):
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow("SELECT data FROM ads WHERE code = $1", code)
-            if row:
-                return json.loads(row['data'])
+        # Aksariyat qidiruvlar yangi e'lonlarga: avval faqat oxirgi bo'limlar ko'riladi
+        # (now() bo'yicha bo'limlar ijro paytida kesiladi), topilmasa hammasi
+        row = await self._fetchrow("get_ad_recent", """
+            SELECT data FROM ads
+            WHERE code = $1 AND created_at >= date_trunc('month', now()) - make_interval(months => $2)
+        """, code, ADS_RECENT_MONTHS)
+        if row is None:
+            row = await self._fetchrow("get_ad", "SELECT data FROM ads WHERE code = $1", code)
+        if row:
+            return row['data']
+        return None
+
+    async def get_signatures_after(self, last_id: int, limit: int) -> list:
+        return await self._fetch("get_signatures_after", """
+            SELECT id, code, sketch FROM ad_signatures WHERE id > $1 ORDER BY id LIMIT $2
+        """, last_id, limit)
+
+    async def get_ads_without_signature(self, after: str, limit: int) -> list[tuple[str, dict]]:
+        rows = await self._fetch("get_ads_without_signature", """
+            SELECT a.code, a.data FROM ads a
+            WHERE a.code > $1 AND NOT EXISTS (SELECT 1 FROM ad_signatures s WHERE s.code = a.code)
+            ORDER BY a.code LIMIT $2
+        """, after, limit)
+        return [(row['code'], row['data']) for row in rows]
+
+    async def save_signatures(self, signatures: list[tuple[str, bytes]]):
+        codes, sketches = zip(*signatures) if signatures else ((), ())
+        await self._execute("save_signatures", """
+            INSERT INTO ad_signatures (code, sketch)
+            SELECT * FROM unnest($1::text[], $2::bytea[])
+            ON CONFLICT (code) DO NOTHING
+        """, list(codes), list(sketches))
+
+    async def search_ads(self, query: str, jinsi: str | None = None, role: str | None = None,
+                         after: tuple[float, str] | None = None, limit: int = 5) -> list[dict]:
+        # Natijalar (rank, code) bo'yicha saralanadi; after - oldingi sahifaning oxirgi kaliti.
+        # So'rov faqat kerakli shartlar bilan yig'iladi, shunda indekslar ishlatiladi.
+        args = []
+        where = []
+        if query:
+            args.append(query)
+            tsquery = f"websearch_to_tsquery('simple', ${len(args)})"
+            rank = f"ts_rank(search_tsv, {tsquery})"
+            where.append(f"search_tsv @@ {tsquery}")
+        else:
+            rank = "0::real"
+        if jinsi:
+            args.append(jinsi)
+            where.append(f"jinsi = ${len(args)}")
+        if role:
+            args.append(role)
+            where.append(f"role = ${len(args)}")
+        sql = f"SELECT code, data, {rank} AS rank FROM ads"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if after:
+            args += [after[0], after[1]]
+            sql = f"SELECT * FROM ({sql}) t WHERE (rank, code) < (${len(args) - 1}::real, ${len(args)})"
+        args.append(limit)
+        sql += f" ORDER BY rank DESC, code DESC LIMIT ${len(args)}"
+        rows = await self._fetch("search_ads", sql, *args)
+        return [{"code": row['code'], "rank": row['rank'], "data": row['data']} for row in rows]
+
+    # --- KUTILAYOTGAN E'LONLAR ---
+    async def add_pending(self, temp_id: str, elon: dict, ttl: int = PENDING_TTL) -> int:
+        # Navbatda (bu e'londan oldin) kutib turgan bo'sh e'lonlar sonini qaytaradi
+        return await self._fetchval("add_pending", """
+            WITH ins AS (
+                INSERT INTO pending_ads (temp_id, user_id, data, check_id, video_id)
+                VALUES ($1, $2, $3, $4, $5)
+            )
+            SELECT count(*) FROM pending_ads
+            WHERE status = 'pending' AND created_at > now() - make_interval(secs => $6)
+              AND (claimed_until IS NULL OR claimed_until < now())
+        """, temp_id, elon["user_id"], elon["data"], elon.get("check_id"), elon.get("video_id"), ttl)
+
+    async def update_pending(self, temp_id: str, field: str, value: str) -> bool:
+        if field not in ("admin_text", "admin_photo"):
+            raise ValueError(f"Noto'g'ri maydon: {field}")
+        result = await self._execute(
+            "update_pending", f"UPDATE pending_ads SET {field} = $2 WHERE temp_id = $1 AND status = 'pending'",
+            temp_id, value
+        )
+        return result != "UPDATE 0"
+
+    async def get_pending(self, temp_id: str, ttl: int = PENDING_TTL):
+        row = await self._fetchrow("get_pending", """
+            SELECT * FROM pending_ads
+            WHERE temp_id = $1 AND status = 'pending'
+              AND created_at > now() - make_interval(secs => $2)
+        """, temp_id, ttl)
+        return _pending_from_row(row) if row else None
+
+    async def get_pending_all(self, ttl: int = PENDING_TTL):
+        rows = await self._fetch("get_pending_all", """
+            SELECT * FROM pending_ads
+            WHERE status = 'pending' AND created_at > now() - make_interval(secs => $1)
+            ORDER BY created_at
+        """, ttl)
+        return {row['temp_id']: _pending_from_row(row) for row in rows}
+
+    async def claim_pending(self, admin_id: int, lease: int = MODERATION_LEASE, ttl: int = PENDING_TTL,
+                            skip: str | None = None):
+        # Navbatdagi eng eski bo'sh e'lon (yoki adminning o'zida turgani) shu adminga beriladi.
+        # SKIP LOCKED: bir vaqtda bosgan adminlar bir-birini kutmaydi va bitta e'lonni olmaydi.
+        # skip - admin o'tkazib yuborgan e'lon: navbatga qaytariladi, unga qayta berilmaydi.
+        row = await self._fetchrow("claim_pending", """
+            WITH released AS (
+                UPDATE pending_ads SET claimed_by = NULL, claimed_until = NULL
+                WHERE temp_id = $4 AND claimed_by = $1 AND status = 'pending'
+            ), next AS (
+                SELECT temp_id FROM pending_ads
+                WHERE status = 'pending' AND created_at > now() - make_interval(secs => $3)
+                  AND (claimed_until IS NULL OR claimed_until < now() OR claimed_by = $1)
+                  AND temp_id IS DISTINCT FROM $4
+                ORDER BY coalesce(claimed_by = $1 AND claimed_until >= now(), false) DESC, created_at
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE pending_ads p SET claimed_by = $1, claimed_until = now() + make_interval(secs => $2)
+            FROM next WHERE p.temp_id = next.temp_id
+            RETURNING p.*, (
+                SELECT count(*) FROM pending_ads q
+                WHERE q.status = 'pending' AND q.created_at > now() - make_interval(secs => $3)
+                  AND (q.claimed_until IS NULL OR q.claimed_until < now()) AND q.temp_id <> p.temp_id
+            ) AS queue_left
+        """, admin_id, lease, ttl, skip)
+        if row is None:
+            return None, None, 0
+        return row['temp_id'], _pending_from_row(row), row['queue_left']
+
+    async def pending_queue_depth(self, ttl: int = PENDING_TTL) -> tuple[int, int]:
+        # (bo'sh, admin ko'rib chiqayotgan)
+        row = await self._fetchrow("pending_queue_depth", """
+            SELECT count(*) FILTER (WHERE claimed_until IS NULL OR claimed_until < now()) AS free,
+                   count(*) FILTER (WHERE claimed_until >= now()) AS claimed
+            FROM pending_ads
+            WHERE status = 'pending' AND created_at > now() - make_interval(secs => $1)
+        """, ttl)
+        return row['free'], row['claimed']
+
+    async def finish_pending(self, temp_id: str, status: str, by: int | None = None):
+        # Faqat bitta jarayon 'pending' holatini o'zgartira oladi; rad etish statistikaga ham yoziladi.
+        # by - hal qilayotgan admin: e'lonni boshqa admin olgan bo'lsa (lease tugamagan) o'zgarmaydi.
+        row = await self._fetchrow("finish_pending", """
+            WITH done AS (
+                UPDATE pending_ads SET status = $2
+                WHERE temp_id = $1 AND status = 'pending'
+                  AND ($4::bigint IS NULL OR claimed_by IS NULL OR claimed_by = $4 OR claimed_until < now())
+                RETURNING *
+            ), delta AS (
+                SELECT coalesce(data->>'hudud', '') AS hudud, coalesce(data->>'jinsi', '') AS jinsi,
+                       coalesce(data->>'role', '') AS role, 0 AS approved, 1 AS rejected, 0::bigint AS revenue
+                FROM done WHERE $2 = 'rejected'
+            ), """ + _STATS_ROLLUP.format(tz="$3") + """
+            SELECT * FROM done
+        """, temp_id, status, STATS_TIMEZONE, by)
+        return _pending_from_row(row) if row else None
+
+    async def approve_pending(self, temp_id: str, code: str, data: dict,
+                              jobs: list[tuple[str, str, dict]], approved_by: int | None = None,
+                              revenue: int = 0, signature: bytes | None = None) -> bool:
+        # Bitta so'rov = bitta tranzaksiya: holat, e'lon, statistika, signatura va outbox ishlari
+        # birga yoziladi.
+        # jobs: (kind, dedup_key, payload). Boshqa admin ulgurgan yoki e'lon boshqa adminning
+        # navbatida bo'lsa hech narsa yozilmaydi.
+        kinds, keys, payloads = zip(*jobs) if jobs else ((), (), ())
+        approved = await self._fetchval("approve_pending", """
+            WITH done AS (
+                UPDATE pending_ads SET status = 'approved'
+                WHERE temp_id = $1 AND status = 'pending'
+                  AND (claimed_by IS NULL OR claimed_by = $7 OR claimed_until < now())
+                RETURNING temp_id
+            ), ad AS (
+                INSERT INTO ads (code, data, approved_by) SELECT $2, $3::jsonb, $7 FROM done
+            ), jobs AS (
+                INSERT INTO outbox (kind, dedup_key, payload)
+                SELECT k, d, p FROM done, unnest($4::text[], $5::text[], $6::jsonb[]) AS t(k, d, p)
+                ON CONFLICT (dedup_key) DO NOTHING
+            ), sig AS (
+                INSERT INTO ad_signatures (code, sketch) SELECT $2, $10::bytea FROM done WHERE $10 IS NOT NULL
+                ON CONFLICT (code) DO NOTHING
+            ), delta AS (
+                SELECT coalesce($3::jsonb->>'hudud', '') AS hudud, coalesce($3::jsonb->>'jinsi', '') AS jinsi,
+                       coalesce($3::jsonb->>'role', '') AS role, 1 AS approved, 0 AS rejected, $8::bigint AS revenue
+                FROM done
+            ), """ + _STATS_ROLLUP.format(tz="$9") + """
+            SELECT count(*) FROM done
+        """, temp_id, code, data, list(kinds), list(keys), list(payloads), approved_by, revenue,
+            STATS_TIMEZONE, signature)
+        return approved > 0
+
+    async def expire_pending(self, ttl: int = PENDING_TTL) -> int:
+        result = await self._execute("expire_pending", """
+            UPDATE pending_ads SET status = 'expired'
+            WHERE status = 'pending' AND created_at <= now() - make_interval(secs => $1)
+        """, ttl)
+        return int(result.split()[-1])
+
+    # --- OUTBOX ---
+    async def claim_jobs(self, limit: int, lease: float) -> list[dict]:
+        rows = await self._fetch("claim_jobs", """
+            UPDATE outbox SET attempts = attempts + 1, run_at = now() + make_interval(secs => $2)
+            WHERE id IN (
+                SELECT id FROM outbox
+                WHERE status = 'pending' AND run_at <= now()
+                ORDER BY run_at
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, kind, payload, progress, attempts
+        """, limit, lease)
+        return [{"id": row['id'], "kind": row['kind'], "payload": row['payload'],
+                 "progress": row['progress'], "attempts": row['attempts']} for row in rows]
+
+    async def enqueue_job(self, kind: str, dedup_key: str | None, payload: dict) -> bool:
+        result = await self._execute("enqueue_job", """
+            INSERT INTO outbox (kind, dedup_key, payload) VALUES ($1, $2, $3::jsonb)
+            ON CONFLICT (dedup_key) DO NOTHING
+        """, kind, dedup_key, payload)
+        return result != "INSERT 0 0"
+
+    async def recent_jobs(self, kind: str, limit: int = 5) -> list[dict]:
+        rows = await self._fetch("recent_jobs", """
+            SELECT id, status, payload, progress, last_error, created_at FROM outbox
+            WHERE kind = $1 ORDER BY id DESC LIMIT $2
+        """, kind, limit)
+        return [{"id": row['id'], "status": row['status'], "payload": row['payload'],
+                 "progress": row['progress'], "last_error": row['last_error'],
+                 "created_at": row['created_at']} for row in rows]
+
+    async def save_job_progress(self, job_id: int, progress: dict):
+        await self._execute("save_job_progress", """
+            UPDATE outbox SET progress = progress || $2::jsonb WHERE id = $1
+        """, job_id, progress)
+
+    async def finish_job(self, job_id: int, status: str, error: str | None = None,
+                         delay: float = 0, refund: bool = False):
+        # status: 'done', 'failed' yoki 'pending' (delay sekunddan keyin qayta)
+        await self._execute("finish_job", """
+            UPDATE outbox SET status = $2, last_error = $3,
+                run_at = now() + make_interval(secs => $4),
+                attempts = attempts - $5::int
+            WHERE id = $1
+        """, job_id, status, error, delay, int(refund))
+
+    async def purge_jobs(self, older_than: int) -> int:
+        result = await self._execute("purge_jobs", """
+            DELETE FROM outbox WHERE status = 'done' AND created_at < now() - make_interval(secs => $1)
+        """, older_than)
+        return int(result.split()[-1])
+
+    async def set_publish_error(self, code: str, error: str | None):
+        await self._execute("set_publish_error", "UPDATE ads SET publish_error = $2 WHERE code = $1",
+                            code, error)
+
+    async def retry_publish(self, code: str) -> bool:
+        # Muvaffaqiyatsiz joylash ishi qayta navbatga qo'yiladi (bajarilgan qadamlar takrorlanmaydi)
+        return await self._fetchval("retry_publish", """
+            WITH job AS (
+                UPDATE outbox SET status = 'pending', attempts = 0, last_error = NULL, run_at = now()
+                WHERE dedup_key = $1 || ':publish' AND status = 'failed'
+                RETURNING id
+            ), ad AS (
+                UPDATE ads SET publish_error = NULL WHERE code = $1 AND EXISTS (SELECT 1 FROM job)
+            )
+            SELECT count(*) > 0 FROM job
+        """, code)
+
+    # --- FOYDALANUVCHILAR ---
+    async def upsert_users(self, records: list[tuple]):
+        # records: (user_id, username, first_name, role, last_seen_ts) - hammasi bitta so'rovda
+        user_ids, usernames, names, roles, seen = zip(*records)
+        await self._execute("upsert_users", """
+            INSERT INTO users (user_id, username, first_name, role, last_seen)
+            SELECT u, n, f, r, to_timestamp(s)
+            FROM unnest($1::bigint[], $2::text[], $3::text[], $4::text[], $5::float8[]) AS t(u, n, f, r, s)
+            ON CONFLICT (user_id) DO UPDATE SET
+                username = EXCLUDED.username,
+                first_name = COALESCE(EXCLUDED.first_name, users.first_name),
+                role = COALESCE(EXCLUDED.role, users.role),
+                last_seen = GREATEST(users.last_seen, EXCLUDED.last_seen),
+                is_active = true,
+                blocked_at = NULL
+        """, list(user_ids), list(usernames), list(names), list(roles), list(seen))
+
+    async def count_users(self) -> int:
+        return await self._fetchval("count_users", "SELECT count(*) FROM users WHERE is_active")
+
+    async def get_user_ids_after(self, cursor: int, limit: int) -> list[int]:
+        rows = await self._fetch("get_user_ids_after", """
+            SELECT user_id FROM users WHERE is_active AND user_id > $1 ORDER BY user_id LIMIT $2
+        """, cursor, limit)
+        return [row['user_id'] for row in rows]
+
+    async def broadcast_checkpoint(self, job_id: int, progress: dict, dead: list[int], lease: float):
+        # Progress, nofaol foydalanuvchilar va lease uzaytirish - bitta tranzaksiya
+        await self._execute("broadcast_checkpoint", """
+            WITH dead AS (
+                UPDATE users SET is_active = false, blocked_at = now()
+                WHERE user_id = ANY($3::bigint[])
+            )
+            UPDATE outbox SET progress = progress || $2::jsonb,
+                run_at = now() + make_interval(secs => $4)
+            WHERE id = $1
+        """, job_id, progress, dead, lease)
+
+    # --- STATISTIKA ---
+    async def get_stats_dashboard(self) -> dict[str, list[dict]]:
+        # Faqat rollup jadvallari o'qiladi: qatorlar soni ads hajmiga bog'liq emas. Hudud erkin matn -
+        # har davrda top-$2 hududdan boshqasi $3 ga yig'iladi, natija o'lchami o'zgarmas.
+        rows = await self._fetch("get_stats_dashboard", """
+            WITH rollup AS (
+                SELECT p.period, s.hudud, s.jinsi, s.role, sum(s.approved)::int AS approved,
+                       sum(s.rejected)::int AS rejected, sum(s.revenue)::bigint AS revenue
+                FROM ad_stats_daily s
+                JOIN (VALUES ('today', 0), ('week', 6), ('month', 29)) AS p(period, back)
+                    ON s.day >= (now() AT TIME ZONE $1)::date - p.back
+                GROUP BY 1, 2, 3, 4
+                UNION ALL
+                SELECT 'all', hudud, jinsi, role, approved, rejected, revenue FROM ad_stats_total
+            ), regions AS (
+                SELECT period, hudud,
+                       row_number() OVER (PARTITION BY period ORDER BY sum(approved) DESC, hudud) AS place
+                FROM rollup GROUP BY period, hudud
+            )
+            SELECT r.period, CASE WHEN g.place <= $2 THEN r.hudud ELSE $3 END AS hudud, r.jinsi, r.role,
+                   sum(r.approved)::int AS approved, sum(r.rejected)::int AS rejected,
+                   sum(r.revenue)::bigint AS revenue
+            FROM rollup r JOIN regions g USING (period, hudud)
+            GROUP BY 1, 2, 3, 4
+        """, STATS_TIMEZONE, STATS_TOP_REGIONS, STATS_OTHER_REGION)
+        stats = {}
+        for row in rows:
+            stats.setdefault(row['period'], []).append(dict(row))
+        return stats
+
+
+# (versiya, nomi, Database metodi, tranzaksiyada). Yangi migratsiya faqat oxiriga qo'shiladi,
+# qo'llanganlari o'zgartirilmaydi. ads ni bo'limlarga o'tkazish va unga ustun qo'shish
+# CREATE INDEX CONCURRENTLY ishlatadi, shuning uchun tranzaksiyadan tashqarida.
+SCHEMA_MIGRATIONS = [
+    (1, "base", Database._schema_base, True),
+    (2, "ads_partitioned", Database._migrate_ads, False),
+    (3, "ads_search", Database._schema_ads_search, False),
+    (4, "ad_stats", Database._schema_ad_stats, True),
+    (5, "ad_signatures", Database._schema_ad_signatures, True),
+    (6, "ads_columns", Database._schema_ads_columns, False),
+    (7, "ads_publish_error", Database._schema_ads_publish_error, True),
+]
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+
+def _pending_from_row(row) -> dict:
+    return {
+        "data": row['data'],
+        "user_id": row['user_id'],
+        "video_id": row['video_id'],
+        "check_id": row['check_id'],
+        "admin_text": row['admin_text'],
+        "admin_photo": row['admin_photo'],
+        "created_at": row['created_at'].timestamp(),
+    }
+
+
+# pending_ads jadvali ustidan write-through kesh
+class PendingAds:
+    def __init__(self, database: Database, ttl: int = PENDING_TTL):
+        self.db = database
+        self.ttl = ttl
+        self._cache: dict[str, dict] = {}
+        # (bo'sh, admin ko'rib chiqayotgan) - metrika uchun, expire_loop yangilab turadi.
+        # Kesh hajmi navbat emas: boshqa shard'lardagi e'lonlar unda yo'q.
+        self.queue_depth = (0, 0)
+
+    def _expired(self, elon: dict) -> bool:
+        return time.time() - elon["created_at"] > self.ttl
+
+    async def warm(self):
+        # Qayta ishga tushganda butun keshni bitta so'rov bilan tiklaymiz
+        self._cache = await self.db.get_pending_all(self.ttl)
+        logging.info(f"{len(self._cache)} ta kutilayotgan e'lon yuklandi.")
+
+    async def add(self, temp_id: str, elon: dict) -> int:
+        # Qaytaradi: shu e'londan oldin navbatda turgan bo'sh e'lonlar soni
+        waiting = await self.db.add_pending(temp_id, elon, self.ttl)
+        self._cache[temp_id] = {"admin_text": None, "admin_photo": None, "renders": {},
+                                **elon, "created_at": time.time()}
+        return waiting
+
+    async def claim(self, admin_id: int, skip: str | None = None, lease: int = MODERATION_LEASE):
+        # (temp_id, e'lon, navbatda qolgani) yoki (None, None, 0)
+        temp_id, row, left = await self.db.claim_pending(admin_id, lease, self.ttl, skip)
+        if temp_id is None:
+            return None, None, 0
+        # Qator manba: admin_text/admin_photo ni boshqa shard'dagi jarayon o'zgartirgan bo'lishi mumkin.
+        # Keshdan faqat data dan yasalgan tayyor matnlar olinadi (data moderatsiyada o'zgarmaydi).
+        cached = self._cache.get(temp_id)
+        elon = self._cache[temp_id] = {**row, "renders": cached["renders"] if cached else {}}
+        return temp_id, elon, left
+
+    async def depth(self) -> tuple[int, int]:
+        self.queue_depth = await self.db.pending_queue_depth(self.ttl)
+        return self.queue_depth
+
+    async def get(self, temp_id: str):
+        elon = self._cache.get(temp_id)
+        if elon is None:
+            elon = await self.db.get_pending(temp_id, self.ttl)
+            if elon is None:
+                return None
+            self._cache[temp_id] = elon
+        if self._expired(elon):
+            self._cache.pop(temp_id, None)
             return None
+        return elon
+
+    async def update(self, temp_id: str, field: str, value: str) -> bool:
+        if not await self.db.update_pending(temp_id, field, value):
+            self._cache.pop(temp_id, None)
+            return False
+        elon = self._cache.get(temp_id)
+        if elon is not None:
+            elon[field] = value
+            # Admin tahrir qildi - tayyor matnlar eskirdi
+            elon["renders"] = {}
+        return True
+
+    async def pop(self, temp_id: str, status: str, by: int | None = None):
+        self._cache.pop(temp_id, None)
+        return await self.db.finish_pending(temp_id, status, by)
+
+    async def approve(self, temp_id: str, code: str, data: dict, jobs: list,
+                      approved_by: int | None = None, revenue: int = 0,
+                      signature: bytes | None = None) -> bool:
+        self._cache.pop(temp_id, None)
+        return await self.db.approve_pending(temp_id, code, data, jobs, approved_by, revenue, signature)
+
+    async def expire(self, database: bool = True) -> int:
+        # Kesh har bir jarayonda o'zi tozalanadi; jadvaldagi holatni bitta jarayon yangilasa yetadi
+        for temp_id in [t for t, e in self._cache.items() if self._expired(e)]:
+            del self._cache[temp_id]
+        return await self.db.expire_pending(self.ttl) if database else 0
+
+    async def expire_loop(self, interval: int = 60, database: bool = True):
+        while True:
+            try:
+                await self.depth()
+            except Exception as e:
+                logging.error(f"Navbat hajmini o'qishda xatolik: {e}")
+            await asyncio.sleep(interval)
+            try:
+                expired = await self.expire(database)
+                if expired:
+                    logging.info(f"{expired} ta e'lon muddati o'tdi.")
+            except Exception as e:
+                logging.error(f"Pending tozalashda xatolik: {e}")
+
+    def __len__(self):
+        return len(self._cache)
+
+    def register_metrics(self, metrics: Registry):
+        metrics.gauge("pending_ads", "Moderatsiyani kutayotgan e'lonlar (butun navbat)",
+                      lambda: dict(zip(("free", "claimed"), self.queue_depth)), "state")
+
 
-db = Database()
\ No newline at end of file
+db = Database()
+pending_ads = PendingAds(db)
\ No newline at end of file
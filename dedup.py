@@ -0,0 +1,186 @@
+import os
+import re
+import time
+import zlib
+import random
+import asyncio
+import logging
+from array import array
+from bisect import bisect_left, insort
+
+from metrics import Registry
+from utils import ad_fields
+
+# Signatura (sketch) = DEDUP_BANDS * DEDUP_ROWS ta MinHash qiymatining pastki bayti (b-bit MinHash).
+# LSH: sketch DEDUP_BANDS bo'lakka bo'linadi, bitta bo'lagi to'liq mos kelgan e'lonlar nomzod,
+# nomzodlar esa butun sketch bo'yicha tekshiriladi. 8x4 da J=0.8 li e'lon ~99% topiladi.
+# O'zgartirilsa ad_signatures jadvalini tozalash kerak (eski signaturalar mos kelmaydi).
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", 8))
+DEDUP_ROWS = int(os.getenv("DEDUP_ROWS", 4))
+# Shundan past taxminiy o'xshashlikdagi (Jaccard) e'lonlar ko'rsatilmaydi
+DEDUP_MIN_SIMILARITY = float(os.getenv("DEDUP_MIN_SIMILARITY", 0.6))
+# Boshqa jarayonlar tasdiqlagan e'lonlar shuncha soniyada bir DB dan olinadi
+DEDUP_REFRESH_INTERVAL = float(os.getenv("DEDUP_REFRESH_INTERVAL", 5))
+DEDUP_BATCH = 5000
+
+SKETCH_SIZE = DEDUP_BANDS * DEDUP_ROWS
+_SHINGLE = 4
+_M64 = (1 << 64) - 1
+# Yozuv: yuqori bitlar - band kaliti (DEDUP_ROWS bayt), pastki 24 bit - e'lon indeksi (16M gacha)
+_INDEX_BITS = 24
+_INDEX_MASK = (1 << _INDEX_BITS) - 1
+assert DEDUP_ROWS * 8 + _INDEX_BITS <= 64
+# Har bir band kalitning pastki bitlari bo'yicha bo'laklarga ajratilgan: yozish - kichik
+# saralangan massivga insort, qidirish - bisect. 1M e'londa bo'lakda ~1000 yozuv.
+_BUCKETS = 1024
+# Signaturalar jarayonlar va qayta ishga tushishlar orasida bir xil bo'lishi uchun doimiy seed
+_rng = random.Random(0x5EED)
+_PERMS = [(_rng.getrandbits(64) | 1, _rng.getrandbits(64)) for _ in range(SKETCH_SIZE)]
+_WORD = re.compile(r"\w+")
+_CODE = re.compile(r"E-(\d+)")
+
+
+def normalize(data: dict) -> str:
+    # Katta-kichik harf, tinish belgilar va bo'shliqlar farqi hisobga olinmaydi; telefon - faqat raqamlar
+    text = " ".join(_WORD.findall(" ".join(ad_fields(data)).lower()))
+    phone = re.sub(r"\D", "", str(data.get("tel") or ""))
+    return f"{text} {phone}" if phone else text
+
+
+def signature(data: dict) -> bytes:
+    text = normalize(data)
+    shingles = {text[i:i + _SHINGLE] for i in range(max(len(text) - _SHINGLE + 1, 1))}
+    hashes = [zlib.crc32(s.encode()) for s in shingles]
+    # multiply-shift hash oilasi: har bir "permutatsiya" uchun minimal qiymatning pastki bayti
+    return bytes(min(((a * h + b) & _M64) >> 32 for h in hashes) & 0xFF for a, b in _PERMS)
+
+
+def similarity(a: bytes, b: bytes) -> float:
+    # Bir baytli qiymatlar tasodifan ham 1/256 ehtimol bilan teng - shunga tuzatilgan Jaccard bahosi
+    equal = sum(x == y for x, y in zip(a, b)) / len(a)
+    return max(0.0, (equal - 1 / 256) / (1 - 1 / 256))
+
+
+def _band_keys(sketch: bytes) -> list[int]:
+    return [int.from_bytes(sketch[i:i + DEDUP_ROWS], "little") for i in range(0, SKETCH_SIZE, DEDUP_ROWS)]
+
+
+# Tasdiqlangan e'lonlarning MinHash/LSH indeksi: har bir band uchun _BUCKETS ta saralangan
+# array('Q'), sketch'lar bitta bytearray da ketma-ket saqlanadi (1M e'lon ~100 MiB).
+class SimilarityIndex:
+    def __init__(self, database=None):
+        self.db = database
+        # indeks -> e'lon raqami (E-00042 -> 42); boshqa ko'rinishdagi kodlar _other da
+        self._numbers = array("q")
+        self._other: list[str] = []
+        self._sketches = bytearray()
+        self._tables = [[array("Q") for _ in range(_BUCKETS)] for _ in range(DEDUP_BANDS)]
+        self._last_id = 0
+        self._refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+        self.ready = False
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def memory_bytes(self) -> int:
+        tables = sum(len(t) * t.itemsize for band in self._tables for t in band)
+        return tables + len(self._sketches) + len(self._numbers) * self._numbers.itemsize
+
+    def _code(self, index: int) -> str:
+        number = self._numbers[index]
+        return f"E-{number:05d}" if number >= 0 else self._other[-number - 1]
+
+    def _sketch(self, index: int) -> bytes:
+        return bytes(self._sketches[index * SKETCH_SIZE:(index + 1) * SKETCH_SIZE])
+
+    def add(self, code: str, sketch: bytes) -> bool:
+        index = len(self._numbers)
+        if index > _INDEX_MASK or len(sketch) != SKETCH_SIZE:
+            return False
+        match = _CODE.fullmatch(code)
+        if match:
+            self._numbers.append(int(match.group(1)))
+        else:
+            self._other.append(code)
+            self._numbers.append(-len(self._other))
+        self._sketches += sketch
+        for band, key in zip(self._tables, _band_keys(sketch)):
+            insort(band[key % _BUCKETS], (key << _INDEX_BITS) | index)
+        return True
+
+    def query(self, sketch: bytes, limit: int = 3,
+              min_similarity: float = DEDUP_MIN_SIMILARITY) -> list[tuple[str, float]]:
+        # Qaytaradi: [(kod, taxminiy o'xshashlik)], eng o'xshashi birinchi
+        candidates = set()
+        for band, key in zip(self._tables, _band_keys(sketch)):
+            table = band[key % _BUCKETS]
+            lo = bisect_left(table, key << _INDEX_BITS)
+            hi = bisect_left(table, (key + 1) << _INDEX_BITS, lo)
+            candidates.update(entry & _INDEX_MASK for entry in table[lo:hi])
+        found = []
+        for index in candidates:
+            score = similarity(sketch, self._sketch(index))
+            if score >= min_similarity:
+                found.append((score, index))
+        found.sort(reverse=True)
+        return [(self._code(index), score) for score, index in found[:limit]]
+
+    # --- POSTGRES BILAN SINXRONLASH ---
+    async def refresh(self, force: bool = False):
+        # ad_signatures dagi yangi qatorlar (id bo'yicha keyset) - shu va boshqa jarayonlar tasdiqlaganlari
+        if not force and time.monotonic() - self._refreshed_at < DEDUP_REFRESH_INTERVAL:
+            return
+        async with self._lock:
+            self._refreshed_at = time.monotonic()
+            while True:
+                rows = await self.db.get_signatures_after(self._last_id, DEDUP_BATCH)
+                for row in rows:
+                    self.add(row["code"], row["sketch"])
+                if rows:
+                    self._last_id = rows[-1]["id"]
+                if len(rows) < DEDUP_BATCH:
+                    break
+
+    async def load(self):
+        start = time.perf_counter()
+        try:
+            await self.refresh(force=True)
+        except Exception as e:
+            logging.error(f"O'xshash e'lonlar indeksi yuklanmadi: {e}")
+            return
+        self.ready = True
+        logging.info(f"O'xshash e'lonlar indeksi: {len(self)} ta e'lon, {time.perf_counter() - start:.1f}s")
+
+    async def similar(self, sketch: bytes, limit: int = 3) -> list[tuple[str, float]]:
+        if not self.ready:
+            return []
+        try:
+            await self.refresh()
+        except Exception as e:
+            logging.warning(f"O'xshash e'lonlar indeksi yangilanmadi: {e}")
+        return self.query(sketch, limit)
+
+    async def backfill(self, batch: int = 1000):
+        # Indeks paydo bo'lishidan oldingi e'lonlar uchun signaturalar (bir marta, fonda)
+        cursor, total = "", 0
+        try:
+            while True:
+                ads = await self.db.get_ads_without_signature(cursor, batch)
+                if not ads:
+                    break
+                # signature() toza CPU ishi (~2 ms/e'lon): partiya event loop'ni sekundlab to'xtatmasligi
+                # uchun alohida oqimda hisoblanadi
+                sketches = await asyncio.to_thread(lambda: [(code, signature(data)) for code, data in ads])
+                await self.db.save_signatures(sketches)
+                cursor = ads[-1][0]
+                total += len(ads)
+            if total:
+                logging.info(f"{total} ta eski e'lon uchun signatura hisoblandi.")
+                await self.refresh(force=True)
+        except Exception as e:
+            logging.error(f"Signaturalarni to'ldirishda xatolik: {e}")
+
+    def register_metrics(self, metrics: Registry):
+        metrics.gauge("similarity_index_ads", "O'xshashlik indeksidagi e'lonlar", lambda: len(self))
+        metrics.gauge("similarity_index_bytes", "O'xshashlik indeksi egallagan xotira", self.memory_bytes)
@@ -0,0 +1,157 @@
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable
+
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+# Telegram limitlari: umumiy ~30 xabar/s, bitta chatga ~1 xabar/s
+GLOBAL_RATE = float(os.getenv("FANOUT_GLOBAL_RATE", 30))
+CHAT_RATE = float(os.getenv("FANOUT_CHAT_RATE", 1))
+CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", 10))
+MAX_RETRIES = int(os.getenv("FANOUT_MAX_RETRIES", 3))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block(self, seconds: float):
+        # retry_after kelganda bucket shu vaqtgacha token bermaydi
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def idle_since(self) -> float:
+        return max(self.updated, self.blocked_until)
+
+
+# Umumiy limit bot tokeniga tegishli: shard'lar bitta bucket'ni ishlatadi. Holat supervisor
+# yaratgan umumiy xotirada (tokens, updated, blocked_until) - broadcast qilayotgan worker
+# boshqalar jim turganda to'liq 30 xabar/s oladi. time.monotonic() jarayonlar uchun umumiy.
+class SharedTokenBucket(TokenBucket):
+    def __init__(self, rate: float, state, capacity: float | None = None):
+        super().__init__(rate, capacity)
+        self.state = state
+
+    @staticmethod
+    def create_state(ctx, rate: float):
+        return ctx.Array("d", [max(rate, 1.0), time.monotonic(), 0.0])
+
+    def _take(self) -> float:
+        # 0 - token olindi, aks holda qancha kutish kerak
+        with self.state.get_lock():
+            tokens, updated, blocked_until = self.state
+            now = time.monotonic()
+            if now < blocked_until:
+                return blocked_until - now
+            tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            self.state[0] = tokens - 1 if not wait else tokens
+            self.state[1] = now
+            return wait
+
+    async def acquire(self):
+        async with self._lock:
+            while wait := self._take():
+                await asyncio.sleep(wait)
+
+    def block(self, seconds: float):
+        with self.state.get_lock():
+            self.state[0] = 0.0
+            self.state[2] = max(self.state[2], time.monotonic() + seconds)
+
+
+@dataclass
+class FanOutResult:
+    delivered: list[int] = field(default_factory=list)
+    failed: dict[int, Exception] = field(default_factory=dict)
+
+
+class FanOut:
+    def __init__(self, global_rate: float = GLOBAL_RATE, chat_rate: float = CHAT_RATE,
+                 concurrency: int = CONCURRENCY, max_retries: int = MAX_RETRIES,
+                 idle_ttl: float = 60.0):
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.idle_ttl = idle_ttl
+        self.chat_buckets: dict[int, TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, capacity=1)
+        return bucket
+
+    def _prune(self):
+        # Uzoq ishlatilmagan chat bucketlarini tozalaymiz (xotira o'smasligi uchun)
+        deadline = time.monotonic() - self.idle_ttl
+        stale = [cid for cid, b in self.chat_buckets.items()
+                 if b.idle_since() < deadline and not b._lock.locked()]
+        for cid in stale:
+            del self.chat_buckets[cid]
+
+    async def _send_one(self, chat_id: int, send: Callable[[int], Awaitable], result: FanOutResult):
+        bucket = self._chat_bucket(chat_id)
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                await send(chat_id)
+                result.delivered.append(chat_id)
+                return
+            except TelegramRetryAfter as e:
+                logging.warning(f"Flood limit: {chat_id} uchun {e.retry_after}s kutamiz "
+                                f"(urinish {attempt + 1})")
+                bucket.block(e.retry_after)
+                self.global_bucket.block(e.retry_after)
+                result.failed[chat_id] = e
+            except TelegramAPIError as e:
+                result.failed[chat_id] = e
+                return
+        logging.error(f"{chat_id} ga yuborilmadi: urinishlar tugadi")
+
+    async def send(self, chat_ids: Iterable[int], send: Callable[[int], Awaitable]) -> FanOutResult:
+        self._prune()
+        result = FanOutResult()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def worker(chat_id: int):
+            async with semaphore:
+                try:
+                    await self._send_one(chat_id, send, result)
+                except Exception as e:
+                    result.failed[chat_id] = e
+
+        await asyncio.gather(*(worker(cid) for cid in dict.fromkeys(chat_ids)))
+        for cid in result.delivered:
+            result.failed.pop(cid, None)
+        return result
+
+
+fanout = FanOut()
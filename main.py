@@ -1,18 +1,62 @@
 import os
+import html
+import time
 import asyncio
 import logging
+import asyncpg
 from aiogram import Bot, Dispatcher, F, types
 from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart, Command
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from dotenv import load_dotenv
 
 # DATABASE
-from db import db
+from db import db, pending_ads
+
+# FSM STORAGE
+from storage import PgStorage, FSMFlushMiddleware
+
+# FAN-OUT (adminlarga parallel yuborish)
+from fanout import fanout
+
+# OUTBOX (tasdiqlangan e'lonlarni fonda joylash)
+from outbox import OutboxPublisher, Job
+
+# STATIK RASMLAR (file_id keshi)
+from media import MEDIA_PREFIX, MediaRegistry
+
+# FOYDALANUVCHILAR VA BROADCAST
+from users import UserTracker, Broadcaster
+
+# STATISTIKA (rollup jadvallaridan)
+from stats import parse_price, format_dashboard
+
+# O'XSHASH E'LONLAR (MinHash/LSH)
+from dedup import SimilarityIndex, signature as ad_signature
+
+# ANTI-FLOOD (foydalanuvchi bo'yicha token bucket'lar)
+from antiflood import AntiFloodMiddleware
+
+# TRACING (korrelyatsiya ID, JSONL izlar)
+from tracing import tracer, TracingMiddleware, HandlerSpanMiddleware, TracingRequestMiddleware
+
+# KANAL HAVOLALARI KESHI
+from channels import channel_links
+
+# METRIKALAR (/metrics)
+from metrics import (
+    METRICS_PORT, registry, UpdateMetricsMiddleware, ApiMetricsMiddleware, MetricsServer
+)
+
+# WEBHOOK VA SHARDING
+from webhook import BOT_MODE, run_webhook
+from shard import SHARD_WORKERS, run_supervisor
 
 # BUTTONS
 from buttons import (
@@ -23,27 +67,32 @@ from buttons import (
     get_gender_menu,
     get_role_menu,
     get_channels_settings_menu,
-    get_payment_settings_menu
+    get_payment_settings_menu,
+    get_search_pager
 )
 
 # UTILS
-from utils import gen_code, gen_temp_id, create_ad_text
+from utils import CodeAllocator, gen_temp_id, create_ad_text, render_body, render_ad
 
 # ================== CONFIG ==================
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 SUPER_ADMIN_ID = int(os.getenv("ADMIN_ID"))
-
-# Statik rasmlar
-AYOL_ISHCHI_KERAK_PHOTO = os.getenv("AYOL_ISHCHI_KERAK_PHOTO")
-AYOL_ISH_KERAK_PHOTO = os.getenv("AYOL_ISH_KERAK_PHOTO")
-ERKAK_ISH_KERAK_PHOTO = os.getenv("ERKAK_ISH_KERAK_PHOTO")
-ERKAK_ISHCHI_KERAK_PHOTO = os.getenv("ERKAK_ISHCHI_KERAK_PHOTO")
+# Lokal Bot API server yoki yuklama testi uchun soxta API (benchmarks/fake_api.py), masalan http://127.0.0.1:8081
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+# Navbatga yangi e'lon tushganda adminlarga eslatma shundan tez-tez yuborilmaydi (soniya)
+MODERATION_NOTIFY_INTERVAL = int(os.getenv("MODERATION_NOTIFY_INTERVAL", 300))
+
+# Statik rasmlar (fayl yo'li, URL yoki file_id): bir marta yuklanadi, file_id settings da saqlanadi
+media = MediaRegistry(db)
+media.register("ayol_ishchi_kerak", os.getenv("AYOL_ISHCHI_KERAK_PHOTO"))
+media.register("ayol_ish_kerak", os.getenv("AYOL_ISH_KERAK_PHOTO"))
+media.register("erkak_ish_kerak", os.getenv("ERKAK_ISH_KERAK_PHOTO"))
+media.register("erkak_ishchi_kerak", os.getenv("ERKAK_ISHCHI_KERAK_PHOTO"))
 
 logging.basicConfig(level=logging.INFO)
 
-pending_elons = {}
 # Kesh (Cache)
 bot_config = {
     "admins": [],
@@ -57,39 +106,66 @@ bot_config = {
 
 # --- SOZLAMALARNI DB DAN YUKLASH ---
 async def load_settings_from_db():
-    # 1. Adminlar
-    admins = await db.get_admins()
-    if SUPER_ADMIN_ID not in admins:
-        admins.append(SUPER_ADMIN_ID)
-        await db.add_admin(SUPER_ADMIN_ID)
-    bot_config["admins"] = admins
-
-    # 2. Kanallar
-    channels = await db.get_channels()
+    # Adminlar, kanallar va to'lov ma'lumotlari bitta so'rovda; bazada yo'qlari env dan yoziladi
     env_channels = {
         "erkak": int(os.getenv("ERKAK_KANAL_ID", 0)),
         "ayol": int(os.getenv("AYOL_KANAL_ID", 0)),
         "yashirin": int(os.getenv("YASHIRIN_KANAL", 0))
     }
-    for key, val in env_channels.items():
-        if key not in channels and val != 0:
-            await db.set_channel(key, val)
-            channels[key] = val
+    admins, channels, settings = await db.bootstrap_config(
+        SUPER_ADMIN_ID,
+        {key: val for key, val in env_channels.items() if val != 0},
+        dict(bot_config["payment"]),
+    )
+    bot_config["admins"] = admins
     bot_config["channels"] = channels
+    await channel_links.warm(bot, channels)
 
-    # 3. To'lov ma'lumotlari
-    settings = await db.get_settings()
-    if "card" in settings: bot_config["payment"]["card"] = settings["card"]
-    else: await db.set_setting("card", bot_config["payment"]["card"])
-    
-    if "owner" in settings: bot_config["payment"]["owner"] = settings["owner"]
-    else: await db.set_setting("owner", bot_config["payment"]["owner"])
-    
-    if "price" in settings: bot_config["payment"]["price"] = settings["price"]
-    else: await db.set_setting("price", bot_config["payment"]["price"])
+    media.load(settings)
+    for name in bot_config["payment"]:
+        if name in settings:
+            bot_config["payment"][name] = settings[name]
 
     logging.info("Sozlamalar DB dan yuklandi.")
 
+# --- BOSHQA JARAYONLARDAGI O'ZGARISHLAR (NOTIFY) ---
+async def refresh_config(key: str | None):
+    # Faqat o'zgargan kalit qayta o'qiladi; key=None bo'lsa hammasi
+    try:
+        if key is None or key == "admins":
+            admins = await db.get_admins()
+            if SUPER_ADMIN_ID not in admins:
+                admins.append(SUPER_ADMIN_ID)
+            bot_config["admins"] = admins
+        if key is None:
+            bot_config["channels"] = await db.get_channels()
+            for ctype in list(bot_config["channels"]):
+                channel_links.invalidate(ctype)
+            settings = await db.get_settings()
+            for name in bot_config["payment"]:
+                if name in settings:
+                    bot_config["payment"][name] = settings[name]
+            media.load(settings)
+        elif key.startswith("channels:"):
+            ctype = key.split(":", 1)[1]
+            channel_id = await db.get_channel(ctype)
+            if channel_id is None:
+                bot_config["channels"].pop(ctype, None)
+            else:
+                bot_config["channels"][ctype] = channel_id
+            channel_links.invalidate(ctype)
+        elif key.startswith("settings:" + MEDIA_PREFIX):
+            await media.reload(key.split(":", 2)[2])
+        elif key.startswith("settings:"):
+            name = key.split(":", 1)[1]
+            if name in bot_config["payment"]:
+                value = await db.get_setting(name)
+                if value is not None:
+                    bot_config["payment"][name] = value
+        logging.info(f"Sozlama yangilandi: {key or 'hammasi'}")
+    except Exception as e:
+        logging.error(f"Sozlamani yangilashda xatolik ({key}): {e}")
+
 def is_admin(user_id):
     return user_id in bot_config["admins"] or user_id == SUPER_ADMIN_ID
 
@@ -115,6 +191,7 @@ class Form(StatesGroup):
 
 class AdminForm(StatesGroup):
     searching_ad = State()
+    searching_text = State()
     waiting_for_new_text = State()
     waiting_for_new_photo = State()
     current_temp_id = State()
@@ -124,10 +201,51 @@ class AdminForm(StatesGroup):
     waiting_new_card = State()
     waiting_new_owner = State()
     waiting_new_price = State()
+    waiting_broadcast = State()
 
 # ================== BOT SETUP ==================
-bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher(storage=MemoryStorage())
+bot = Bot(
+    BOT_TOKEN,
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None,
+    default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+)
+dp = Dispatcher(storage=PgStorage(db))
+# Byudjetdan oshgan update'lar handler, DB va metrikalargacha yetmaydi
+antiflood = AntiFloodMiddleware(receipt_states=[Form.waiting_for_check.state], exempt=is_admin)
+dp.update.outer_middleware(antiflood)
+antiflood.register_metrics(registry)
+# Har bir update izi (TRACE_FILE): handler, DB va Bot API span'lari
+dp.update.outer_middleware(TracingMiddleware())
+dp.message.middleware(HandlerSpanMiddleware())
+dp.callback_query.middleware(HandlerSpanMiddleware())
+tracer.register_metrics(registry)
+# FSM flush vaqti ham o'lchansin, shuning uchun metrika middleware'i tashqarida
+dp.update.outer_middleware(UpdateMetricsMiddleware(registry))
+dp.update.outer_middleware(FSMFlushMiddleware())
+user_tracker = UserTracker(db)
+dp.update.outer_middleware(user_tracker)
+user_tracker.register_metrics(registry)
+api_metrics = ApiMetricsMiddleware(registry)
+bot.session.middleware(api_metrics)
+api_tracing = TracingRequestMiddleware()
+bot.session.middleware(api_tracing)
+db.register_metrics(registry)
+pending_ads.register_metrics(registry)
+similar_ads = SimilarityIndex(db)
+similar_ads.register_metrics(registry)
+metrics_server = MetricsServer(registry)
+dp.shutdown.register(metrics_server.stop)
+# FSM storage yozib bo'lingach pool yopiladi
+outbox = OutboxPublisher(db)
+outbox.register_metrics(registry)
+# Avval outbox to'xtaydi (ishlayotgan ishlar DB ga yozib ulgursin), keyin pool yopiladi
+dp.shutdown.register(outbox.stop)
+dp.shutdown.register(user_tracker.stop)
+dp.shutdown.register(tracer.stop)
+dp.shutdown.register(db.close)
+broadcaster = Broadcaster(bot, db, fanout)
+outbox.handler("broadcast")(broadcaster.run)
+code_allocator = CodeAllocator(db.reserve_codes)
 
 # ================== HELPER FUNCTIONS ==================
 def get_admin_check_keyboard(temp_id):
@@ -136,15 +254,25 @@ def get_admin_check_keyboard(temp_id):
     kb.button(text="❌ Rad etish", callback_data=f"reject_{temp_id}")
     kb.button(text="✏️ Matnni tahrirlash", callback_data=f"edit_text_{temp_id}")
     kb.button(text="🖼 Rasm biriktirish", callback_data=f"attach_photo_{temp_id}")
+    kb.button(text="⏭ Keyingisi", callback_data=f"queue_next_{temp_id}")
     kb.adjust(2)
     return kb.as_markup()
 
+def cached_render(elon: dict, name: str, render):
+    # Kutilayotgan e'lon uchun tayyor matnlar keshi (admin tahrir qilsa tozalanadi)
+    renders = elon.setdefault("renders", {})
+    if name not in renders:
+        renders[name] = render()
+    return renders[name]
+
 def get_ad_photo(role: str, gender: str) -> str | None:
-    if role == "👷‍♂️ Ish qidiryapman" and gender == "Erkak": return ERKAK_ISH_KERAK_PHOTO
-    if role == "🏢 Ish beruvchiman" and gender == "Erkak": return ERKAK_ISHCHI_KERAK_PHOTO
-    if role == "👷‍♂️ Ish qidiryapman" and gender == "Ayol": return AYOL_ISH_KERAK_PHOTO
-    if role == "🏢 Ish beruvchiman" and gender == "Ayol": return AYOL_ISHCHI_KERAK_PHOTO
-    return None
+    # media dagi rasm nomi; rasm sozlanmagan bo'lsa None
+    name = None
+    if role == "👷‍♂️ Ish qidiryapman" and gender == "Erkak": name = "erkak_ish_kerak"
+    if role == "🏢 Ish beruvchiman" and gender == "Erkak": name = "erkak_ishchi_kerak"
+    if role == "👷‍♂️ Ish qidiryapman" and gender == "Ayol": name = "ayol_ish_kerak"
+    if role == "🏢 Ish beruvchiman" and gender == "Ayol": name = "ayol_ishchi_kerak"
+    return name if name in media else None
 
 # ================== START & USER FLOW ==================
 @dp.message(CommandStart())
@@ -157,6 +285,7 @@ async def start_handler(msg: types.Message, state: FSMContext):
 async def choose_role(msg: types.Message, state: FSMContext):
     # 1. Rolni saqlaymiz
     await state.update_data(role=msg.text)
+    user_tracker.touch(msg.from_user.id, msg.from_user.username, msg.from_user.first_name, role=msg.text)
     await msg.answer("Ajoyib. Endi e’lon berishingiz mumkin.", reply_markup=get_main_menu())
     
     # MUHIM: state.clear() EMAS, balki shunchaki state'ni bo'shatamiz
@@ -329,24 +458,21 @@ async def handle_check(msg: types.Message, state: FSMContext):
     check_photo_id = msg.photo[-1].file_id
     data = await state.get_data()
     temp_id = gen_temp_id()
+    tracer.tag(temp_id=temp_id)
 
-    pending_elons[temp_id] = {
+    body = render_body(data)
+    ad_text = create_ad_text(data, with_phone=True, body=body)
+    waiting = await pending_ads.add(temp_id, {
         "data": data,
         "user_id": msg.from_user.id,
         "video_id": data.get("video_id"),
         "check_id": check_photo_id,
-        "admin_text": None,
-        "admin_photo": None
-    }
-
-    ad_text = create_ad_text(data, with_phone=True)
-    caption = f"🆕 <b>YANGI E'LON!</b>\n\n{ad_text}\n\n<i>Boshqarish tugmalari:</i>"
+        "renders": {"body": body, "preview": ad_text},
+    })
 
-    for admin_id in bot_config["admins"]:
-        try:
-            await bot.send_photo(admin_id, photo=check_photo_id, caption=caption, 
-                                 reply_markup=get_admin_check_keyboard(temp_id))
-        except: pass
+    # E'lonning o'zi adminlarga yuborilmaydi - admin navbatdan oladi (send_next_ad)
+    if waiting == 0:
+        await notify_queue()
 
     await msg.answer("⏳ Chek adminga yuborildi.", reply_markup=types.ReplyKeyboardRemove())
     await state.set_state(Form.admin_wait)
@@ -357,6 +483,63 @@ async def admin_panel_cmd(msg: types.Message):
     if is_admin(msg.from_user.id):
         await msg.answer("Admin panel:", reply_markup=get_admin_menu())
 
+@dp.message(Command("dbstats"))
+async def db_stats_cmd(msg: types.Message):
+    if not is_admin(msg.from_user.id): return
+    stats = db.stats()
+    pool = stats["pool"]
+    wait = stats["acquire_wait"]
+    lines = [
+        f"<b>Pool:</b> {pool.get('size', 0)} ta ulanish ({pool.get('idle', 0)} bo'sh), "
+        f"min {pool.get('min', 0)} / max {pool.get('max', 0)}",
+        f"<b>Kutish:</b> p50 {wait['p50'] * 1000:.1f} ms, p99 {wait['p99'] * 1000:.1f} ms",
+        f"<b>Statement kesh:</b> {stats['statements']['hits']} hit / {stats['statements']['misses']} miss",
+        "",
+        "<b>Eng sekin so'rovlar (p99):</b>",
+    ]
+    for name, s in db.slow_queries():
+        lines.append(f"• <code>{name}</code>: {s['count']} ta, p50 {s['p50'] * 1000:.1f} ms, "
+                     f"p99 {s['p99'] * 1000:.1f} ms")
+    await msg.answer("\n".join(lines))
+
+# --- STATISTIKA ---
+@dp.message(Command("stats"))
+@dp.message(F.text == "📊 Statistika")
+async def show_stats(msg: types.Message):
+    if not is_admin(msg.from_user.id): return
+    await msg.answer(format_dashboard(await db.get_stats_dashboard()))
+
+# --- XABAR YUBORISH (BROADCAST) ---
+@dp.message(Command("broadcast"))
+@dp.message(F.text == "📣 Xabar yuborish")
+async def broadcast_start(msg: types.Message, state: FSMContext):
+    if not is_admin(msg.from_user.id): return
+    lines = []
+    for job in await db.recent_jobs("broadcast", 3):
+        total = job["payload"].get("total", 0)
+        sent = job["progress"].get("sent", 0)
+        lines.append(f"#{job['id']} ({job['status']}): {sent}/{total} yetkazildi, "
+                     f"{job['progress'].get('dead', 0)} bloklagan")
+    if lines:
+        await msg.answer("<b>Oxirgi xabarlar:</b>\n" + "\n".join(lines))
+    users = await db.count_users()
+    await msg.answer(f"Faol foydalanuvchilar: {users} ta.\nYuboriladigan xabarni jo'nating "
+                     f"(matn, rasm, video...):", reply_markup=get_cancel_menu())
+    await state.set_state(AdminForm.waiting_broadcast)
+
+@dp.message(AdminForm.waiting_broadcast)
+async def broadcast_receive(msg: types.Message, state: FSMContext):
+    await state.clear()
+    payload = {
+        "from_chat_id": msg.chat.id,
+        "message_id": msg.message_id,
+        "admin_id": msg.from_user.id,
+        "total": await db.count_users(),
+    }
+    await outbox.enqueue("broadcast", f"broadcast:{msg.chat.id}:{msg.message_id}", payload)
+    await msg.answer(f"📣 Xabar {payload['total']} ta foydalanuvchiga navbatga qo'yildi. "
+                     f"Tugagach hisobot yuboriladi.", reply_markup=get_admin_menu())
+
 @dp.message(F.text == "👤 Foydalanuvchi rejimi")
 async def back_to_user_mode(msg: types.Message, state: FSMContext):
     await state.clear()
@@ -436,6 +619,7 @@ async def set_channel_finish(msg: types.Message, state: FSMContext):
         ctype = data.get("editing_channel")
         await db.set_channel(ctype, new_id)
         bot_config["channels"][ctype] = new_id
+        channel_links.invalidate(ctype)
         await msg.answer(f"✅ {ctype} kanali yangilandi.", reply_markup=get_admin_menu())
     except ValueError:
         await msg.answer("Raqam bo'lishi kerak.")
@@ -515,16 +699,158 @@ async def search_finish(msg: types.Message, state: FSMContext):
         await msg.answer("❌ Topilmadi.", reply_markup=get_admin_menu())
     await state.clear()
 
+# --- MATN BO'YICHA QIDIRISH ---
+SEARCH_PAGE_SIZE = 5
+SEARCH_ROLES = {"worker": "👷‍♂️ Ish qidiryapman", "employer": "🏢 Ish beruvchiman"}
+
+async def render_search_page(search: dict):
+    page = search["page"]
+    rows = await db.search_ads(
+        search["q"], jinsi=search["jinsi"], role=SEARCH_ROLES.get(search["role"]),
+        after=search["cursors"][page], limit=SEARCH_PAGE_SIZE + 1
+    )
+    has_next = len(rows) > SEARCH_PAGE_SIZE
+    rows = rows[:SEARCH_PAGE_SIZE]
+    search["cursors"] = search["cursors"][:page + 1]
+    if has_next:
+        search["cursors"].append([rows[-1]["rank"], rows[-1]["code"]])
+
+    if rows:
+        lines = []
+        for row in rows:
+            ad = row["data"]
+            lines.append(
+                f"<b>{html.escape(row['code'])}</b> · {html.escape(ad.get('hudud', 'N/A'))} · "
+                f"{html.escape(ad.get('jinsi', 'N/A'))}\n{html.escape(ad.get('mahorat', '')[:80])}"
+            )
+        text = f"🔍 <b>Natijalar</b> ({page + 1}-sahifa):\n\n" + "\n\n".join(lines)
+    else:
+        text = "❌ Hech narsa topilmadi."
+    markup = get_search_pager(search["jinsi"], search["role"], has_prev=page > 0, has_next=has_next)
+    return text, markup
+
+@dp.message(F.text == "🔍 Matn bo'yicha qidirish")
+async def text_search_start(msg: types.Message, state: FSMContext):
+    if not is_admin(msg.from_user.id): return
+    await msg.answer("Kalit so'z kiriting (kasb, hudud, ism...):", reply_markup=get_cancel_menu())
+    await state.set_state(AdminForm.searching_text)
+
+@dp.message(AdminForm.searching_text)
+async def text_search_finish(msg: types.Message, state: FSMContext):
+    search = {"q": (msg.text or "").strip(), "jinsi": None, "role": None, "page": 0, "cursors": [None]}
+    text, markup = await render_search_page(search)
+    await state.set_state(None)
+    await state.update_data(search=search)
+    await msg.answer(text, reply_markup=markup)
+
+@dp.callback_query(F.data.startswith("srch_"))
+async def text_search_page(callback: types.CallbackQuery, state: FSMContext):
+    if not is_admin(callback.from_user.id): return
+    search = (await state.get_data()).get("search")
+    if not search:
+        await callback.answer("Qidiruv eskirgan, qaytadan qidiring.", show_alert=True)
+        return
+
+    action = callback.data.split("_", 2)
+    if action[1] == "next" and len(search["cursors"]) > search["page"] + 1:
+        search["page"] += 1
+    elif action[1] == "prev" and search["page"] > 0:
+        search["page"] -= 1
+    elif action[1] in ("jinsi", "role"):
+        # Facet almashganda qidiruv birinchi sahifadan boshlanadi
+        search[action[1]] = None if search[action[1]] == action[2] else action[2]
+        search["page"], search["cursors"] = 0, [None]
+
+    text, markup = await render_search_page(search)
+    await state.update_data(search=search)
+    await callback.message.edit_text(text, reply_markup=markup)
+    await callback.answer()
+
+# ================== MODERATSIYA NAVBATI ==================
+queue_notified_at = 0.0
+queue_nudge_task: asyncio.Task | None = None
+
+async def notify_queue():
+    # Bo'sh navbatga e'lon tushdi: adminlarga qisqa eslatma (MODERATION_NOTIFY_INTERVAL da bir marta).
+    # Oraliq ichida kelgan e'lon yo'qolmasin: oraliq tugagach navbat qayta tekshiriladi.
+    global queue_notified_at, queue_nudge_task
+    now = time.monotonic()
+    wait = queue_notified_at + MODERATION_NOTIFY_INTERVAL - now
+    if wait > 0:
+        if queue_nudge_task is None or queue_nudge_task.done():
+            queue_nudge_task = asyncio.create_task(deferred_notify_queue(wait))
+            background_tasks.add(queue_nudge_task)
+            queue_nudge_task.add_done_callback(background_tasks.discard)
+        return
+    queue_notified_at = now
+    kb = InlineKeyboardBuilder()
+    kb.button(text="📥 Ko'rish", callback_data="queue_next")
+    markup = kb.as_markup()
+    result = await fanout.send(
+        bot_config["admins"],
+        lambda admin_id: bot.send_message(admin_id, "📥 Navbatda yangi e'lon bor.", reply_markup=markup)
+    )
+    for admin_id, error in result.failed.items():
+        logging.warning(f"{admin_id} adminga eslatma yuborilmadi: {error}")
+
+async def deferred_notify_queue(delay: float):
+    await asyncio.sleep(delay)
+    try:
+        free, _ = await pending_ads.depth()
+        if free:
+            await notify_queue()
+    except Exception as e:
+        logging.error(f"Navbat eslatmasi yuborilmadi: {e}")
+
+async def send_next_ad(admin_id: int, skip: str | None = None):
+    # Eng eski bo'sh e'lon shu adminga biriktiriladi (lease) va faqat unga yuboriladi
+    temp_id, elon, left = await pending_ads.claim(admin_id, skip)
+    if temp_id is None:
+        _, claimed = await pending_ads.depth()
+        text = "📭 Navbat bo'sh."
+        if claimed:
+            text += f"\nBoshqa adminlar ko'rib chiqmoqda: {claimed}"
+        await bot.send_message(admin_id, text)
+        return
+    tracer.tag(temp_id=temp_id)
+    ad_text = elon.get("admin_text") or cached_render(
+        elon, "preview", lambda: create_ad_text(elon["data"], with_phone=True)
+    )
+    similar = await similar_ads.similar(cached_render(elon, "signature", lambda: ad_signature(elon["data"])))
+    warning = ""
+    if similar:
+        codes = ", ".join(f"{code} ({similarity:.0%})" for code, similarity in similar)
+        warning = f"\n⚠️ <b>O'xshash e'lonlar:</b> {codes}"
+    caption = (f"🆕 <b>YANGI E'LON!</b>\n\n{ad_text}\n{warning}\n📥 Navbatda yana: {left}\n"
+               f"<i>Boshqarish tugmalari:</i>")
+    await bot.send_photo(admin_id, photo=elon["check_id"], caption=caption,
+                         reply_markup=get_admin_check_keyboard(temp_id))
+
+@dp.message(F.text == "📥 Navbat")
+async def queue_next_msg(msg: types.Message):
+    if not is_admin(msg.from_user.id): return
+    await send_next_ad(msg.from_user.id)
+
+@dp.callback_query(F.data.startswith("queue_next"))
+async def queue_next_cb(callback: types.CallbackQuery):
+    if not is_admin(callback.from_user.id): return
+    # queue_next_<temp_id> - shu e'lon o'tkazib yuborildi
+    skip = callback.data.removeprefix("queue_next").lstrip("_") or None
+    await callback.answer()
+    await send_next_ad(callback.from_user.id, skip)
+
 # ================== TASDIQLASH (APPROVE) ==================
 @dp.callback_query(F.data.startswith("edit_text_"))
 async def click_edit_text(callback: types.CallbackQuery, state: FSMContext):
     if not is_admin(callback.from_user.id): return
     temp_id = callback.data.split("_")[2]
     await state.update_data(editing_temp_id=temp_id)
-    elon = pending_elons.get(temp_id)
+    elon = await pending_ads.get(temp_id)
     if elon:
         current_data = elon["data"]
-        txt = elon.get("admin_text") or create_ad_text(current_data, with_phone=True)
+        txt = elon.get("admin_text") or cached_render(
+            elon, "preview", lambda: create_ad_text(current_data, with_phone=True)
+        )
         await callback.message.answer("Eski matn pastda:")
         await callback.message.answer(txt)
         await state.set_state(AdminForm.waiting_for_new_text)
@@ -534,8 +860,7 @@ async def click_edit_text(callback: types.CallbackQuery, state: FSMContext):
 async def receive_new_text(msg: types.Message, state: FSMContext):
     data = await state.get_data()
     temp_id = data.get("editing_temp_id")
-    if temp_id in pending_elons:
-        pending_elons[temp_id]["admin_text"] = msg.text
+    if await pending_ads.update(temp_id, "admin_text", msg.html_text):
         await msg.answer("✅ Matn yangilandi.")
     await state.clear()
 
@@ -552,8 +877,7 @@ async def click_attach_photo(callback: types.CallbackQuery, state: FSMContext):
 async def receive_new_photo(msg: types.Message, state: FSMContext):
     data = await state.get_data()
     temp_id = data.get("editing_temp_id")
-    if temp_id in pending_elons:
-        pending_elons[temp_id]["admin_photo"] = msg.photo[-1].file_id
+    if await pending_ads.update(temp_id, "admin_photo", msg.photo[-1].file_id):
         await msg.answer("✅ Rasm biriktirildi.")
     await state.clear()
 
@@ -562,17 +886,24 @@ async def approve(callback: types.CallbackQuery):
     if not is_admin(callback.from_user.id): return
 
     temp_id = callback.data.split("_")[1]
-    if temp_id not in pending_elons:
+    elon = await pending_ads.get(temp_id)
+    if not elon:
         await callback.answer("Topilmadi.", show_alert=True)
         return
 
-    elon = pending_elons.pop(temp_id)
-    data = elon["data"]
-    user_id = elon["user_id"]
+    data = dict(elon["data"])
     admin_text = elon.get("admin_text")
     admin_photo = elon.get("admin_photo")
 
-    code = gen_code()
+    try:
+        code = await code_allocator.next()
+    except Exception as e:
+        # Kod bloki DB dan olinadi - tugma "aylanib" qolmasin
+        logging.error(f"E'lon kodi olinmadi: {e}")
+        await callback.answer("Xatolik, qayta urinib ko'ring.", show_alert=True)
+        return
+    tracer.tag(temp_id=temp_id, code=code)
+    body = cached_render(elon, "body", lambda: render_body(data))
     data["code"] = code
 
     # --- MATN TAYYORLASH ---
@@ -583,76 +914,165 @@ async def approve(callback: types.CallbackQuery):
             final_text_public += f"\n\n🔎 E’lon kodi: {code}"
             final_text_hidden += f"\n\n🔎 E’lon kodi: {code}"
     else:
-        final_text_public = create_ad_text(data, include_code=True, with_phone=False)
-        final_text_hidden = create_ad_text(data, include_code=True, with_phone=True)
+        final_text_public, final_text_hidden = render_ad(data, body)
 
     # --- KANALLARNI ANIQLASH ---
     channels = bot_config["channels"]
-    target_channel_id = channels.get("erkak") if data["jinsi"] == "Erkak" else channels.get("ayol")
-    hidden_channel_id = channels.get("yashirin")
+    target_type = "erkak" if data["jinsi"] == "Erkak" else "ayol"
+
+    # Joylash va xabar berish outbox orqali fonda bajariladi (publish_ad)
+    job = {
+        "code": code,
+        "user_id": elon["user_id"],
+        "target_type": target_type,
+        "target_channel_id": channels.get(target_type),
+        "hidden_channel_id": channels.get("yashirin"),
+        "photo": admin_photo if admin_photo else get_ad_photo(data.get("role"), data.get("jinsi")),
+        "admin_photo": admin_photo,
+        "text_public": final_text_public,
+        "text_hidden": f"🔐 #ARXIV\n\n{final_text_hidden}",
+        "admin_chat_id": callback.message.chat.id,
+        "admin_message_id": callback.message.message_id,
+        "trace_id": tracer.current_id(),
+    }
+    try:
+        approved = await pending_ads.approve(temp_id, code, data, [("publish_ad", f"{code}:publish", job)],
+                                           approved_by=callback.from_user.id,
+                                           revenue=parse_price(bot_config["payment"]["price"]),
+                                           signature=cached_render(elon, "signature",
+                                                                   lambda: ad_signature(elon["data"])))
+    except Exception as e:
+        # Postgres xatosi - tranzaksiya bekor bo'ldi, kod hech qayerga yozilmadi. Ulanish uzilishida
+        # COMMIT bo'lgan-bo'lmagani noma'lum: kod takrorlanmasligi uchun qaytarilmaydi.
+        if isinstance(e, asyncpg.PostgresError):
+            code_allocator.release(code)
+        logging.error(f"Tasdiqlashda xatolik: {e}")
+        await callback.answer("Xatolik, qayta urinib ko'ring.", show_alert=True)
+        return
+    if not approved:
+        code_allocator.release(code)
+        await callback.answer("Allaqachon hal qilingan yoki boshqa admin ko'rib chiqmoqda.", show_alert=True)
+        return
+    outbox.wake()
+    await callback.answer(f"✅ Tasdiqlandi: {code}")
 
-    # --- RASM ---
-    photo_to_send = admin_photo if admin_photo else get_ad_photo(data.get("role"), data.get("jinsi"))
+@outbox.handler("publish_ad")
+async def publish_ad(job: Job):
+    p = job.payload
 
-    try:
-        # 1. OMMAVIY KANAL
-        if target_channel_id:
-            if photo_to_send:
-                await bot.send_photo(target_channel_id, photo=photo_to_send, caption=final_text_public)
-            else:
-                await bot.send_message(target_channel_id, final_text_public)
-        
-        # 2. YASHIRIN KANAL
-        if hidden_channel_id:
-            if admin_photo:
-                await bot.send_photo(hidden_channel_id, photo=admin_photo, caption=f"🔐 #ARXIV\n\n{final_text_hidden}")
-            else:
-                await bot.send_message(hidden_channel_id, f"🔐 #ARXIV\n\n{final_text_hidden}")
+    async def send(chat_id, photo, text):
+        if photo:
+            # photo - statik rasm nomi yoki admin yuborgan file_id
+            return (await media.send_photo(bot, chat_id, photo, caption=text)).message_id
+        return (await bot.send_message(chat_id, text)).message_id
 
-        # 3. DB GA SAQLASH
-        await db.save_ad(code, data)
+    # 1. OMMAVIY KANAL
+    if p["target_channel_id"]:
+        await job.step("public", lambda: send(p["target_channel_id"], p["photo"], p["text_public"]))
 
-        # 4. USERGA XABAR
+    # 2. YASHIRIN KANAL
+    if p["hidden_channel_id"]:
+        await job.step("hidden", lambda: send(p["hidden_channel_id"], p["admin_photo"], p["text_hidden"]))
+
+    # 3. USERGA XABAR
+    async def notify_user():
         channel_link = None
-        if target_channel_id:
-            try:
-                chat_info = await bot.get_chat(target_channel_id)
-                if chat_info.username: channel_link = f"https://t.me/{chat_info.username}"
-                elif chat_info.invite_link: channel_link = chat_info.invite_link
-                else: channel_link = await bot.export_chat_invite_link(target_channel_id)
-            except: pass
-
-        user_msg = f"✅ <b>Tabriklaymiz! E'loningiz tasdiqlandi.</b>\n🔎 E'lon kodi: <b>{code}</b>\n\n"
+        if p["target_channel_id"]:
+            channel_link = await channel_links.get(bot, p["target_type"], p["target_channel_id"])
+
+        user_msg = f"✅ <b>Tabriklaymiz! E'loningiz tasdiqlandi.</b>\n🔎 E'lon kodi: <b>{p['code']}</b>\n\n"
         kb = None
         if channel_link:
             user_msg += "📢 E'loningiz kanalimizga joylandi.\nPastdagi tugma orqali kirib ko'rishingiz mumkin."
             kb_builder = InlineKeyboardBuilder()
             kb_builder.button(text="↗️ E'lonni ko'rish", url=channel_link)
             kb = kb_builder.as_markup()
-        
-        await bot.send_message(user_id, user_msg, reply_markup=kb)
-        await callback.message.edit_caption(caption=f"✅ <b>JOYLANDI</b>\nKod: {code}")
+        try:
+            return (await bot.send_message(p["user_id"], user_msg, reply_markup=kb)).message_id
+        except TelegramForbiddenError:
+            # Foydalanuvchi botni bloklagan - e'lon baribir joylandi
+            return None
+    await job.step("user", notify_user)
 
-    except Exception as e:
-        await callback.message.answer(f"Xatolik: {e}")
-        logging.error(e)
-    await callback.answer()
+    # 4. ADMIN XABARI
+    try:
+        await bot.edit_message_caption(chat_id=p["admin_chat_id"], message_id=p["admin_message_id"],
+                                       caption=f"✅ <b>JOYLANDI</b>\nKod: {p['code']}")
+    except TelegramBadRequest as e:
+        logging.warning(f"Admin xabari yangilanmadi: {e}")
+
+@outbox.on_failure("publish_ad")
+async def publish_ad_failed(job: Job, error: Exception):
+    # E'lon tasdiqlangan, lekin joylanmadi: e'londa belgi qoladi, admin qayta joylashi mumkin
+    p = job.payload
+    await db.set_publish_error(p["code"], str(error))
+    kb = InlineKeyboardBuilder()
+    kb.button(text="🔁 Qayta joylash", callback_data=f"republish_{p['code']}")
+    text = f"⚠️ <b>JOYLANMADI</b>\nKod: {p['code']}\nXatolik: {html.escape(str(error))}"
+    try:
+        await bot.edit_message_caption(chat_id=p["admin_chat_id"], message_id=p["admin_message_id"],
+                                       caption=text[:1024], reply_markup=kb.as_markup())
+    except TelegramBadRequest:
+        await bot.send_message(p["admin_chat_id"], text, reply_markup=kb.as_markup())
+
+@dp.callback_query(F.data.startswith("republish_"))
+async def republish(callback: types.CallbackQuery):
+    if not is_admin(callback.from_user.id): return
+    code = callback.data.removeprefix("republish_")
+    tracer.tag(code=code)
+    if not await db.retry_publish(code):
+        await callback.answer("Qayta joylanadigan e'lon topilmadi.", show_alert=True)
+        return
+    outbox.wake()
+    await callback.answer(f"🔁 Qayta joylanmoqda: {code}")
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except TelegramBadRequest:
+        pass
 
 @dp.callback_query(F.data.startswith("reject_"))
 async def reject(callback: types.CallbackQuery):
     if not is_admin(callback.from_user.id): return
     temp_id = callback.data.split("_")[1]
-    if temp_id in pending_elons:
-        elon = pending_elons.pop(temp_id)
-        await bot.send_message(elon["user_id"], "❌ Rad etildi.")
-        await callback.message.edit_caption(caption="❌ <b>RAD ETILDI</b>")
+    tracer.tag(temp_id=temp_id)
+    elon = await pending_ads.pop(temp_id, "rejected", by=callback.from_user.id)
+    if not elon:
+        await callback.answer("Allaqachon hal qilingan yoki boshqa admin ko'rib chiqmoqda.", show_alert=True)
+        return
+    await bot.send_message(elon["user_id"], "❌ Rad etildi.")
+    await callback.message.edit_caption(caption="❌ <b>RAD ETILDI</b>")
     await callback.answer()
 
 # ================== MAIN ==================
-async def main():
+# Fon vazifalari GC tomonidan yo'qotilmasligi uchun
+background_tasks = set()
+
+async def on_startup(metrics_port: int = METRICS_PORT):
+    await metrics_server.start(metrics_port)
     await db.connect()
+    await db.listen_config(refresh_config)
     await load_settings_from_db()
-    await dp.start_polling(bot)
+    await pending_ads.warm()
+    background_tasks.add(asyncio.create_task(outbox.run()))
+    background_tasks.add(asyncio.create_task(user_tracker.run()))
+    background_tasks.add(asyncio.create_task(similar_ads.load()))
+
+async def main():
+    if SHARD_WORKERS > 1:
+        # Har bir worker jarayoni on_startup ni o'zi bajaradi
+        await run_supervisor(dp, bot, SHARD_WORKERS)
+        return
+
+    await on_startup()
+    background_tasks.add(asyncio.create_task(pending_ads.expire_loop()))
+    background_tasks.add(asyncio.create_task(db.maintenance_loop()))
+    background_tasks.add(asyncio.create_task(similar_ads.backfill()))
+    if BOT_MODE == "webhook":
+        await run_webhook(dp, bot)
+    else:
+        # Oldin webhook o'rnatilgan bo'lsa getUpdates ishlamaydi
+        await bot.delete_webhook()
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
     asyncio.run(main())
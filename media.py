@@ -0,0 +1,137 @@
+import os
+import re
+import json
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message, URLInputFile
+
+# settings jadvalidagi kalit: media:<nom> -> {"file_id": ..., "digest": ...}
+MEDIA_PREFIX = "media:"
+# Saqlangan file_id ishlamay qolgani (boshqa bot tokeni, o'chirilgan fayl). Boshqa BadRequest
+# (uzun caption, chat topilmadi, parse_mode) qayta yuklash bilan tuzalmaydi.
+_FILE_ID_ERROR = re.compile(r"file identifier|file_id|file of type", re.IGNORECASE)
+
+
+@dataclass
+class _Asset:
+    name: str
+    source: str
+    file_id: str | None = None
+    # file_id qaysi kontent uchun olingan
+    digest: str | None = None
+    # Fayl hash'i (mtime, size) o'zgarmaguncha qayta hisoblanmaydi
+    stat: tuple | None = None
+    current: str | None = None
+
+    @property
+    def is_file(self) -> bool:
+        return os.path.isfile(self.source)
+
+    @property
+    def is_url(self) -> bool:
+        return self.source.startswith(("http://", "https://"))
+
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _sent_file_id(message: Message) -> str | None:
+    if message.photo:
+        return message.photo[-1].file_id
+    return None
+
+
+# Statik rasmlar (fayl yoki URL) bir marta yuklanadi, keyin Telegram file_id si ishlatiladi
+class MediaRegistry:
+    def __init__(self, database):
+        self.db = database
+        self._assets: dict[str, _Asset] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def register(self, name: str, source: str | None):
+        if source:
+            self._assets[name] = _Asset(name, source)
+
+    def __contains__(self, name) -> bool:
+        return name in self._assets
+
+    def _apply(self, name: str, value: str | None):
+        asset = self._assets.get(name)
+        if asset is None:
+            return
+        stored = json.loads(value) if value else {}
+        asset.file_id = stored.get("file_id")
+        asset.digest = stored.get("digest")
+
+    def load(self, settings: dict[str, str]):
+        # load_settings_from_db o'qigan settings dan (alohida so'rovsiz)
+        for name in self._assets:
+            self._apply(name, settings.get(MEDIA_PREFIX + name))
+
+    async def reload(self, name: str):
+        # Boshqa jarayon yangi file_id saqlaganda (NOTIFY settings:media:<nom>)
+        if name in self._assets:
+            self._apply(name, await self.db.get_setting(MEDIA_PREFIX + name))
+
+    async def _digest(self, asset: _Asset) -> str:
+        if not asset.is_file:
+            # URL kontentini yuklab olmaymiz - manzilning o'zi kalit
+            return "src:" + hashlib.sha256(asset.source.encode()).hexdigest()
+        st = os.stat(asset.source)
+        stat = (st.st_mtime_ns, st.st_size)
+        if asset.stat != stat:
+            asset.current = await asyncio.to_thread(_file_digest, asset.source)
+            asset.stat = stat
+        return asset.current
+
+    def _upload_input(self, asset: _Asset):
+        if asset.is_file:
+            return FSInputFile(asset.source)
+        if asset.is_url:
+            return URLInputFile(asset.source)
+        # Manbaning o'zi file_id (env ga file_id yozilgan)
+        return asset.source
+
+    async def _send(self, send, media: str | None, **kwargs) -> Message:
+        asset = self._assets.get(media) if media else None
+        if asset is None:
+            # Oddiy file_id (admin_photo, video_id) - o'zgarishsiz yuboriladi
+            return await send(media, **kwargs)
+
+        digest = await self._digest(asset)
+        if asset.file_id and asset.digest == digest:
+            try:
+                return await send(asset.file_id, **kwargs)
+            except TelegramBadRequest as e:
+                if not _FILE_ID_ERROR.search(e.message):
+                    raise
+                logging.warning(f"{asset.name}: file_id qabul qilinmadi ({e}), qayta yuklanadi")
+                asset.file_id = None
+
+        lock = self._locks.setdefault(asset.name, asyncio.Lock())
+        async with lock:
+            # Kutib turgan paytda boshqa korutina yuklab qo'ygan bo'lishi mumkin
+            if asset.file_id and asset.digest == digest:
+                return await send(asset.file_id, **kwargs)
+            message = await send(self._upload_input(asset), **kwargs)
+            file_id = _sent_file_id(message)
+            if file_id:
+                asset.file_id, asset.digest = file_id, digest
+                await self.db.set_setting(MEDIA_PREFIX + asset.name,
+                                          json.dumps({"file_id": file_id, "digest": digest}))
+                logging.info(f"{asset.name} yuklandi, file_id saqlandi.")
+            return message
+
+    async def send_photo(self, bot: Bot, chat_id: int, photo: str | None, **kwargs) -> Message:
+        return await self._send(lambda media, **kw: bot.send_photo(chat_id, photo=media, **kw),
+                                photo, **kwargs)
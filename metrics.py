@@ -0,0 +1,264 @@
+import os
+import time
+import logging
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Awaitable, Callable
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import TelegramObject, Update
+
+# 0 bo'lsa /metrics serveri ishga tushmaydi
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Bitta metrikadagi turli label qiymatlari chegarasi (qolganlari "other" ga tushadi)
+METRICS_MAX_LABELS = int(os.getenv("METRICS_MAX_LABELS", 200))
+
+# Sekundlarda (1 ms dan 10 s gacha)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Xotirada saqlanadigan oddiy latency histogrammasi
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # Oxirgi katak - eng katta chegaradan ham kattalar (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # Katak yuqori chegarasi bo'yicha taxminiy qiymat
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+
+# --- PROMETHEUS ---
+def _labels(label: str | None, value) -> str:
+    if label is None:
+        return ""
+    value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'{label}="{value}"'
+
+
+def _sample(name: str, labels: str, value) -> str:
+    return f"{name}{{{labels}}} {value}" if labels else f"{name} {value}"
+
+
+class HistogramFamily:
+    # children tashqaridan berilishi mumkin (masalan Database.query_latency)
+    def __init__(self, name: str, help: str, label: str | None = None,
+                 children: dict | None = None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.children = children if children is not None else {}
+
+    def observe(self, key, value: float):
+        histogram = self.children.get(key)
+        if histogram is None:
+            if len(self.children) >= METRICS_MAX_LABELS:
+                key = "other"
+                histogram = self.children.get(key)
+            if histogram is None:
+                histogram = self.children[key] = Histogram()
+        histogram.observe(value)
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, h in list(self.children.items()):
+            labels = _labels(self.label, key)
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(h.buckets, h.counts):
+                cumulative += count
+                lines.append(_sample(f"{self.name}_bucket", f'{prefix}le="{bound}"', cumulative))
+            lines.append(_sample(f"{self.name}_bucket", f'{prefix}le="+Inf"', h.count))
+            lines.append(_sample(f"{self.name}_sum", labels, h.sum))
+            lines.append(_sample(f"{self.name}_count", labels, h.count))
+        return lines
+
+
+class CounterFamily:
+    def __init__(self, name: str, help: str, label: str | None = None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = Counter()
+
+    def inc(self, key=None, amount: int = 1):
+        if key not in self.values and len(self.values) >= METRICS_MAX_LABELS:
+            key = "other"
+        self.values[key] += amount
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [_sample(self.name, _labels(self.label, k), v) for k, v in self.values.items()]
+        return lines
+
+
+class GaugeFamily:
+    # Qiymat so'rov paytida o'qiladi: fn() son yoki {label: son} qaytaradi
+    def __init__(self, name: str, help: str, fn: Callable[[], Any], label: str | None = None,
+                 kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.label = label
+        self.kind = kind
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            value = self.fn()
+        except Exception as e:
+            logging.warning(f"Metrika {self.name} o'qilmadi: {e}")
+            return []
+        if isinstance(value, dict):
+            lines += [_sample(self.name, _labels(self.label, k), v) for k, v in value.items()]
+        elif value is not None:
+            lines.append(_sample(self.name, "", value))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.families: dict[str, Any] = {}
+
+    def _add(self, family):
+        # Qayta ro'yxatdan o'tkazish (masalan benchmarkda) eskisini almashtiradi
+        self.families[family.name] = family
+        return family
+
+    def histogram(self, name: str, help: str, label: str | None = None,
+                  children: dict | None = None) -> HistogramFamily:
+        return self._add(HistogramFamily(name, help, label, children))
+
+    def counter(self, name: str, help: str, label: str | None = None) -> CounterFamily:
+        return self._add(CounterFamily(name, help, label))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], Any], label: str | None = None,
+              kind: str = "gauge") -> GaugeFamily:
+        return self._add(GaugeFamily(name, help, fn, label, kind))
+
+    def expose(self) -> str:
+        lines = []
+        for family in list(self.families.values()):
+            lines += family.expose()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# --- DISPATCHER ---
+def update_key(update: Update, raw_state: str | None) -> str:
+    # Kalit soni cheklangan bo'lishi kerak: callback prefiksi, FSM holati yoki buyruq
+    if update.callback_query is not None:
+        data = update.callback_query.data or ""
+        return "callback:" + data.split("_", 1)[0]
+    if update.message is not None:
+        if raw_state:
+            return "state:" + raw_state
+        text = update.message.text
+        if text and text.startswith("/"):
+            return "command:" + text.split(maxsplit=1)[0].split("@", 1)[0]
+        return "message"
+    return update.event_type
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    def __init__(self, metrics: Registry = registry):
+        self.latency = metrics.histogram(
+            "bot_update_seconds", "Update ishlash vaqti (FSM holati / callback prefiksi)", "handler")
+        self.errors = metrics.counter(
+            "bot_update_errors_total", "Xato bilan tugagan update'lar", "handler")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors.inc(update_key(event, data.get("raw_state")))
+            raise
+        finally:
+            self.latency.observe(update_key(event, data.get("raw_state")), time.perf_counter() - start)
+
+
+# --- BOT API ---
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    def __init__(self, metrics: Registry = registry):
+        self.latency = metrics.histogram("bot_api_seconds", "Bot API so'rovi vaqti", "method")
+        self.errors = metrics.counter("bot_api_errors_total", "Bot API xatolari", "method")
+        self.retry_after = metrics.counter(
+            "bot_api_retry_after_total", "Bot API RetryAfter (flood limit) javoblari", "method")
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            self.retry_after.inc(name)
+            raise
+        except Exception:
+            self.errors.inc(name)
+            raise
+        finally:
+            self.latency.observe(name, time.perf_counter() - start)
+
+
+# --- HTTP ENDPOINT ---
+class MetricsServer:
+    def __init__(self, metrics: Registry = registry):
+        self.metrics = metrics
+        self._runner: web.AppRunner | None = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.metrics.expose().encode(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def start(self, port: int = METRICS_PORT, host: str = METRICS_HOST):
+        if not port or self._runner:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logging.info(f"Metrikalar http://{host}:{port}/metrics da.")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
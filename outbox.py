@@ -0,0 +1,201 @@
+import os
+import random
+import asyncio
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from metrics import Registry
+from tracing import tracer
+
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", 5))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+# Ishni olgan jarayon shu vaqt ichida tugatmasa, ish boshqasiga beriladi
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", 120))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 5))
+OUTBOX_MAX_BACKOFF = 600
+# Bajarilgan ishlar shuncha kun saqlanadi
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", 7))
+
+
+# Ish turi uchun handler ro'yxatdan o'tmagan (boshqa versiyadagi jarayon yozgan ish)
+class UnknownJobKind(Exception):
+    pass
+
+
+# Qayta urinish foyda bermaydigan xatolar (chat yo'q, bot bloklangan, ...). KeyError/IndexError
+# kabi xatolar bu yerda emas: vaqtinchalik bo'lishi mumkin, odatdagi backoff bilan qayta uriniladi.
+PERMANENT_ERRORS = (TelegramBadRequest, TelegramForbiddenError, UnknownJobKind)
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    payload: dict
+    progress: dict = field(default_factory=dict)
+    attempts: int = 0
+    db: Any = None
+    # Uzoq ishlar (broadcast) progress saqlaganda lease'ni shunchaga uzaytiradi
+    lease: float = 0
+
+    async def step(self, name: str, action: Callable[[], Awaitable[Any]]):
+        # Bajarilgan qadam qayta ishga tushganda takrorlanmaydi.
+        # Natija JSON ga sig'adigan qiymat bo'lishi kerak (masalan message_id).
+        if name in self.progress:
+            return self.progress[name]
+        result = await action()
+        self.progress[name] = result
+        await self.db.save_job_progress(self.id, {name: result})
+        return result
+
+
+# Outbox ishlarini fonda bajaruvchi: bir nechta jarayon bir vaqtda ishlashi mumkin,
+# har bir ish FOR UPDATE SKIP LOCKED bilan faqat bittasiga tushadi
+class OutboxPublisher:
+    def __init__(self, database, concurrency: int = OUTBOX_CONCURRENCY,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS, lease: float = OUTBOX_LEASE,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL):
+        self.db = database
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.handlers: dict[str, Callable[[Job], Awaitable[None]]] = {}
+        # Ish butunlay muvaffaqiyatsiz tugaganda chaqiriladi (admin xabari, e'londa belgi)
+        self.failure_handlers: dict[str, Callable[[Job, Exception], Awaitable[None]]] = {}
+        self.results = Counter()
+        self._tasks: set[asyncio.Task] = set()
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._purged_at = 0.0
+
+    def handler(self, kind: str):
+        def register(fn):
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    def on_failure(self, kind: str):
+        def register(fn):
+            self.failure_handlers[kind] = fn
+            return fn
+        return register
+
+    def wake(self):
+        # Yangi ish yozilgandan keyin kutmasdan olish uchun
+        self._wake.set()
+
+    async def enqueue(self, kind: str, dedup_key: str | None, payload: dict) -> bool:
+        added = await self.db.enqueue_job(kind, dedup_key, payload)
+        self.wake()
+        return added
+
+    def _backoff(self, attempts: int) -> float:
+        return min(2 ** attempts, OUTBOX_MAX_BACKOFF) * random.uniform(0.5, 1.0)
+
+    async def _run_job(self, job: Job):
+        handler = self.handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise UnknownJobKind(f"Noma'lum ish turi: {job.kind}")
+            await handler(job)
+        except TelegramRetryAfter as e:
+            # Flood limit urinish hisoblanmaydi
+            self.results["retry"] += 1
+            await self.db.finish_job(job.id, "pending", str(e), e.retry_after, refund=True)
+        except PERMANENT_ERRORS as e:
+            logging.error(f"Outbox #{job.id} ({job.kind}) bajarilmadi: {e}")
+            await self._failed(job, e)
+        except Exception as e:
+            if job.attempts >= self.max_attempts:
+                logging.error(f"Outbox #{job.id} ({job.kind}): urinishlar tugadi: {e}")
+                await self._failed(job, e)
+            else:
+                self.results["retry"] += 1
+                delay = self._backoff(job.attempts)
+                logging.warning(f"Outbox #{job.id} ({job.kind}) {delay:.0f}s dan keyin qayta: {e}")
+                await self.db.finish_job(job.id, "pending", str(e), delay)
+        else:
+            self.results["done"] += 1
+            await self.db.finish_job(job.id, "done")
+
+    async def _failed(self, job: Job, error: Exception):
+        self.results["failed"] += 1
+        await self.db.finish_job(job.id, "failed", str(error))
+        handler = self.failure_handlers.get(job.kind)
+        if handler is None:
+            return
+        try:
+            await handler(job, error)
+        except Exception as e:
+            logging.error(f"Outbox #{job.id} ({job.kind}): xato ishlovchisi yiqildi: {e}")
+
+    async def _guarded(self, job: Job):
+        # Ish izi uni yaratgan update izi bilan bog'lanadi (payload dagi trace_id)
+        with tracer.trace(f"job:{job.kind}", parent=job.payload.get("trace_id")):
+            tracer.tag(job_id=job.id, **({"code": job.payload["code"]} if "code" in job.payload else {}))
+            try:
+                await self._run_job(job)
+            except Exception as e:
+                # finish_job o'zi yiqilsa lease tugagach ish qayta olinadi
+                logging.error(f"Outbox #{job.id} holati saqlanmadi: {e}")
+
+    async def run_once(self) -> int:
+        free = self.concurrency - len(self._tasks)
+        if free <= 0:
+            await asyncio.wait(set(self._tasks), return_when=asyncio.FIRST_COMPLETED)
+            return 0
+        rows = await self.db.claim_jobs(free, self.lease)
+        for row in rows:
+            task = asyncio.create_task(self._guarded(Job(**row, db=self.db, lease=self.lease)))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return len(rows)
+
+    async def _purge(self):
+        loop = asyncio.get_running_loop()
+        if loop.time() - self._purged_at < 3600:
+            return
+        self._purged_at = loop.time()
+        purged = await self.db.purge_jobs(OUTBOX_RETENTION_DAYS * 86400)
+        if purged:
+            logging.info(f"Outbox: {purged} ta eski ish o'chirildi.")
+
+    async def run(self):
+        while not self._stopping:
+            claimed = 0
+            try:
+                await self._purge()
+                claimed = await self.run_once()
+            except Exception as e:
+                logging.error(f"Outbox xatosi: {e}")
+            if claimed:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def drain(self):
+        # Navbatdagi barcha ishlar tugaguncha (benchmark va qo'lda ishga tushirish uchun)
+        while await self.run_once() or self._tasks:
+            if self._tasks:
+                await asyncio.wait(set(self._tasks), return_when=asyncio.FIRST_COMPLETED)
+
+    async def stop(self, timeout: float = 30):
+        self._stopping = True
+        self._wake.set()
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+
+    def register_metrics(self, metrics: Registry):
+        metrics.gauge("outbox_jobs_total", "Outbox ishlari natijasi",
+                      lambda: dict(self.results), "result", kind="counter")
+        metrics.gauge("outbox_inflight", "Bajarilayotgan outbox ishlari", lambda: len(self._tasks))
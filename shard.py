@@ -0,0 +1,238 @@
+import os
+import sys
+import time
+import queue
+import signal
+import asyncio
+import hashlib
+import logging
+import importlib
+import multiprocessing as mp
+from bisect import bisect
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from fanout import GLOBAL_RATE, SharedTokenBucket, fanout
+from tracing import tracer
+from webhook import BOT_MODE, WEBHOOK_MAX_INFLIGHT, OrderedDispatch, WebhookServer
+
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", 1))
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", 64))
+# Worker navbatidan bir martada olinadigan update'lar soni
+SHARD_BATCH = 100
+# Worker navbatining chegarasi: to'lsa webhook 503 qaytaradi, polling esa offset'ni surmay kutadi
+SHARD_QUEUE_MAX = int(os.getenv("SHARD_QUEUE_MAX", 1000))
+SHARD_FULL_BACKOFF = 1.0
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+# Consistent hash: worker soni o'zgarganda foydalanuvchilarning kam qismi ko'chadi
+class HashRing:
+    def __init__(self, nodes: int, vnodes: int = SHARD_VNODES):
+        points = sorted((_hash(f"{node}:{i}"), node) for node in range(nodes) for i in range(vnodes))
+        self._keys = [p[0] for p in points]
+        self._nodes = [p[1] for p in points]
+
+    def node(self, user_id: int) -> int:
+        i = bisect(self._keys, _hash(str(user_id))) % len(self._keys)
+        return self._nodes[i]
+
+
+def raw_user_id(raw: dict) -> int | None:
+    for value in raw.values():
+        if isinstance(value, dict):
+            user = value.get("from") or value.get("user")
+            if isinstance(user, dict) and "id" in user:
+                return user["id"]
+    return None
+
+
+# --- WORKER ---
+def _main_module():
+    # spawn bolasi `python main.py` ni allaqachon __mp_main__ nomi bilan yuklagan:
+    # import_module("main") uni ikkinchi marta (yana bir bot, dp, pool bilan) bajarardi
+    module = sys.modules.get("__mp_main__")
+    if module is not None and os.path.basename(getattr(module, "__file__", None) or "") == "main.py":
+        sys.modules.setdefault("main", module)
+        return module
+    return importlib.import_module("main")
+
+
+async def default_setup(index: int):
+    # Har bir worker o'z DB pool'i va bot sessiyasi bilan main.py ni yuklaydi
+    main = _main_module()
+    # Har bir worker o'z portida: METRICS_PORT + index
+    await main.on_startup(main.METRICS_PORT + index if main.METRICS_PORT else 0)
+    # Kutilayotgan e'lonlar keshi har bir workerda bor - tozalash hammasida, jadval esa faqat 0-da
+    main.background_tasks.add(asyncio.create_task(main.pending_ads.expire_loop(database=index == 0)))
+    if index == 0:
+        main.background_tasks.add(asyncio.create_task(main.db.maintenance_loop()))
+        main.background_tasks.add(asyncio.create_task(main.similar_ads.backfill()))
+    return main.dp, main.bot
+
+
+async def _serve(index: int, inbox, results, setup):
+    dp, bot = await setup(index)
+    dispatch = OrderedDispatch(dp, bot, WEBHOOK_MAX_INFLIGHT)
+    loop = asyncio.get_running_loop()
+    started = None
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    logging.info(f"Worker {index} ishga tushdi (pid {os.getpid()}).")
+    if results is not None:
+        results.put(("ready", index))
+
+    running = True
+    while running:
+        batch = [await loop.run_in_executor(None, inbox.get)]
+        try:
+            while len(batch) < SHARD_BATCH:
+                batch.append(inbox.get_nowait())
+        except queue.Empty:
+            pass
+        if started is None:
+            started = time.perf_counter()
+        for raw in batch:
+            if raw is None:
+                running = False
+                break
+            await dispatch.acquire()
+            dispatch.submit(Update.model_validate(raw, context={"bot": bot}))
+
+    await dispatch.drain()
+    await dp.emit_shutdown(bot=bot, dispatcher=dp)
+    if results is not None:
+        elapsed = time.perf_counter() - started if started else 0.0
+        results.put(("done", index, dispatch.processed, elapsed))
+
+
+def run_worker(index: int, inbox, results=None, setup=default_setup, global_rate=None):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    tracer.use_worker_file(index)
+    if global_rate is not None:
+        # Umumiy xabar/s limiti barcha worker'lar uchun bitta
+        fanout.global_bucket = SharedTokenBucket(GLOBAL_RATE, global_rate)
+    asyncio.run(_serve(index, inbox, results, setup))
+
+
+# --- SUPERVISOR ---
+class Supervisor:
+    def __init__(self, workers: int = SHARD_WORKERS, setup=default_setup, results=None):
+        self.ctx = mp.get_context("spawn")
+        self.workers = workers
+        self.setup = setup
+        self.results = results
+        self.ring = HashRing(workers)
+        self.inboxes = [self.ctx.Queue(SHARD_QUEUE_MAX) for _ in range(workers)]
+        self.global_rate = SharedTokenBucket.create_state(self.ctx, GLOBAL_RATE)
+        self.processes: list[mp.Process | None] = [None] * workers
+
+    def _spawn(self, index: int):
+        process = self.ctx.Process(target=run_worker, name=f"shard-{index}",
+                                   args=(index, self.inboxes[index], self.results, self.setup,
+                                         self.global_rate))
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def route(self, raw: dict, block: bool = False) -> bool:
+        # False - worker navbati to'la, update qabul qilinmadi
+        user_id = raw_user_id(raw)
+        index = self.ring.node(user_id) if user_id is not None else raw.get("update_id", 0) % self.workers
+        try:
+            self.inboxes[index].put(raw, block)
+        except queue.Full:
+            return False
+        return True
+
+    def check(self):
+        # O'lgan workerni o'sha indeks bilan qayta ko'taramiz (foydalanuvchilar o'z joyida qoladi)
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                logging.error(f"Worker {index} to'xtadi (exit {process.exitcode}), qayta ishga tushirilmoqda")
+                self._spawn(index)
+
+    def stop(self, timeout: float = 30):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+
+
+async def _poll(supervisor: Supervisor, bot: Bot, dp: Dispatcher, stop_event: asyncio.Event):
+    allowed_updates = dp.resolve_used_update_types()
+    offset = None
+    while not stop_event.is_set():
+        supervisor.check()
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=10, allowed_updates=allowed_updates)
+        except Exception as e:
+            logging.error(f"getUpdates xatosi: {e}")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            if not supervisor.route(update.model_dump(mode="json", by_alias=True, exclude_none=True)):
+                # offset surilmaydi: qolganlari keyingi getUpdates da tartibi bilan qayta keladi
+                logging.warning("Worker navbati to'la, getUpdates kechiktirildi")
+                await asyncio.sleep(SHARD_FULL_BACKOFF)
+                break
+            offset = update.update_id + 1
+
+
+class ShardedWebhookServer(WebhookServer):
+    def __init__(self, supervisor: Supervisor, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.supervisor = supervisor
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not self._check_secret(request):
+            return web.Response(status=401)
+        if self._closing:
+            return web.Response(status=503)
+        try:
+            raw = await request.json()
+        except Exception:
+            return web.Response(status=400)
+        if not self.supervisor.route(raw):
+            logging.warning("Webhook: worker navbati to'la, 503 qaytarildi")
+            return web.Response(status=503)
+        return web.Response()
+
+
+async def run_supervisor(dp: Dispatcher, bot: Bot, workers: int = SHARD_WORKERS):
+    supervisor = Supervisor(workers)
+    supervisor.start()
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    logging.info(f"Supervisor: {workers} ta worker, ingress: {BOT_MODE}")
+
+    try:
+        if BOT_MODE == "webhook":
+            server = ShardedWebhookServer(supervisor, dp, bot)
+            await server.start()
+            while not stop_event.is_set():
+                supervisor.check()
+                try:
+                    await asyncio.wait_for(stop_event.wait(), 5)
+                except asyncio.TimeoutError:
+                    pass
+            await server.stop()
+        else:
+            await bot.delete_webhook()
+            await _poll(supervisor, bot, dp, stop_event)
+    finally:
+        await loop.run_in_executor(None, supervisor.stop)
+        await bot.session.close()
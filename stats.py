@@ -0,0 +1,51 @@
+import os
+import re
+import html
+from collections import Counter
+
+# Kunlik statistika shu vaqt mintaqasidagi sana bo'yicha yig'iladi
+STATS_TIMEZONE = os.getenv("STATS_TIMEZONE", "Asia/Tashkent")
+# Hudud - foydalanuvchi yozgan erkin matn: dashboard'da har davr uchun eng ko'p e'lonli
+# STATS_TOP_REGIONS tasi, qolganlari bitta "Boshqa" qatoriga yig'iladi (SQL ichida)
+STATS_TOP_REGIONS = int(os.getenv("STATS_TOP_REGIONS", 10))
+STATS_OTHER_REGION = "Boshqa"
+
+PERIODS = (("today", "Bugun"), ("week", "7 kun"), ("month", "30 kun"), ("all", "Jami"))
+
+
+def parse_price(price: str | None) -> int:
+    # "10 000 so'm" -> 10000 (narx sozlamasi erkin matn)
+    digits = re.sub(r"\D", "", price or "")
+    return int(digits) if digits else 0
+
+
+def _money(value: int) -> str:
+    return f"{value:,}".replace(",", " ")
+
+
+def _line(title: str, rows: list[dict]) -> str:
+    approved = sum(r["approved"] for r in rows)
+    rejected = sum(r["rejected"] for r in rows)
+    revenue = sum(r["revenue"] for r in rows)
+    return f"<b>{title}:</b> ✅ {approved} · ❌ {rejected} · 💰 {_money(revenue)}"
+
+
+def _breakdown(rows: list[dict], key: str, limit: int | None = None) -> str:
+    counts = Counter()
+    for r in rows:
+        counts[r[key] or "—"] += r["approved"]
+    items = [(name, n) for name, n in counts.most_common(limit) if n]
+    return " · ".join(f"{html.escape(name)} {n}" for name, n in items) or "—"
+
+
+# get_stats_dashboard natijasi (davr -> rollup qatorlari) dan admin uchun matn
+def format_dashboard(stats: dict[str, list[dict]]) -> str:
+    lines = ["📊 <b>Statistika</b>\n"]
+    for period, title in PERIODS:
+        lines.append(_line(title, stats.get(period, [])))
+    month = stats.get("month", [])
+    lines.append("\n<b>Joylangan e'lonlar (30 kun)</b>")
+    lines.append(f"👫 Jinsi: {_breakdown(month, 'jinsi')}")
+    lines.append(f"👔 Turi: {_breakdown(month, 'role')}")
+    lines.append(f"📍 Hududlar: {_breakdown(month, 'hudud', STATS_TOP_REGIONS + 1)}")
+    return "\n".join(lines)
@@ -0,0 +1,129 @@
+import os
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Mapping
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.types import TelegramObject
+
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", 10000))
+
+
+class _Record:
+    __slots__ = ("state", "data", "dirty")
+
+    def __init__(self, state: str | None = None, data: dict | None = None):
+        self.state = state
+        self.data = data or {}
+        self.dirty = False
+
+
+# Postgres FSM storage. O'qishlar foydalanuvchi bo'yicha keshlanadi, yozuvlar esa
+# bitta update davomida yig'ilib, FSMFlushMiddleware orqali bitta UPSERT bilan yoziladi.
+# Kesh to'g'ri bo'lishi uchun bitta foydalanuvchi faqat bitta jarayonda ishlanishi kerak.
+class PgStorage(BaseStorage):
+    def __init__(self, database, key_builder: KeyBuilder | None = None,
+                 cache_size: int = FSM_CACHE_SIZE):
+        self.db = database
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, _Record] = OrderedDict()
+        # DB dan o'qilayotgan kalitlar: bir vaqtdagi ikkinchi o'qish birinchisini kutadi,
+        # aks holda ikki yozuv paydo bo'lib, bittasiga yozilgan holat yo'qoladi
+        self._loading: dict[str, asyncio.Event] = {}
+
+    async def _record(self, key: StorageKey) -> _Record:
+        k = self.key_builder.build(key)
+        while True:
+            record = self._cache.get(k)
+            if record is not None:
+                self._cache.move_to_end(k)
+                return record
+            loading = self._loading.get(k)
+            if loading is None:
+                break
+            await loading.wait()
+        loading = self._loading[k] = asyncio.Event()
+        try:
+            row = await self.db.get_fsm(k)
+            record = _Record(*row) if row else _Record()
+            self._evict(self.cache_size - 1)
+            self._cache[k] = record
+            return record
+        finally:
+            del self._loading[k]
+            loading.set()
+
+    def _evict(self, limit: int):
+        # Eng eskisidan boshlab faqat yozilib bo'lgan (toza) yozuvlar chiqariladi,
+        # yozilmagani oxiriga suriladi
+        for _ in range(len(self._cache)):
+            if len(self._cache) <= limit:
+                return
+            k, record = self._cache.popitem(last=False)
+            if record.dirty:
+                self._cache[k] = record
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        record.dirty = True
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        record = await self._record(key)
+        record.data = dict(data)
+        record.dirty = True
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return (await self._record(key)).data.copy()
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> dict[str, Any]:
+        record = await self._record(key)
+        record.data.update(data)
+        record.dirty = True
+        return record.data.copy()
+
+    async def flush(self, key: StorageKey | None = None):
+        if key is not None:
+            k = self.key_builder.build(key)
+            keys = [k] if k in self._cache and self._cache[k].dirty else []
+        else:
+            keys = [k for k, r in self._cache.items() if r.dirty]
+        if not keys:
+            return
+        # Nusxa: yozish kutilayotganda handler data ni o'zgartirsa ham shu holat yoziladi
+        records = [(k, self._cache[k].state, dict(self._cache[k].data)) for k in keys]
+        for k in keys:
+            self._cache[k].dirty = False
+        try:
+            await self.db.save_fsm(records)
+        except Exception:
+            for k in keys:
+                if k in self._cache:
+                    self._cache[k].dirty = True
+            raise
+
+    async def close(self) -> None:
+        await self.flush()
+
+
+# Handler tugagach joriy foydalanuvchining o'zgargan FSM holatini yozib qo'yadi
+class FSMFlushMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            storage = data.get("fsm_storage")
+            context = data.get("state")
+            if context is not None and isinstance(storage, PgStorage):
+                await storage.flush(context.key)
@@ -0,0 +1,267 @@
+import os
+import json
+import atexit
+import time
+import queue
+import random
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+
+from metrics import Registry, update_key
+
+# Bo'sh bo'lsa tracing o'chirilgan
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+# Shundan sekin, xato bilan tugagan yoki e'lon (temp_id/kod) bilan belgilangan izlar har doim
+# yoziladi, qolganlari TRACE_SAMPLE_RATE ulushda
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", 500))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", 50 * 2 ** 20))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", 5))
+# Uzoq ishlar (broadcast) xotirani to'ldirmasligi uchun bitta izdagi span'lar chegarasi
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", 200))
+TRACE_QUEUE_SIZE = 10_000
+
+_current: ContextVar["Trace | None"] = ContextVar("trace", default=None)
+
+
+class Trace:
+    __slots__ = ("id", "name", "parent", "started", "start", "tags", "spans", "dropped", "keep")
+
+    def __init__(self, name: str, parent: str | None = None):
+        # Korrelyatsiya ID: loglarda, outbox payload'ida va boshqa izlarning parent maydonida
+        self.id = f"{random.getrandbits(64):016x}"
+        self.name = name
+        self.parent = parent
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.tags: dict[str, Any] = {}
+        # (nomi, boshlanishi, davomiyligi, xato) - vaqtlar perf_counter bo'yicha
+        self.spans: list[tuple] = []
+        self.dropped = 0
+        self.keep = False
+
+
+class _Span:
+    __slots__ = ("tracer", "kind", "name", "start")
+
+    def __init__(self, tracer: "Tracer", kind: str, name: str):
+        self.tracer, self.kind, self.name = tracer, kind, name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.record(self.kind, self.name, self.start, exc)
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+
+_NO_SPAN = _NoSpan()
+
+
+# Yozuvlar navbat orqali alohida oqimda faylga yoziladi; navbat to'lsa iz tashlanadi
+class _DroppingQueueHandler(QueueHandler):
+    def __init__(self, q: queue.Queue, tracer: "Tracer"):
+        super().__init__(q)
+        self.tracer = tracer
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.tracer.results["queue_full"] += 1
+
+
+class Tracer:
+    def __init__(self, path: str = TRACE_FILE, slow_ms: float = TRACE_SLOW_MS,
+                 sample_rate: float = TRACE_SAMPLE_RATE, max_spans: int = TRACE_MAX_SPANS):
+        self.path = path
+        self.enabled = bool(path)
+        self.slow = slow_ms / 1000
+        self.sample_rate = sample_rate
+        self.max_spans = max_spans
+        # Izlar taqdiri: slow / error / tagged / sampled / skipped / queue_full
+        self.results = Counter()
+        self._queue = None
+        self._listener = None
+
+    def _open(self):
+        handler = RotatingFileHandler(self.path, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUPS,
+                                      encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        q = queue.Queue(TRACE_QUEUE_SIZE)
+        self._listener = QueueListener(q, handler)
+        self._listener.start()
+        # Logger orqali emas: logging.disable() yoki root sozlamalari izlarga ta'sir qilmasin
+        self._queue = _DroppingQueueHandler(q, self)
+        # Yozuvchi oqim daemon - jarayon tugashida navbatdagilar yo'qolmasin
+        atexit.register(self._close)
+
+    def use_worker_file(self, index: int):
+        # RotatingFileHandler jarayonlar o'rtasida xavfsiz emas: har bir shard o'z faylida
+        # (traces.jsonl -> traces.1.jsonl), fayl birinchi izda ochiladi
+        if self.enabled and self._listener is None:
+            root, ext = os.path.splitext(self.path)
+            self.path = f"{root}.{index}{ext}"
+
+    def _close(self):
+        if self._listener:
+            self._listener.stop()
+            self._listener = None
+
+    async def stop(self):
+        self._close()
+
+    # --- JORIY IZ ---
+    def current_id(self) -> str | None:
+        trace = _current.get()
+        return trace.id if trace else None
+
+    def tag(self, **tags):
+        # temp_id/kod bilan belgilangan iz sekin bo'lmasa ham saqlanadi - e'lonni boshidan
+        # oxirigacha kuzatish uchun (har bir e'lon uchun bir necha iz, yuk bilan o'smaydi)
+        trace = _current.get()
+        if trace is not None:
+            trace.tags.update(tags)
+            trace.keep = True
+
+    def span(self, kind: str, name: str):
+        if _current.get() is None:
+            return _NO_SPAN
+        return _Span(self, kind, name)
+
+    def record(self, kind: str, name: str, start: float, error: BaseException | None = None):
+        trace = _current.get()
+        if trace is None:
+            return
+        if len(trace.spans) >= self.max_spans:
+            trace.dropped += 1
+            return
+        trace.spans.append((f"{kind}:{name}", start, time.perf_counter() - start,
+                            type(error).__name__ if error else None))
+
+    @contextmanager
+    def trace(self, name: str, parent: str | None = None, **tags):
+        if not self.enabled:
+            yield None
+            return
+        trace = Trace(name, parent)
+        trace.tags.update(tags)
+        token = _current.set(trace)
+        error = None
+        try:
+            yield trace
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current.reset(token)
+            self._finish(trace, error)
+
+    # --- YOZISH ---
+    def _finish(self, trace: Trace, error: BaseException | None):
+        duration = time.perf_counter() - trace.start
+        if error is not None or any(span[3] for span in trace.spans):
+            reason = "error"
+        elif duration >= self.slow:
+            reason = "slow"
+        elif trace.keep:
+            reason = "tagged"
+        elif random.random() < self.sample_rate:
+            reason = "sampled"
+        else:
+            self.results["skipped"] += 1
+            return
+        self.results[reason] += 1
+        record = {
+            "trace_id": trace.id,
+            "parent": trace.parent,
+            "name": trace.name,
+            "ts": round(trace.started, 3),
+            "ms": round(duration * 1000, 2),
+            "kept": reason,
+            "tags": trace.tags,
+            "spans": [
+                {"name": name, "at": round((start - trace.start) * 1000, 2), "ms": round(ms * 1000, 2),
+                 **({"error": err} if err else {})}
+                for name, start, ms, err in trace.spans
+            ],
+        }
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
+        if trace.dropped:
+            record["dropped_spans"] = trace.dropped
+        if self._listener is None:
+            self._open()
+        self._queue.handle(logging.makeLogRecord({"msg": json.dumps(record, ensure_ascii=False, default=str)}))
+
+    def register_metrics(self, metrics: Registry):
+        metrics.gauge("traces_total", "Izlar: yozilgan (sabab bo'yicha) va tashlangan",
+                      lambda: dict(self.results), "result", kind="counter")
+
+
+tracer = Tracer()
+
+
+# --- DISPATCHER ---
+# Har bir update alohida iz: user_id va handler kaliti (metrikalardagi update_key) bilan
+class TracingMiddleware(BaseMiddleware):
+    def __init__(self, trace: Tracer = tracer):
+        self.tracer = trace
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        if not self.tracer.enabled:
+            return await handler(event, data)
+        user = data.get("event_from_user")
+        with self.tracer.trace("update") as trace:
+            trace.tags["handler"] = update_key(event, data.get("raw_state"))
+            if user is not None:
+                trace.tags["user_id"] = user.id
+            return await handler(event, data)
+
+
+# Ichki middleware (message, callback_query): tanlangan handler funksiyasi span sifatida
+class HandlerSpanMiddleware(BaseMiddleware):
+    def __init__(self, trace: Tracer = tracer):
+        self.tracer = trace
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        target = data.get("handler")
+        name = getattr(getattr(target, "callback", None), "__name__", "handler")
+        with self.tracer.span("handler", name):
+            return await handler(event, data)
+
+
+# --- BOT API ---
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    def __init__(self, trace: Tracer = tracer):
+        self.tracer = trace
+
+    async def __call__(self, make_request, bot, method):
+        with self.tracer.span("api", method.__api_method__):
+            return await make_request(bot, method)
@@ -0,0 +1,150 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import TelegramObject
+
+from fanout import FanOut
+from metrics import Registry
+
+USERS_FLUSH_SIZE = int(os.getenv("USERS_FLUSH_SIZE", 500))
+USERS_FLUSH_INTERVAL = float(os.getenv("USERS_FLUSH_INTERVAL", 5))
+# Shu vaqt ichida qayta yozilgan foydalanuvchi uchun last_seen yangilanmaydi
+USERS_TOUCH_INTERVAL = float(os.getenv("USERS_TOUCH_INTERVAL", 3600))
+USERS_SEEN_CACHE = int(os.getenv("USERS_SEEN_CACHE", 100_000))
+# Broadcast progressi har shuncha foydalanuvchidan keyin saqlanadi
+BROADCAST_BATCH = int(os.getenv("BROADCAST_BATCH", 200))
+
+
+# Har bir update'dagi foydalanuvchini xotirada yig'ib, users jadvaliga to'plab yozadi
+class UserTracker(BaseMiddleware):
+    def __init__(self, database, flush_size: int = USERS_FLUSH_SIZE,
+                 flush_interval: float = USERS_FLUSH_INTERVAL,
+                 touch_interval: float = USERS_TOUCH_INTERVAL, seen_cache: int = USERS_SEEN_CACHE):
+        self.db = database
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.touch_interval = touch_interval
+        self.seen_cache = seen_cache
+        # user_id -> (username, first_name, role, last_seen)
+        self._buffer: dict[int, tuple] = {}
+        # Yaqinda yozilganlar (LRU): user_id -> yozilgan vaqt
+        self._seen: OrderedDict[int, float] = OrderedDict()
+        self._wake = asyncio.Event()
+        self._stopping = False
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            self.touch(user.id, user.username, user.first_name)
+        return await handler(event, data)
+
+    def touch(self, user_id: int, username: str | None = None, first_name: str | None = None,
+              role: str | None = None):
+        now = time.time()
+        pending = self._buffer.get(user_id)
+        if pending is None and role is None:
+            seen = self._seen.get(user_id)
+            if seen is not None and now - seen < self.touch_interval:
+                return
+        if pending is not None:
+            role = role or pending[2]
+            username = username or pending[0]
+            first_name = first_name or pending[1]
+        self._buffer[user_id] = (username, first_name, role, now)
+        if len(self._buffer) >= self.flush_size:
+            self._wake.set()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, {}
+        try:
+            await self.db.upsert_users([(uid, *row) for uid, row in batch.items()])
+        except Exception as e:
+            logging.error(f"Foydalanuvchilar saqlanmadi ({len(batch)} ta): {e}")
+            # Keyingi flush'da qayta urinamiz; shu orada kelgan yangilari ustun
+            self._buffer = {**batch, **self._buffer}
+            return
+        for uid, row in batch.items():
+            self._seen[uid] = row[3]
+            self._seen.move_to_end(uid)
+        while len(self._seen) > self.seen_cache:
+            self._seen.popitem(last=False)
+
+    async def run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def stop(self):
+        self._stopping = True
+        self._wake.set()
+        await self.flush()
+
+    def register_metrics(self, metrics: Registry):
+        metrics.gauge("users_buffered", "Yozilishini kutayotgan foydalanuvchilar", lambda: len(self._buffer))
+
+
+def is_dead_chat(error: Exception) -> bool:
+    # Bot bloklangan, akkaunt o'chirilgan yoki chat yo'q - bu foydalanuvchiga boshqa yozib bo'lmaydi
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    return isinstance(error, TelegramBadRequest) and "chat not found" in str(error).lower()
+
+
+# Barcha faol foydalanuvchilarga xabar (outbox ishi sifatida, progress har partiyada saqlanadi)
+class Broadcaster:
+    def __init__(self, bot: Bot, database, fanout: FanOut, batch: int = BROADCAST_BATCH):
+        self.bot = bot
+        self.db = database
+        self.fanout = fanout
+        self.batch = batch
+
+    async def run(self, job):
+        p = job.payload
+        progress = {"cursor": 0, "sent": 0, "failed": 0, "dead": 0, **job.progress}
+
+        async def send(chat_id: int):
+            await self.bot.copy_message(chat_id, p["from_chat_id"], p["message_id"])
+
+        while True:
+            # user_id bo'yicha keyset: qayta ishga tushganda aynan to'xtagan joydan davom etadi
+            user_ids = await self.db.get_user_ids_after(progress["cursor"], self.batch)
+            if not user_ids:
+                break
+            result = await self.fanout.send(user_ids, send)
+            dead = [uid for uid, e in result.failed.items() if is_dead_chat(e)]
+            progress["cursor"] = user_ids[-1]
+            progress["sent"] += len(result.delivered)
+            progress["failed"] += len(result.failed) - len(dead)
+            progress["dead"] += len(dead)
+            # Nofaol deb belgilash va progress bitta so'rovda
+            await self.db.broadcast_checkpoint(job.id, progress, dead, job.lease)
+            job.progress.update(progress)
+
+        await job.step("report", lambda: self._report(p, progress))
+
+    async def _report(self, payload: dict, progress: dict):
+        text = (f"📣 <b>Xabar yuborish tugadi</b>\n"
+                f"✅ Yetkazildi: {progress['sent']}\n"
+                f"🚫 Botni bloklagan: {progress['dead']}\n"
+                f"⚠️ Xato: {progress['failed']}")
+        try:
+            return (await self.bot.send_message(payload["admin_id"], text)).message_id
+        except TelegramForbiddenError:
+            return None
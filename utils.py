@@ -1,53 +1,137 @@
+import os
+import re
+import html
 import random
 import string
+import asyncio
+from collections import deque
 
-def gen_code():
-    return "E-" + ''.join(random.choices(string.digits, k=5))
+CODE_BLOCK_SIZE = int(os.getenv("CODE_BLOCK_SIZE", 50))
+
+def format_code(number: int) -> str:
+    # 5 xonadan oshsa avtomatik kengayadi: E-00042, E-123456
+    return f"E-{number:05d}"
+
+class CodeAllocator:
+    def __init__(self, reserve, block_size: int = CODE_BLOCK_SIZE):
+        # reserve(count) -> DB ketma-ketligidan band qilingan raqamlar ro'yxati
+        self.reserve = reserve
+        self.block_size = block_size
+        self._numbers = deque()
+        self._lock = asyncio.Lock()
+
+    async def next(self) -> str:
+        while not self._numbers:
+            async with self._lock:
+                if not self._numbers:
+                    self._numbers.extend(await self.reserve(self.block_size))
+        return format_code(self._numbers.popleft())
+
+    def release(self, code: str):
+        # Ishlatilmay qolgan kod (e'lon tasdiqlanmadi) keyingi tasdiqlashga beriladi
+        self._numbers.appendleft(int(code.removeprefix("E-")))
 
 def gen_temp_id():
     return "TEMP-" + ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
 
-def create_ad_text(data: dict, include_code: bool = False, with_phone: bool = False) -> str:
-    role = data.get("role", "Noma’lum")
-    
-    # === ISH BERUVCHI MATNI ===
-    if role == "🏢 Ish beruvchiman":
-        text = f"<b>🏢 XODIM KERAK ({data.get('hudud', 'N/A')})</b>\n\n"
-        # Ism so'ralmaydi, shuning uchun bu qatorni olib tashladik yoki umumiy yozdik
-        text += f"<b>🏢 Idora:</b> Ish beruvchi\n" 
-        text += f"<b>📍 Hudud:</b> {data.get('hudud', 'N/A')}\n"
-        text += f"<b>👷‍♂️ Kim kerak:</b> {data.get('jinsi', 'N/A')}\n"
-        text += f"<b>🔞 Yosh chegarasi:</b> {data.get('yoshi', 'N/A')}\n"
-        text += f"<b>📓 Talablar:</b> {data.get('mahorat', 'N/A')}\n"
-        text += f"<b>⏰ Ish vaqti:</b> {data.get('vaqt', 'N/A')}\n"
-        text += f"<b>ℹ️ Qo'shimcha:</b> {data.get('qosimcha', 'N/A')}\n"
-        text += f"<b>💰 Maosh:</b> {data.get('maosh', 'N/A')}\n"
-
-    # === ISHCHI MATNI (O'ZGARMADI) ===
-    else:
-        text = f"<b>👷‍♂️ ISH KERAK ({data.get('hudud', 'N/A')})</b>\n\n"
-        text += f"<b>👤 Ism:</b> {data.get('fish', 'N/A')}\n"
-        text += f"<b>📍 Hudud:</b> {data.get('hudud', 'N/A')}\n"
-        text += f"<b>🚻 Jinsi:</b> {data.get('jinsi', 'N/A')}\n"
-        text += f"<b>🆔 Yoshi:</b> {data.get('yoshi', 'N/A')}\n"
-        text += f"<b>🛠 Mutaxassisligi:</b> {data.get('mahorat', 'N/A')}\n"
-        
-        if data.get('masuliyat'):
-            text += f"<b>📌 Mas’uliyati:</b> {data.get('masuliyat')}\n"
-        
-        text += f"<b>⏰ Ish vaqti:</b> {data.get('vaqt', 'N/A')}\n"
-        
-        if data.get('bosh_vaqt'):
-            text += f"<b>🕒 Bo‘sh vaqt:</b> {data.get('bosh_vaqt')}\n"
-        if data.get('qosimcha'):
-            text += f"<b>🧰 Qo‘shimcha:</b> {data.get('qosimcha')}\n"
-            
-        text += f"<b>💰 Maosh:</b> {data.get('maosh', 'N/A')}\n"
+# ================== E'LON SHABLONLARI ==================
+EMPLOYER_ROLE = "🏢 Ish beruvchiman"
 
-    if with_phone:
-        text += f"\n<b>📞 Aloqa:</b> {data.get('tel', 'N/A')}\n"
+class _Layout:
+    # (sarlavha, maydon, majburiy): majburiy maydon bo'lmasa 'N/A', ixtiyoriysi tushib qoladi;
+    # oddiy satr - o'zgarmas qator. Ixtiyoriy maydonlarning har bir to'plami uchun
+    # bitta tayyor format satri bir marta yig'iladi va keyin faqat .format() qilinadi.
+    def __init__(self, header: str, lines: list):
+        self.rows = [(header + "\n\n", "hudud", True)]
+        for line in lines:
+            if isinstance(line, str):
+                self.rows.append((line.replace("{", "{{").replace("}", "}}") + "\n", None, True))
+            else:
+                label, field, required = line
+                self.rows.append((f"<b>{label}:</b> {{}}\n", field, required))
+        self.fields = tuple(field for _, field, _ in self.rows if field)
+        self.optional = tuple(field for _, field, required in self.rows if field and not required)
+        self._templates: dict[tuple, str] = {}
 
-    if include_code:
-        text += f"\n🔎 <b>E’lon kodi:</b> {data.get('code', 'N/A')}"
+    def template(self, present: tuple) -> str:
+        # present - qaysi ixtiyoriy maydonlar bor (optional tartibida)
+        template = self._templates.get(present)
+        if template is None:
+            shown = {f for f, p in zip(self.optional, present) if p}
+            template = "".join(fmt for fmt, field, required in self.rows
+                               if field is None or required or field in shown)
+            self._templates[present] = template
+        return template
+
+_EMPLOYER_LAYOUT = _Layout("<b>🏢 XODIM KERAK ({})</b>", [
+    # Ism so'ralmaydi, shuning uchun idora umumiy yoziladi
+    "<b>🏢 Idora:</b> Ish beruvchi",
+    ("📍 Hudud", "hudud", True),
+    ("👷‍♂️ Kim kerak", "jinsi", True),
+    ("🔞 Yosh chegarasi", "yoshi", True),
+    ("📓 Talablar", "mahorat", True),
+    ("⏰ Ish vaqti", "vaqt", True),
+    ("ℹ️ Qo'shimcha", "qosimcha", True),
+    ("💰 Maosh", "maosh", True),
+])
+
+_WORKER_LAYOUT = _Layout("<b>👷‍♂️ ISH KERAK ({})</b>", [
+    ("👤 Ism", "fish", True),
+    ("📍 Hudud", "hudud", True),
+    ("🚻 Jinsi", "jinsi", True),
+    ("🆔 Yoshi", "yoshi", True),
+    ("🛠 Mutaxassisligi", "mahorat", True),
+    ("📌 Mas’uliyati", "masuliyat", False),
+    ("⏰ Ish vaqti", "vaqt", True),
+    ("🕒 Bo‘sh vaqt", "bosh_vaqt", False),
+    ("🧰 Qo‘shimcha", "qosimcha", False),
+    ("💰 Maosh", "maosh", True),
+])
 
+_PHONE_LINE = "\n<b>📞 Aloqa:</b> {}\n"
+_CODE_LINE = "\n🔎 <b>E’lon kodi:</b> {}"
+
+_HTML_SPECIAL = re.compile(r"[&<>]")
+
+def _escape(value) -> str:
+    value = str(value)
+    # Ko'p qiymatlarda maxsus belgi yo'q - html.escape ni chaqirmaymiz
+    return html.escape(value, quote=False) if _HTML_SPECIAL.search(value) else value
+
+def render_body(data: dict) -> str:
+    layout = _EMPLOYER_LAYOUT if data.get("role") == EMPLOYER_ROLE else _WORKER_LAYOUT
+    values, present = [], []
+    for field in layout.fields:
+        value = data.get(field)
+        if field in layout.optional:
+            present.append(bool(value))
+            if not value:
+                continue
+        values.append("N/A" if value is None else str(value))
+    # Maxsus belgilar bir marta, barcha qiymatlar bo'yicha tekshiriladi
+    if _HTML_SPECIAL.search("".join(values)):
+        values = [html.escape(v, quote=False) for v in values]
+    return layout.template(tuple(present)).format(*values)
+
+def ad_fields(data: dict) -> list[str]:
+    # E'lon matniga kiradigan foydalanuvchi qiymatlari (sarlavha va yorliqlarsiz)
+    layout = _EMPLOYER_LAYOUT if data.get("role") == EMPLOYER_ROLE else _WORKER_LAYOUT
+    return [str(data[field]) for field in dict.fromkeys(layout.fields) if data.get(field)]
+
+def create_ad_text(data: dict, include_code: bool = False, with_phone: bool = False,
+                   body: str | None = None) -> str:
+    text = body if body is not None else render_body(data)
+    if with_phone:
+        text += _PHONE_LINE.format(_escape(data.get('tel', 'N/A')))
+    if include_code:
+        text += _CODE_LINE.format(_escape(data.get('code', 'N/A')))
     return text
+
+def render_ad(data: dict, body: str | None = None) -> tuple[str, str]:
+    # Ommaviy (telefonsiz) va yashirin (telefonli) variantlar bitta body dan
+    if body is None:
+        body = render_body(data)
+    code_line = _CODE_LINE.format(_escape(data.get('code', 'N/A')))
+    public = body + code_line
+    hidden = body + _PHONE_LINE.format(_escape(data.get('tel', 'N/A'))) + code_line
+    return public, hidden
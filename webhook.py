@@ -0,0 +1,166 @@
+import os
+import hmac
+import signal
+import asyncio
+import logging
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Bo'sh bo'lsa setWebhook chaqirilmaydi (lokal test uchun)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Majburiy: busiz istalgan kishi soxta update (admin callback'lari ham) yubora oladi
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_MAX_INFLIGHT = int(os.getenv("WEBHOOK_MAX_INFLIGHT", 100))
+# Slot bo'shamasa shuncha kutib, 503 qaytaramiz (Telegram keyinroq qayta yuboradi)
+WEBHOOK_SLOT_TIMEOUT = float(os.getenv("WEBHOOK_SLOT_TIMEOUT", 5))
+WEBHOOK_SHUTDOWN_TIMEOUT = float(os.getenv("WEBHOOK_SHUTDOWN_TIMEOUT", 30))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def update_user_id(update: Update) -> int | None:
+    try:
+        user = getattr(update.event, "from_user", None)
+    except Exception:
+        return None
+    return user.id if user else None
+
+
+# Update'larni fonda ishlaydi: bir vaqtda ishlanayotganlar soni cheklangan,
+# bitta foydalanuvchining update'lari esa kelgan tartibda ishlanadi
+class OrderedDispatch:
+    def __init__(self, dp: Dispatcher, bot: Bot, max_inflight: int = WEBHOOK_MAX_INFLIGHT):
+        self.dp = dp
+        self.bot = bot
+        self._slots = asyncio.Semaphore(max_inflight)
+        self._tasks: set[asyncio.Task] = set()
+        self._last_task: dict[int, asyncio.Task] = {}
+        self.processed = 0
+
+    @property
+    def inflight(self) -> int:
+        return len(self._tasks)
+
+    async def acquire(self, timeout: float | None = None) -> bool:
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def submit(self, update: Update):
+        # Chaqirishdan oldin acquire() bilan slot olingan bo'lishi kerak
+        user_id = update_user_id(update)
+        previous = self._last_task.get(user_id) if user_id is not None else None
+        task = asyncio.create_task(self._process(update, previous))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if user_id is not None:
+            self._last_task[user_id] = task
+            task.add_done_callback(lambda t: self._last_task.pop(user_id, None)
+                                   if self._last_task.get(user_id) is t else None)
+
+    async def _process(self, update: Update, previous: asyncio.Task | None):
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logging.exception(f"Update {update.update_id} ishlanmadi: {e}")
+        finally:
+            self.processed += 1
+            self._slots.release()
+
+    async def drain(self, timeout: float | None = None):
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+
+
+class WebhookServer:
+    def __init__(self, dp: Dispatcher, bot: Bot, path: str = WEBHOOK_PATH,
+                 secret: str | None = WEBHOOK_SECRET, max_inflight: int = WEBHOOK_MAX_INFLIGHT):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.max_inflight = max_inflight
+        self.dispatch = OrderedDispatch(dp, bot, max_inflight)
+        self._closing = False
+        self._runner: web.AppRunner | None = None
+
+    def _check_secret(self, request: web.Request) -> bool:
+        if not self.secret:
+            return False
+        return hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not self._check_secret(request):
+            return web.Response(status=401)
+        if self._closing:
+            return web.Response(status=503)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logging.warning(f"Webhook: noto'g'ri update: {e}")
+            return web.Response(status=400)
+        if not await self.dispatch.acquire(WEBHOOK_SLOT_TIMEOUT):
+            logging.warning("Webhook: barcha slotlar band, 503 qaytarildi")
+            return web.Response(status=503)
+        # Telegramga darhol javob qaytaramiz, handler fonda ishlaydi
+        self.dispatch.submit(update)
+        return web.Response()
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def start(self, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT):
+        if not self.secret:
+            raise RuntimeError("Webhook rejimi WEBHOOK_SECRET siz ishga tushmaydi")
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        if WEBHOOK_URL:
+            await self.bot.set_webhook(
+                url=WEBHOOK_URL + self.path if not WEBHOOK_URL.endswith(self.path) else WEBHOOK_URL,
+                secret_token=self.secret,
+                allowed_updates=self.dp.resolve_used_update_types(),
+                max_connections=min(self.max_inflight, 100),
+            )
+        logging.info(f"Webhook {host}:{port}{self.path} da tinglanmoqda.")
+
+    async def stop(self):
+        # Yangi so'rovlarni qabul qilmaymiz, ishlayotganlarini tugatamiz
+        self._closing = True
+        if self.dispatch.inflight:
+            logging.info(f"Webhook: {self.dispatch.inflight} ta update tugashi kutilmoqda...")
+        await self.dispatch.drain(WEBHOOK_SHUTDOWN_TIMEOUT)
+        if self._runner:
+            await self._runner.cleanup()
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    server = WebhookServer(dp, bot)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    await server.start()
+    try:
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()